@@ -7,9 +7,23 @@ Maidel 2.2 エージェント群
 - ExecutorAgent: MCPツール実行
 """
 
-from .conversation import conversation_agent
-from .planner import planner_agent
-from .executor import executor_agent
+from typing import Any
+
+_AGENT_STAGES = {
+    "conversation_agent": "conversation",
+    "planner_agent": "planner",
+    "executor_agent": "executor",
+}
+
+
+def __getattr__(name: str) -> Any:
+    # Agents are built lazily (backend.agents.factory) on first access
+    if name in _AGENT_STAGES:
+        from .factory import get_agent
+
+        return get_agent(_AGENT_STAGES[name])
+    raise AttributeError(name)
+
 
 __all__ = [
     "conversation_agent",
@@ -4,15 +4,14 @@ ConversationAgent - 会話判定エージェント
 ユーザー入力を分析し、雑談とタスク依頼を判別する
 """
 
+from typing import Any, Dict
+
 from google.adk.agents import LlmAgent
 
+from backend.agents.factory import generate_content_config, get_agent
+
 
-# ConversationAgent実装
-conversation_agent = LlmAgent(
-    name="ConversationClassifier",
-    model="gemini-2.0-flash-exp",
-    description="ユーザーの入力を分析し、雑談とタスク依頼を適切に分類する",
-    instruction="""
+INSTRUCTION = """
 あなたは優秀なAI執事のメイド、「まいでる」です。
 ユーザーの入力を分析し、以下のように分類してください：
 
@@ -46,9 +45,26 @@ conversation_agent = LlmAgent(
 分類結果のみを単語で返してください: chat または task
 
 **重要**: 余計な文字・改行・記号は一切つけず、単語のみ出力してください。
-    """,
-    output_key="task_type"
-)
+"""
+
+
+def build(config: Dict[str, Any]) -> LlmAgent:
+    """ConversationAgent実装 (settings from backend.agents.factory)"""
+    return LlmAgent(
+        name="ConversationClassifier",
+        model=config["model"],
+        description="ユーザーの入力を分析し、雑談とタスク依頼を適切に分類する",
+        instruction=INSTRUCTION,
+        generate_content_config=generate_content_config(config),
+        output_key="task_type",
+    )
+
+
+def __getattr__(name: str) -> Any:
+    # conversation_agent is built lazily on first access
+    if name == "conversation_agent":
+        return get_agent("conversation")
+    raise AttributeError(name)
 
 
 def test_conversation_agent():
@@ -3,26 +3,25 @@ Executor: Deterministic task execution without MCP dependency.
 
 Provides:
 - simple_calculate: safe local math evaluator
-- executor_agent: LLM agent exposing simple_calculate as a tool
-- execution_manager: runs a 3-step plan (parse -> calculate -> format)
+- mcp_calculate / recall_memory / remember_memory: tools served by the MCP
+  servers in backend.tools.registry (started on first use)
+- executor_agent: LLM agent exposing these as tools
+- StepRunner: runs calculator steps as soon as their dependencies finish
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
+import asyncio
 import os
-from backend.tools.mcp_client import SimpleMCPClient
-import sys
-
-# Prefer official ADK MCPToolset if available
-try:
-    from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
-    from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
-    from mcp import StdioServerParameters
-    _HAVE_ADK_MCP = True
-except Exception:
-    _HAVE_ADK_MCP = False
+from backend.tools.registry import get_registry
+from backend.tracing import traced
+
 from google.adk.agents import LlmAgent
 
+from backend.agents.factory import generate_content_config, get_agent
+from backend.plan import STEP_REFERENCE, PlanStep
+
 
+@traced("tool simple_calculate")
 def simple_calculate(expression: str) -> dict:
     try:
         import re
@@ -38,196 +37,190 @@ def simple_calculate(expression: str) -> dict:
         return {"success": False, "error": f"計算エラー: {e}", "expression": expression}
 
 
+@traced("tool mcp_calculate")
 def mcp_calculate(expression: str) -> dict:
     try:
-        client = SimpleMCPClient()
-        result = client.calculate(expression)
-        return result
+        # The calculator server is kept warm between calls by the registry
+        with get_registry().client("calculator") as client:
+            return client.calculate(expression)
     except Exception as e:
         return {"success": False, "error": f"MCP計算エラー: {e}"}
 
 
+@traced("tool recall_memory")
+def recall_memory(query: str) -> dict:
+    try:
+        return get_registry().call_tool("recall", {"query": query})
+    except Exception as e:
+        return {"success": False, "error": f"MCP記憶エラー: {e}"}
+
+
+@traced("tool remember_memory")
+def remember_memory(content: str) -> dict:
+    try:
+        return get_registry().call_tool("remember", {"content": content})
+    except Exception as e:
+        return {"success": False, "error": f"MCP記憶エラー: {e}"}
+
+
+STEP_CONCURRENCY = int(os.getenv("MAIDEL_STEP_CONCURRENCY", "4"))
+
+
+def run_step(step: PlanStep, results: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Execute one plan step; steps without a calculator expression are no-ops."""
+    if step.tool != "calculator" or not step.expression:
+        return {"success": True}
+    expression = STEP_REFERENCE.sub(lambda m: str(results[int(m.group(1))].get("result", "")), step.expression)
+    use_mcp = os.getenv("USE_MCP", "true").lower() in ("1", "true", "yes")
+    result = mcp_calculate(expression) if use_mcp else simple_calculate(expression)
+    result.setdefault("expression", expression)
+    return result
+
+
+class StepRunner:
+    """Runs plan steps as soon as the steps they depend on have finished.
+
+    Steps may be added while the plan is still being generated. Tool calls
+    run on worker threads, at most ``concurrency`` at a time, so independent
+    steps overlap and a plan costs about its longest dependency chain.
+    join() waits for every step that can run and returns the results by
+    step_id; steps whose inputs never arrive are reported as failed.
+    """
+
+    def __init__(self, concurrency: int = STEP_CONCURRENCY) -> None:
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self._waiting: Dict[int, PlanStep] = {}
+        self._started: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+
+    def add(self, step: PlanStep) -> None:
+        if step.step_id in self._started or step.step_id in self._waiting:
+            return
+        self._waiting[step.step_id] = step
+        self._start_ready()
+
+    def _start_ready(self) -> None:
+        for step_id, step in list(self._waiting.items()):
+            if step.inputs() <= self.results.keys():
+                del self._waiting[step_id]
+                self._started.add(step_id)
+                task = asyncio.ensure_future(self._run(step))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, step: PlanStep) -> None:
+        failed = sorted(d for d in step.inputs() if not self.results[d].get("success"))
+        if failed:
+            result = {"success": False, "error": f"依存ステップ {failed} が失敗しました"}
+        else:
+            async with self._slots:
+                result = await asyncio.to_thread(run_step, step, self.results)
+        self.results[step.step_id] = result
+        self._start_ready()
+
+    async def join(self) -> Dict[int, Dict[str, Any]]:
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+        for step_id, step in sorted(self._waiting.items()):
+            missing = sorted(step.inputs() - self.results.keys())
+            self.results[step_id] = {"success": False, "error": f"依存ステップ {missing} が実行されませんでした"}
+        self._waiting.clear()
+        return self.results
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+
 USE_ADK_MCP_TOOLSET = os.getenv("USE_ADK_MCP_TOOLSET", "false").lower() in ("1", "true", "yes")
 
-executor_agent = LlmAgent(
-    name="TaskExecutor",
-    model="gemini-1.5-flash",
-    description="Execute steps and integrate results",
-    tools=([
-        # Expose MCP toolset directly to the agent (discover remote tools like "calculate")
+
+def _mcp_toolsets() -> List[Any]:
+    """One ADK MCPToolset per registry server (empty if unavailable).
+
+    Imported only when USE_ADK_MCP_TOOLSET is on; the MCP machinery pulls in
+    a large part of ADK (and FastAPI) that the default tools do not need.
+    Server commands and tool lists come from the registry; ADK manages the
+    sessions.
+    """
+    try:
+        from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
+        from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+        from mcp import StdioServerParameters
+    except Exception:
+        return []
+    return [
         MCPToolset(
             connection_params=StdioConnectionParams(
                 server_params=StdioServerParameters(
-                    command=sys.executable,
-                    args=["-m", "mcp_tools.calculator"],
-                    env={
-                        "PYTHONIOENCODING": "utf-8",
-                        # Ensure module resolution regardless of current working dir
-                        "PYTHONPATH": os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
-                    }
+                    command=spec.command[0],
+                    args=spec.command[1:],
+                    env=spec.process_env(),
                 )
-            )
+            ),
+            tool_filter=spec.tools or None,
         )
-    ] if (_HAVE_ADK_MCP and USE_ADK_MCP_TOOLSET) else []) + [
-        # Also expose explicit functions for robustness and local fallback
-        mcp_calculate,
-        simple_calculate,
-    ],
-    instruction="""
-与えられた execution_plan を順に実行し、必要に応じてツールを使って結果を取りまとめてください。
+        for spec in get_registry().specs.values()
+    ]
 
-ツールの使い方（厳守）:
-- 関数名: mcp_calculate または simple_calculate
-- 引数: {"expression": "<数式文字列>"} 以外は渡さない
-- 例: mcp_calculate(expression="2+3")
-出力は最終的に「[数式] = [結果]」の形式でまとめてください。
-""",
-    output_key="final_result",
-)
-
-
-class ExecutionManager:
-    def __init__(self) -> None:
-        pass
-
-    async def execute_plan(self, execution_plan: List[Dict[str, Any]], user_input: str) -> Dict[str, Any]:
-        if not execution_plan:
-            return {"success": True, "result": "", "steps_executed": 0}
-
-        step_results: Dict[int, Dict[str, Any]] = {}
-        current_expression = None
-
-        use_mcp = os.getenv("USE_MCP", "true").lower() in ("1", "true", "yes")
-
-        for step in execution_plan:
-            step_id = step.get("step_id")
-            tool = step.get("tool")
-
-            if step_id == 1:
-                current_expression = self._extract_expression(user_input)
-                step_results[step_id] = {"success": True, "expression": current_expression}
-
-            elif step_id == 2 and tool == "calculator":
-                if current_expression:
-                    calc_result = mcp_calculate(current_expression) if use_mcp else simple_calculate(current_expression)
-                    step_results[step_id] = calc_result
-                else:
-                    step_results[step_id] = {"success": False, "error": "数式が抽出できませんでした"}
-
-            elif step_id == 3:
-                calc_step = step_results.get(2, {})
-                if calc_step.get("success"):
-                    result_value = calc_step.get("result")
-                    formatted = f"{current_expression} = {result_value}\n\n計算が完了しました"
-                    step_results[step_id] = {"success": True, "result": formatted}
-                else:
-                    error_msg = calc_step.get("error", "不明なエラー")
-                    formatted = f"申し訳ございません、{error_msg}\n\nもう一度お試しください"
-                    step_results[step_id] = {"success": False, "result": formatted}
-
-        final_step = step_results.get(3, step_results.get(2, {}))
-        return {
-            "success": bool(final_step.get("success")),
-            "result": final_step.get("result", "実行に失敗しました"),
-            "steps_executed": len(step_results),
-            "step_details": step_results,
-        }
-
-    def _extract_expression(self, user_input: str) -> str:
-        import re
 
-        # 日本語での数学表現を英語記号に変換
-        converted = user_input
-        converted = re.sub(r"足し|足す|加え|プラス|たす", "+", converted)
-        converted = re.sub(r"引き|引く|減らし|マイナス|ひく", "-", converted)
-        converted = re.sub(r"掛け|掛ける|乗じ|乗ずる|かける", "*", converted)
-        converted = re.sub(r"割り|割る|除す|わる", "/", converted)
-        converted = re.sub(r"と", "+", converted)
-        converted = re.sub(r"を", "", converted)
-
-        # 数式パターンマッチング
-        patterns = [
-            r"([0-9]+\s*[+\-*/]\s*[0-9]+(?:\s*[+\-*/]\s*[0-9]+)*)",
-            r"([0-9+\-*/().\s]+[+\-*/][0-9+\-*/().\s]+)",
-            r"([a-zA-Z]+\([0-9+\-*/().,\s]+\))",
-        ]
-
-        for p in patterns:
-            m = re.findall(p, converted)
-            if m:
-                return m[0].strip()
-
-        # 数字を抽出してデフォルト演算
-        numbers = re.findall(r"\d+", user_input)
-        if len(numbers) >= 2:
-            if "足" in user_input or "たし" in user_input or "と" in user_input:
-                return f"{numbers[0]}+{numbers[1]}"
-            elif "引" in user_input or "ひき" in user_input:
-                return f"{numbers[0]}-{numbers[1]}"
-            elif "掛" in user_input or "かけ" in user_input:
-                return f"{numbers[0]}*{numbers[1]}"
-            elif "割" in user_input or "わり" in user_input:
-                return f"{numbers[0]}/{numbers[1]}"
-            else:
-                return f"{numbers[0]}+{numbers[1]}"  # デフォルトは足し算
-
-        return user_input
-
-
-execution_manager = ExecutionManager()
-
-
-# Rebuild executor_agent with dynamic tools/instruction based on env flags.
-try:
-    _use_toolset = os.getenv("USE_ADK_MCP_TOOLSET", "false").lower() in ("1", "true", "yes")
-    _dyn_tools: list = []
-    if _HAVE_ADK_MCP and _use_toolset:
-        _dyn_tools.append(
-            MCPToolset(
-                connection_params=StdioConnectionParams(
-                    server_params=StdioServerParameters(
-                        command=sys.executable,
-                        args=["-m", "mcp_tools.calculator"],
-                        env={
-                            "PYTHONIOENCODING": "utf-8",
-                            "PYTHONPATH": os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
-                        },
-                    )
-                )
-            )
-        )
-        _dyn_instr = (
-            """
+TOOLSET_INSTRUCTION = """
 与えられた execution_plan を順に実行し、必要に応じてツールを使って結果を取りまとめてください。
 
 ツールの使い方（厳守）:
 - ツール名: calculate（MCP）
 - 引数: {"expression": "<数式>"}
 
+以前の会話の事実が必要なときは recall({"query": "<検索内容>"})、
+覚えておくよう頼まれたときは remember({"content": "<内容>"}) を使ってください。
+
+計画の段階で実行済みのステップ結果（step_id -> 結果）: {step_results?}
+success のステップはツールを呼ばずにその結果を使ってください。
+
 最終出力は「[数式] = [結果]」形式でまとめ、**テキストのみで回答してください**。
 """
-        )
-    else:
-        _dyn_tools.extend([mcp_calculate, simple_calculate])
-        _dyn_instr = (
-            """
+
+FUNCTION_INSTRUCTION = """
 与えられた execution_plan を順に実行し、必要に応じてツールを使って結果を取りまとめてください。
 
 フォールバックの関数ツールを使う場合（厳守）:
 - 関数: mcp_calculate または simple_calculate
 - 引数: {"expression": "<数式>"}
 
+以前の会話の事実が必要なときは recall_memory({"query": "<検索内容>"})、
+覚えておくよう頼まれたときは remember_memory({"content": "<内容>"}) を使ってください。
+
+計画の段階で実行済みのステップ結果（step_id -> 結果）: {step_results?}
+success のステップはツールを呼ばずにその結果を使ってください。
+
 最終出力は「[数式] = [結果]」形式でまとめ、**テキストのみで回答してください**。
 """
-        )
 
-    executor_agent = LlmAgent(
+
+def build(config: Dict[str, Any]) -> LlmAgent:
+    """ExecutorAgent実装; tools/instruction depend on USE_ADK_MCP_TOOLSET."""
+    toolsets = _mcp_toolsets() if USE_ADK_MCP_TOOLSET else []
+    if toolsets:
+        # Expose the MCP servers directly to the agent (remote tools like "calculate" and "recall")
+        tools: list = toolsets
+        instruction = TOOLSET_INSTRUCTION
+    else:
+        tools = [mcp_calculate, simple_calculate, recall_memory, remember_memory]
+        instruction = FUNCTION_INSTRUCTION
+    return LlmAgent(
         name="TaskExecutor",
-        model="gemini-2.0-flash-exp",
+        model=config["model"],
         description="Execute steps and integrate results",
-        tools=_dyn_tools,
-        instruction=_dyn_instr,
+        tools=tools,
+        instruction=instruction,
+        generate_content_config=generate_content_config(config),
         output_key="final_result",
     )
-except Exception:
-    pass
+
+
+def __getattr__(name: str) -> Any:
+    # executor_agent is built lazily on first access
+    if name == "executor_agent":
+        return get_agent("executor")
+    raise AttributeError(name)
@@ -0,0 +1,113 @@
+"""
+Agent factory - ステージ別のモデル設定
+
+Each pipeline stage (conversation, planner, executor) reads its model,
+temperature and max output tokens from, in increasing precedence:
+
+1. DEFAULT_STAGE_CONFIG below
+2. config/agents_config.yaml (or .json), or the file named by
+   MAIDEL_AGENT_CONFIG
+3. env vars MAIDEL_<STAGE>_MODEL / _TEMPERATURE / _MAX_TOKENS,
+   e.g. MAIDEL_CONVERSATION_MODEL=gemini-2.0-flash-lite
+
+Agents are built on first use and then reused. The agent modules expose
+them lazily under their usual names (``conversation_agent`` etc.).
+"""
+
+import copy
+import importlib
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_CONFIG_PATH = os.path.join(PROJECT_ROOT, "config", "agents_config.yaml")
+
+DEFAULT_STAGE_CONFIG: Dict[str, Dict[str, Any]] = {
+    "conversation": {"model": "gemini-2.0-flash-exp", "temperature": 0.1, "max_tokens": 1000},
+    "planner": {"model": "gemini-2.0-flash-exp", "temperature": 0.3, "max_tokens": 2000},
+    "executor": {"model": "gemini-2.0-flash-exp", "temperature": 0.1, "max_tokens": None},
+}
+
+# stage -> module providing build(config) -> LlmAgent
+_BUILDERS = {
+    "conversation": "backend.agents.conversation",
+    "planner": "backend.agents.planner",
+    "executor": "backend.agents.executor",
+}
+
+_ENV_FIELDS = {"MODEL": ("model", str), "TEMPERATURE": ("temperature", float), "MAX_TOKENS": ("max_tokens", int)}
+
+_lock = threading.RLock()
+_agents: Dict[str, Any] = {}
+_config: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def _read_file(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            print(f"[Maidel] PyYAML not installed; ignoring {path}", file=sys.stderr)
+            return {}
+        return yaml.safe_load(f) or {}
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Merged per-stage settings (defaults < file < env)."""
+    config = copy.deepcopy(DEFAULT_STAGE_CONFIG)
+    path = path or os.getenv("MAIDEL_AGENT_CONFIG") or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        stages = (_read_file(path) or {}).get("agents") or {}
+        for stage, settings in stages.items():
+            if stage in config and isinstance(settings, dict):
+                config[stage].update(settings)
+    elif os.getenv("MAIDEL_AGENT_CONFIG"):
+        print(f"[Maidel] Agent config not found: {path}", file=sys.stderr)
+    for stage, settings in config.items():
+        for suffix, (key, cast) in _ENV_FIELDS.items():
+            value = os.getenv(f"MAIDEL_{stage.upper()}_{suffix}")
+            if value:
+                settings[key] = cast(value)
+    return config
+
+
+def stage_config(stage: str) -> Dict[str, Any]:
+    global _config
+    with _lock:
+        if _config is None:
+            _config = load_config()
+        return dict(_config[stage])
+
+
+def generate_content_config(settings: Dict[str, Any]) -> Optional[Any]:
+    """GenerateContentConfig for the stage's sampling settings (None if unset)."""
+    from google.genai import types
+
+    params = {}
+    if settings.get("temperature") is not None:
+        params["temperature"] = settings["temperature"]
+    if settings.get("max_tokens") is not None:
+        params["max_output_tokens"] = settings["max_tokens"]
+    return types.GenerateContentConfig(**params) if params else None
+
+
+def get_agent(stage: str) -> Any:
+    """The stage's LlmAgent, built once on first use."""
+    with _lock:
+        agent = _agents.get(stage)
+        if agent is None:
+            module = importlib.import_module(_BUILDERS[stage])
+            agent = _agents[stage] = module.build(stage_config(stage))
+        return agent
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """Configured settings per stage (for metrics and benchmarks)."""
+    with _lock:
+        return {stage: stage_config(stage) for stage in _BUILDERS}
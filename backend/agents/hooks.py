@@ -0,0 +1,27 @@
+"""
+Helpers for attaching ADK callbacks to the module-level agents.
+
+ADK accepts either a single callback or a list per callback field; these
+helpers append so that independent features (history window, tracing, ...)
+can each register their own hook. ADK stops at the first callback that
+returns a value, so observers that must always run register with
+``first=True``.
+"""
+
+from typing import Any, Callable
+
+
+def add_callback(agent: Any, field: str, callback: Callable[..., Any], first: bool = False) -> None:
+    """Append (or with ``first``, prepend) ``callback`` to ``agent.<field>``."""
+    existing = getattr(agent, field, None)
+    if existing is None:
+        callbacks = [callback]
+    elif isinstance(existing, list):
+        if callback in existing:
+            return
+        callbacks = [callback] + existing if first else existing + [callback]
+    else:
+        if existing is callback:
+            return
+        callbacks = [callback, existing] if first else [existing, callback]
+    setattr(agent, field, callbacks)
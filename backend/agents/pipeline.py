@@ -0,0 +1,122 @@
+"""
+PlanningPipeline - 計画生成と実行のオーバーラップ
+
+SequentialAgent for the Conversation -> Planner -> Executor pipeline. The
+planner's model output is streamed (SSE) and fed through PlanStreamParser.
+Each step goes to a StepRunner as soon as its JSON object closes, so
+calculator steps whose dependencies are done run while the planner is still
+writing the rest of the plan. Their results are handed to the executor as
+``step_results`` and it only has to put the answer together.
+
+MAIDEL_PLAN_STREAMING=false runs the planner unstreamed, as before.
+The executor, which writes the answer, is streamed too so clients can show
+the answer as it is generated (MAIDEL_ANSWER_STREAMING=false to disable).
+"""
+
+import json
+import os
+import sys
+import time
+from typing import AsyncGenerator, Dict, List
+
+from google.adk.agents import BaseAgent, RunConfig, SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import StreamingMode
+from google.adk.events import Event, EventActions
+
+from backend.agents.executor import StepRunner
+from backend.metrics import metrics
+from backend.plan import PlanError, PlanStreamParser, parse_plan
+
+
+PLAN_STREAMING = os.getenv("MAIDEL_PLAN_STREAMING", "true").lower() in ("1", "true", "yes")
+ANSWER_STREAMING = os.getenv("MAIDEL_ANSWER_STREAMING", "true").lower() in ("1", "true", "yes")
+
+
+def _sse(ctx: InvocationContext) -> InvocationContext:
+    """The same invocation with the model output streamed."""
+    run_config = (ctx.run_config or RunConfig()).model_copy(update={"streaming_mode": StreamingMode.SSE})
+    return ctx.model_copy(update={"run_config": run_config})
+
+
+def _event_text(event: Event) -> str:
+    parts = event.content.parts if event.content and event.content.parts else []
+    return "".join(p.text for p in parts if p.text and not p.thought)
+
+
+class PlanningPipeline(SequentialAgent):
+    """Classifier, planner and executor with plan steps started during planning."""
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        classifier, planner, *rest = self.sub_agents
+        async for event in classifier.run_async(ctx):
+            yield event
+        async for event in self._plan(planner, ctx):
+            yield event
+        async for event in self._answer(rest, ctx):
+            yield event
+
+    async def _answer(self, agents: List[BaseAgent], ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Run the remaining agents; partial events carry the answer as it is written."""
+        answer_ctx = _sse(ctx) if ANSWER_STREAMING else ctx
+        for agent in agents:
+            async for event in agent.run_async(answer_ctx):
+                yield event
+
+    def _results_event(self, ctx: InvocationContext, results: Dict[int, Dict]) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={"step_results": json.dumps(results, ensure_ascii=False)}),
+        )
+
+    async def _plan(self, planner: BaseAgent, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Run the planner, executing plan steps as they are generated."""
+        if not PLAN_STREAMING:
+            async for event in planner.run_async(ctx):
+                yield event
+            yield self._results_event(ctx, {})
+            return
+
+        stream_ctx = _sse(ctx)
+        parser = PlanStreamParser()
+        runner = StepRunner()
+        final_plan = None
+        plan_error = None
+        streamed = 0
+        try:
+            async for event in planner.run_async(stream_ctx):
+                if event.partial:
+                    # Chunks are for the parser only; the aggregated event follows
+                    for step in parser.feed(_event_text(event)):
+                        runner.add(step)
+                        streamed += 1
+                    continue
+                delta = event.actions.state_delta if event.actions else {}
+                if planner.output_key in delta:
+                    final_plan = delta[planner.output_key]
+                    plan_error = delta.get("plan_error")
+                yield event
+
+            planned_at = time.perf_counter()
+            try:
+                plan = parse_plan(final_plan)
+            except PlanError:
+                plan = None
+            if plan is None or plan_error:
+                # Invalid plans are reported by main; discard what already ran
+                runner.cancel()
+                results: Dict[int, Dict] = {}
+            else:
+                # Steps the stream did not surface (unstreamed or replayed models)
+                for step in plan.steps:
+                    runner.add(step)
+                results = await runner.join()
+                metrics.histogram("plan_steps_wait_ms").observe((time.perf_counter() - planned_at) * 1000)
+            metrics.counter("plan_steps_streamed").inc(streamed)
+            if streamed:
+                print(f"[Maidel] {streamed} plan step(s) dispatched during planning", file=sys.stderr)
+            yield self._results_event(ctx, results)
+        finally:
+            runner.cancel()
@@ -4,125 +4,82 @@ PlannerAgent - 実行計画エージェント
 タスクの実行計画を策定し、ステップ分解を行う
 """
 
+from typing import Any, Dict
+
 from google.adk.agents import LlmAgent
 
+from backend.agents.factory import generate_content_config, get_agent
+from backend.plan import ExecutionPlan, validate_plan_callback
+
 
-planner_agent = LlmAgent(
-    name="TaskPlanner",
-    model="gemini-2.0-flash-exp",
-    description="タスクを実行可能なステップに分解し、詳細な実行計画を策定する",
-    instruction="""
+INSTRUCTION = """
 あなたは経験豊富なプロジェクトマネージャーのメイド、「まいでる」です。
-前のエージェントからの task_type 情報に基づいて、適切な実行計画を作成してください。
+前のエージェントからの task_type 情報に基づいて、実行計画を JSON で作成してください。
+
+## 出力形式（スキーマ厳守）
+
+{"steps": [{"step_id": 1, "name": "<短い名前>", "tool": "calculator" または null,
+            "expression": "<calculator に渡す数式>" または null, "dependencies": [<先行 step_id>]}]}
+
+- 説明文・所要時間・期待出力などのフィールドは出力しない
+- name は 10 文字程度の短い名前にする
 
 ## 計算・数値処理タスクの場合
 
-タスクの複雑さに応じて最適なステップ数で実行計画を作成してください。
-
-**簡単な計算（例：2+3、100-50など）**:
-```json
-[
-    {
-        "step_id": 1,
-        "name": "直接計算",
-        "description": "数式を直接計算して結果を返す",
-        "tool": "calculator",
-        "estimated_time": "1秒未満",
-        "dependencies": [],
-        "expected_output": "計算結果と整形済みメッセージ"
-    }
-]
-```
-
-**複雑な計算や複数ステップが必要な場合**:
-```json
-[
-    {
-        "step_id": 1,
-        "name": "入力解析",
-        "description": "数式や条件を詳細に分析",
-        "tool": null,
-        "estimated_time": "1-2秒",
-        "dependencies": [],
-        "expected_output": "解析結果"
-    },
-    {
-        "step_id": 2,
-        "name": "計算実行",
-        "description": "必要な計算を実行",
-        "tool": "calculator",
-        "estimated_time": "1秒未満",
-        "dependencies": [1],
-        "expected_output": "計算結果"
-    }
-]
-```
+**簡単な計算（例：2+3、100-50など）**: 1 ステップ
+{"steps": [{"step_id": 1, "name": "直接計算", "tool": "calculator", "expression": "2+3", "dependencies": []}]}
+
+**複雑な計算や複数ステップが必要な場合**: 独立した計算は dependencies を空にして並列に実行できるようにする
+{"steps": [
+  {"step_id": 1, "name": "小計A", "tool": "calculator", "expression": "12+8", "dependencies": []},
+  {"step_id": 2, "name": "小計B", "tool": "calculator", "expression": "3*4", "dependencies": []},
+  {"step_id": 3, "name": "合計", "tool": "calculator", "expression": "{1}*{2}", "dependencies": [1, 2]}
+]}
 
 ## 雑談・一般的な会話の場合
 
-空配列を返してください: `[]`
+{"steps": []}
 
 ## 計画策定の原則
 
 1. **効率性**: 不要なステップは作らず、最小限で実行可能にする
-2. **適応性**: タスクの複雑さに応じてステップ数を調整する
-3. **明確性**: 各ステップは具体的で実行可能である
-4. **依存関係**: 必要な場合のみ dependencies を設定
-5. **ツール活用**: 利用可能なツール: "calculator"
-6. **時間効率**: 現実的で効率的な実行時間を設定
-
-## 判断基準
+2. **依存関係**: 必要な場合のみ dependencies を設定（存在する step_id のみ参照）。
+   expression 中の {1}, {2} などは同じ番号の先行ステップの計算結果に置き換えられる
+3. **ツール活用**: 利用可能なツール: "calculator"
+"""
 
-**1ステップで十分な場合**:
-- 単純な四則演算（例：2+3、100*5、50/10）
-- 基本的な数学関数（例：sin(0)、sqrt(16)）
-- 明確な数式が与えられている
 
-**複数ステップが必要な場合**:
-- 複雑な条件や多段階計算
-- 数式の前処理が必要
-- 特殊な入力形式の解析が必要
+def build(config: Dict[str, Any]) -> LlmAgent:
+    """PlannerAgent実装 (settings from backend.agents.factory)"""
+    return LlmAgent(
+        name="TaskPlanner",
+        model=config["model"],
+        description="タスクを実行可能なステップに分解し、詳細な実行計画を策定する",
+        instruction=INSTRUCTION,
+        generate_content_config=generate_content_config(config),
+        # Schema-enforced JSON; invalid output is recorded, never silently dropped
+        output_schema=ExecutionPlan,
+        after_model_callback=[validate_plan_callback],
+        output_key="execution_plan",
+    )
 
-## 出力形式
 
-計画のJSONのみを出力し、説明文は不要です。
-シンプルな計算ほど少ないステップ数を選択してください。
-    """,
-    output_key="execution_plan"
-)
+def __getattr__(name: str) -> Any:
+    # planner_agent is built lazily on first access
+    if name == "planner_agent":
+        return get_agent("planner")
+    raise AttributeError(name)
 
 
 def get_sample_execution_plan():
     """サンプル実行計画"""
-    return [
-        {
-            "step_id": 1,
-            "name": "入力解析",
-            "description": "ユーザーの計算要求を詳細に分析し、必要なパラメータを抽出",
-            "tool": None,
-            "estimated_time": "1-2秒",
-            "dependencies": [],
-            "expected_output": "数式の抽出と前処理"
-        },
-        {
-            "step_id": 2,
-            "name": "計算実行",
-            "description": "抽出した数式を使用して数値計算を実行",
-            "tool": "calculator",
-            "estimated_time": "1秒未満",
-            "dependencies": [1],
-            "expected_output": "計算結果"
-        },
-        {
-            "step_id": 3,
-            "name": "結果整形",
-            "description": "計算結果をユーザーにわかりやすい形式で整形して表示",
-            "tool": None,
-            "estimated_time": "1秒未満",
-            "dependencies": [2],
-            "expected_output": "整形済み結果メッセージ"
-        }
-    ]
+    return {
+        "steps": [
+            {"step_id": 1, "name": "小計A", "tool": "calculator", "expression": "12+8", "dependencies": []},
+            {"step_id": 2, "name": "小計B", "tool": "calculator", "expression": "3*4", "dependencies": []},
+            {"step_id": 3, "name": "合計", "tool": "calculator", "expression": "{1}*{2}", "dependencies": [1, 2]},
+        ]
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""
+SpeculativePipeline - 分類と計画の投機的並列実行
+
+PlanningPipeline variant for the Conversation -> Planner -> Executor
+pipeline. When a message looks like a task (cheap prior), planning starts
+concurrently with classification. The planner's events are held back until
+the classifier has answered:
+
+- task: the buffered plan is released and the executor runs, so the
+  planner's latency is off the critical path.
+- chat: the speculative plan is cancelled or discarded and replaced with
+  the empty plan the planner returns for chat.
+
+Wasted work is counted in the ``speculative_*`` metrics.
+"""
+
+import asyncio
+import sys
+import time
+from typing import AsyncGenerator, List
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from backend.agents.pipeline import PlanningPipeline
+from backend.metrics import metrics
+from backend.plan import EMPTY_PLAN_JSON
+from backend.scheduler import guess_class
+
+
+def _user_text(ctx: InvocationContext) -> str:
+    content = ctx.user_content
+    parts = getattr(content, "parts", None) or []
+    return "".join(p.text for p in parts if getattr(p, "text", None))
+
+
+def _output_tokens(events: List[Event]) -> int:
+    return sum(
+        (getattr(e.usage_metadata, "candidates_token_count", None) or 0) for e in events if e.usage_metadata
+    )
+
+
+class SpeculativePipeline(PlanningPipeline):
+    """Classifier, planner and executor with optional speculative planning."""
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        classifier, planner, *rest = self.sub_agents
+        if guess_class(_user_text(ctx)) != "task":
+            async for event in super()._run_async_impl(ctx):
+                yield event
+            return
+
+        metrics.counter("speculative_plans").inc()
+        planned: List[Event] = []
+        started = time.perf_counter()
+        finished: List[float] = []
+
+        async def plan() -> None:
+            try:
+                async for event in self._plan(planner, ctx):
+                    planned.append(event)
+            finally:
+                finished.append(time.perf_counter())
+
+        planning = asyncio.ensure_future(plan())
+        try:
+            async for event in classifier.run_async(ctx):
+                yield event
+
+            task_type = str(ctx.session.state.get("task_type", "")).strip().lower()
+            if task_type == "task":
+                await planning
+                metrics.counter("speculative_hits").inc()
+                for event in planned:
+                    yield event
+            else:
+                # Planner time spent, up to now if it is still running
+                wasted_ms = ((finished[0] if finished else time.perf_counter()) - started) * 1000
+                if not planning.done():
+                    planning.cancel()
+                elif not planning.cancelled() and planning.exception() is not None:
+                    print(f"[Maidel] Speculative plan failed: {planning.exception()}", file=sys.stderr)
+                metrics.counter("speculative_wasted").inc()
+                metrics.histogram("speculative_wasted_ms").observe(wasted_ms)
+                metrics.counter("speculative_wasted_tokens").inc(_output_tokens(planned))
+                print(f"[Maidel] Speculative plan discarded ({task_type or 'unknown'}, {wasted_ms:.0f} ms)", file=sys.stderr)
+                yield Event(
+                    invocation_id=ctx.invocation_id,
+                    author=planner.name,
+                    branch=ctx.branch,
+                    content=types.Content(role="model", parts=[types.Part(text=EMPTY_PLAN_JSON)]),
+                    actions=EventActions(state_delta={planner.output_key: {"steps": []}, "plan_error": None, "step_results": "{}"}),
+                )
+        finally:
+            if not planning.done():
+                planning.cancel()
+
+        async for event in self._answer(rest, ctx):
+            yield event
@@ -0,0 +1,240 @@
+"""
+Batch/offline mode: process a JSONL file of messages concurrently.
+
+    python -m backend.main --batch input.jsonl --out results.jsonl
+
+Input is streamed lazily, messages run with bounded concurrency behind a
+requests-per-minute limiter, and results are appended incrementally in input
+or completion order. After each result is written, its index and the output
+size are appended to a checkpoint file. An interrupted run resumes where it
+stopped: the output is first cut back to the last checkpointed size, so a
+result written just before a crash is neither lost nor duplicated. Records
+without a message are reported as failed without running the pipeline. A
+throughput and error summary is printed at the end.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+class RateLimiter:
+    """Token bucket allowing ``per_minute`` acquisitions per minute."""
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, int(per_minute // 60) or 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def iter_input(path: str, field: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (index, record) lazily; plain-text lines become {field: line}.
+
+    Blank lines are skipped and not counted, so indices stay dense.
+    """
+    with open(path, encoding="utf-8") as f:
+        index = -1
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            index += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {field: line}
+            if not isinstance(record, dict):
+                record = {field: str(record)}
+            yield index, record
+
+
+def load_checkpoint(path: str) -> Tuple[Set[int], Optional[int]]:
+    """Written indices and the output size after the last of them.
+
+    Lines are "<index> <output bytes>"; the first line of a new checkpoint
+    has index -1 and the output size before the run. A last line cut short
+    by a crash is removed from the file so that appends start on a fresh
+    line. The size is None for checkpoints that only list indices.
+    """
+    done: Set[int] = set()
+    size: Optional[int] = None
+    complete = 0
+    try:
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                complete += len(raw)
+                parts = raw.split()
+                try:
+                    index = int(parts[0])
+                    size = int(parts[1]) if len(parts) > 1 else size
+                except (IndexError, ValueError):
+                    continue
+                if index >= 0:
+                    done.add(index)
+    except FileNotFoundError:
+        return done, size
+    truncate_output(path, complete)
+    return done, size
+
+
+def truncate_output(path: str, size: Optional[int]) -> None:
+    """Cut ``path`` back to ``size`` bytes, dropping what a crash left unrecorded."""
+    if size is None:
+        return
+    try:
+        with open(path, "r+b") as f:
+            if f.seek(0, 2) > size:
+                f.truncate(size)
+                print(f"[Batch] Dropped unrecorded output past {size} bytes of {path}", file=sys.stderr)
+    except FileNotFoundError:
+        pass
+
+
+async def run_batch(
+    maidel: Any,
+    input_path: str,
+    out_path: str,
+    concurrency: int = 4,
+    rpm: float = 0.0,
+    order: str = "input",
+    checkpoint_path: Optional[str] = None,
+    field: str = "message",
+) -> Dict[str, Any]:
+    checkpoint_path = checkpoint_path or out_path + ".ckpt"
+    done, size = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"[Batch] Resuming: {len(done)} already written", file=sys.stderr)
+    truncate_output(out_path, size)
+
+    limiter = RateLimiter(rpm) if rpm > 0 else None
+    slots = asyncio.Semaphore(concurrency)
+    # Binary so that tell() is the byte size recorded in the checkpoint
+    out = open(out_path, "ab")
+    ckpt = open(checkpoint_path, "a", encoding="utf-8")
+    if size is None:
+        ckpt.write(f"-1 {out.tell()}\n")
+        ckpt.flush()
+
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    processed = 0
+    # Ordered mode: results waiting for earlier indices
+    buffered: Dict[int, Dict[str, Any]] = {}
+    next_index = 0
+    total = 0
+
+    def write(result: Dict[str, Any]) -> None:
+        # Output first, then the checkpoint; resume cuts off anything unrecorded
+        out.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+        out.flush()
+        ckpt.write(f"{result['index']} {out.tell()}\n")
+        ckpt.flush()
+
+    def drain() -> None:
+        # Write buffered results once every earlier input index is written
+        nonlocal next_index
+        while True:
+            while next_index in done:
+                next_index += 1
+            result = buffered.pop(next_index, None)
+            if result is None:
+                return
+            write(result)
+            done.add(next_index)
+            slots.release()
+
+    async def process(index: int, record: Dict[str, Any]) -> None:
+        nonlocal processed
+        message = record.get(field) or record.get("message")
+        started = time.perf_counter()
+        if not isinstance(message, str) or not message.strip():
+            response = {
+                "success": False,
+                "message": message,
+                "error": f"入力に '{field}' がありません",
+                "error_type": "missing_input",
+            }
+        else:
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                response = await maidel.process_message(
+                    message,
+                    include=record.get("include"),
+                    conversation_id=record.get("conversation_id"),
+                    priority=record.get("priority"),
+                )
+            except Exception as e:
+                response = {"success": False, "message": message, "error": str(e), "error_type": "batch_error"}
+        elapsed = (time.perf_counter() - started) * 1000
+        latencies.append(elapsed)
+        processed += 1
+        if not response.get("success"):
+            errors[response.get("error_type") or "unsuccessful"] += 1
+        result = {
+            "index": index,
+            "id": record.get("id") or record.get("request_id"),
+            "elapsed_ms": round(elapsed, 3),
+            "response": response,
+        }
+        if order == "input":
+            buffered[index] = result
+            drain()
+        else:
+            write(result)
+            done.add(index)
+            slots.release()
+
+    started = time.perf_counter()
+    tasks = []
+    try:
+        for index, record in iter_input(input_path, field):
+            total += 1
+            if index in done:
+                continue
+            # In input order a slot is held until the result is written, which
+            # also bounds the out-of-order buffer to ``concurrency`` entries.
+            await slots.acquire()
+            tasks.append(asyncio.create_task(process(index, record)))
+            tasks = [t for t in tasks if not t.done()]
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        out.close()
+        ckpt.close()
+
+    wall = time.perf_counter() - started
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3) if ordered else 0.0
+
+    summary = {
+        "processed": processed,
+        "skipped_from_checkpoint": total - processed,
+        "errors": sum(errors.values()),
+        "error_types": dict(errors),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(processed / wall, 3) if wall else 0.0,
+        "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "max": round(ordered[-1], 3) if ordered else 0.0},
+    }
+    print(f"[Batch] Summary: {json.dumps(summary, ensure_ascii=False)}", file=sys.stderr)
+    return summary
@@ -0,0 +1,193 @@
+"""
+Record/replay of LLM and MCP traffic.
+
+In record mode every LLM request/response (with per-chunk timing) and every
+MCP JSON-RPC exchange is appended to a JSONL cassette. In replay mode the
+same traffic is served back deterministically without network or MCP
+processes, either instantly or at the recorded speed scaled by a factor.
+
+Entries are matched by a hash of the normalized request (random ids
+stripped); on a miss the next unconsumed entry of the same stage is used so
+a slightly different prompt still replays in recorded order.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from pydantic import PrivateAttr
+
+from backend.metrics import metrics
+
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Keys whose values are random per run and must not affect matching
+_VOLATILE_KEYS = {"id", "_meta"}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items()) if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_key(kind: str, stage: str, payload: Any) -> str:
+    data = json.dumps(_normalize(payload), ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(f"{kind}|{stage}|{data}".encode("utf-8")).hexdigest()[:32]
+
+
+def llm_request_payload(llm_request: LlmRequest) -> Dict[str, Any]:
+    config = llm_request.config
+    return {
+        "contents": [c.model_dump(mode="json", exclude_none=True) for c in llm_request.contents or []],
+        "system_instruction": str(getattr(config, "system_instruction", None) or ""),
+    }
+
+
+class Cassette:
+    """JSONL store of recorded exchanges."""
+
+    def __init__(self, path: str, mode: str, speed: float = 0.0) -> None:
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        # Replay delay multiplier: 0 = instant, 1.0 = recorded timing
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._by_stage: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._file = None
+        if mode == REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry["_used"] = False
+                self._by_key[entry["key"]].append(entry)
+                self._by_stage[f"{entry['kind']}|{entry['stage']}"].append(entry)
+        print(f"[Maidel] Cassette loaded: {sum(len(q) for q in self._by_key.values())} entries", file=sys.stderr)
+
+    def record(self, kind: str, stage: str, key: str, request: Any, responses: List[Any], offsets_ms: List[float]) -> None:
+        entry = {
+            "kind": kind,
+            "stage": stage,
+            "key": key,
+            "recorded_at": time.time(),
+            "request": request,
+            "responses": responses,
+            "offsets_ms": [round(o, 3) for o in offsets_ms],
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+
+    def take(self, kind: str, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """Next unconsumed entry for ``key`` (or, failing that, for the stage)."""
+        with self._lock:
+            for queue, hit in ((self._by_key.get(key), True), (self._by_stage.get(f"{kind}|{stage}"), False)):
+                while queue:
+                    entry = queue.popleft()
+                    if not entry["_used"]:
+                        entry["_used"] = True
+                        metrics.counter("cassette_hits" if hit else "cassette_fallbacks").inc()
+                        return entry
+        metrics.counter("cassette_misses").inc()
+        return None
+
+    def delays(self, entry: Dict[str, Any]) -> List[float]:
+        """Seconds to wait before each recorded response chunk."""
+        previous = 0.0
+        waits = []
+        for offset in entry.get("offsets_ms") or []:
+            waits.append(max(0.0, offset - previous) * self.speed / 1000)
+            previous = offset
+        return waits
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CassetteLlm(BaseLlm):
+    """Wraps an agent's model to record or replay its traffic."""
+
+    stage: str
+    inner: Optional[BaseLlm] = None
+    _cassette: Cassette = PrivateAttr()
+
+    def __init__(self, cassette: Cassette, **data: Any) -> None:
+        super().__init__(**data)
+        self._cassette = cassette
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        payload = llm_request_payload(llm_request)
+        key = request_key("llm", self.stage, payload)
+        cassette = self._cassette
+
+        if cassette.mode == REPLAY:
+            entry = cassette.take("llm", self.stage, key)
+            if entry is None:
+                raise RuntimeError(f"cassette has no LLM response for {self.stage}")
+            for wait, raw in zip(cassette.delays(entry), entry["responses"]):
+                if wait:
+                    await asyncio.sleep(wait)
+                yield LlmResponse.model_validate(raw)
+            return
+
+        started = time.perf_counter()
+        responses: List[Any] = []
+        offsets: List[float] = []
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            offsets.append((time.perf_counter() - started) * 1000)
+            responses.append(response.model_dump(mode="json", exclude_none=True))
+            yield response
+        cassette.record("llm", self.stage, key, payload, responses, offsets)
+
+
+_active: Optional[Cassette] = None
+
+
+def active_cassette() -> Optional[Cassette]:
+    """Cassette consulted by the MCP client (None when not recording/replaying)."""
+    return _active
+
+
+def install(cassette: Cassette, agents: List[Any]) -> None:
+    """Wrap each agent's model and route MCP traffic through ``cassette``."""
+    global _active
+    _active = cassette
+    for agent in agents:
+        inner = agent.model
+        if isinstance(inner, CassetteLlm):
+            inner = inner.inner or inner.model
+        name = inner if isinstance(inner, str) else inner.model
+        if cassette.mode == RECORD and isinstance(inner, str):
+            inner = agent.canonical_model
+        agent.model = CassetteLlm(
+            cassette,
+            model=name,
+            stage=agent.name,
+            inner=inner if cassette.mode == RECORD else None,
+        )
@@ -0,0 +1,238 @@
+"""
+Similarity cache for small-talk responses.
+
+Paraphrased greetings ("こんにちは！", "こんにちは〜", "こんにちはー") get the
+same answer, so a chat turn whose message is close enough to an earlier chat
+turn is answered from this cache without running the pipeline.
+
+Messages are normalized (NFKC, case, katakana, punctuation and repeated
+characters folded) and split into character bigrams. A MinHash signature
+over the bigrams is indexed with LSH banding, which yields candidates in
+constant time. Each candidate is then checked with the exact Jaccard
+similarity of its bigram set against MAIDEL_CHAT_CACHE_THRESHOLD.
+
+Only turns the classifier labelled ``chat`` with an empty plan are stored.
+Entries are scoped by conversation id, so a reply that depends on one
+conversation's history ("私の名前は？") is never served to another; turns
+without a conversation id have no history and share one scope. Task-like
+messages (scheduler.guess_class) are never looked up, and a hit requires
+the same digits in both messages ("3時" is not "4時"). The deterministic
+calculator results therefore never come from here. A sample of hits
+(MAIDEL_CHAT_CACHE_AUDIT_RATE) is re-run through the pipeline in the
+background. A hit the classifier would not call chat counts as a false hit
+and its entry is dropped. Both rates appear in ``stats()``.
+"""
+
+import copy
+import os
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, FrozenSet, Hashable, Optional, Set, Tuple
+
+from backend.metrics import metrics
+from backend.scheduler import guess_class
+
+
+THRESHOLD = float(os.getenv("MAIDEL_CHAT_CACHE_THRESHOLD", "0.8"))
+CAPACITY = int(os.getenv("MAIDEL_CHAT_CACHE_SIZE", "512"))
+TTL_SECONDS = float(os.getenv("MAIDEL_CHAT_CACHE_TTL", str(24 * 3600)))
+AUDIT_RATE = float(os.getenv("MAIDEL_CHAT_CACHE_AUDIT_RATE", "0.05"))
+
+# Longer messages are rarely repeated small talk
+MAX_MESSAGE_CHARS = 40
+SHINGLE_SIZE = 2
+# 16 bands x 4 rows: pairs at Jaccard 0.8 become candidates with p > 0.999
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+SAMPLE_SIZE = 20
+
+_PRIME = (1 << 61) - 1
+# Fixed coefficients so signatures are stable across processes
+_PERMUTATIONS = [
+    ((i * 0x9E3779B97F4A7C15 + 0x2545F491) % _PRIME | 1, (i * 0xC2B2AE3D27D4EB4F + 0x165667B1) % _PRIME)
+    for i in range(1, NUM_PERM + 1)
+]
+_NOT_WORD = re.compile(r"[\W_]+")
+_REPEATS = re.compile(r"(.)\1+")
+_DIGITS = re.compile(r"\d+")
+# Katakana -> hiragana ("コンニチハ" is "こんにちは")
+_KATAKANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+# Response fields replayed on a hit
+_CACHED_FIELDS = ("success", "task_type", "execution_plan", "result", "plan")
+
+
+def normalize(message: str) -> str:
+    """Fold width, case, kana, punctuation, repeated characters and trailing 'ー'."""
+    text = _NOT_WORD.sub("", unicodedata.normalize("NFKC", message or "").casefold().translate(_KATAKANA))
+    return _REPEATS.sub(r"\1", text).rstrip("ー")
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    padded = f"^{text}$"
+    return frozenset(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+
+
+def signature(grams: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class _Entry:
+    __slots__ = ("id", "scope", "message", "text", "grams", "digits", "bands", "response", "stored_at", "hits")
+
+    def __init__(self, entry_id: int, scope: Hashable, message: str, text: str, response: Dict[str, Any]) -> None:
+        self.id = entry_id
+        self.scope = scope
+        self.message = message
+        self.text = text
+        self.grams = shingles(text)
+        self.digits = _DIGITS.findall(text)
+        sig = signature(self.grams)
+        self.bands = [(scope, band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+        self.response = response
+        self.stored_at = time.monotonic()
+        self.hits = 0
+
+
+class ChatCache:
+    """LRU of chat responses indexed by MinHash LSH over message bigrams."""
+
+    def __init__(
+        self,
+        threshold: float = THRESHOLD,
+        capacity: int = CAPACITY,
+        ttl: float = TTL_SECONDS,
+        audit_rate: float = AUDIT_RATE,
+    ) -> None:
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.audit_rate = audit_rate
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_text: Dict[Tuple[Hashable, str], int] = {}
+        self._buckets: Dict[Tuple[Hashable, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._samples: Deque[Dict[str, Any]] = deque(maxlen=SAMPLE_SIZE)
+
+    @staticmethod
+    def eligible(message: str) -> bool:
+        """Short messages without task hints (calculations are never cached)."""
+        text = normalize(message)
+        return 0 < len(text) <= MAX_MESSAGE_CHARS and guess_class(message) == "chat"
+
+    def lookup(self, message: str, scope: Hashable = None) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """(response copy, match info) for the most similar fresh entry of ``scope``, or None."""
+        if not self.eligible(message):
+            return None
+        text = normalize(message)
+        grams = shingles(text)
+        digits = _DIGITS.findall(text)
+        best: Optional[_Entry] = None
+        best_similarity = 0.0
+        exact = self._by_text.get((scope, text))
+        if exact is not None:
+            best, best_similarity = self._entries[exact], 1.0
+        else:
+            sig = signature(grams)
+            candidates: Set[int] = set()
+            for band in range(BANDS):
+                candidates |= self._buckets.get((scope, band, sig[band * ROWS:(band + 1) * ROWS]), set())
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.digits != digits:
+                    continue
+                similarity = jaccard(grams, entry.grams)
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+        if best is not None and time.monotonic() - best.stored_at > self.ttl:
+            self._remove(best.id)
+            best = None
+        if best is None or best_similarity < self.threshold:
+            metrics.counter("chat_cache_misses").inc()
+            return None
+        best.hits += 1
+        self._entries.move_to_end(best.id)
+        metrics.counter("chat_cache_hits").inc()
+        match = {"entry": best.id, "matched": best.message, "similarity": round(best_similarity, 3)}
+        return copy.deepcopy(best.response), match
+
+    def store(self, message: str, response: Dict[str, Any], scope: Hashable = None) -> bool:
+        """Remember a successful chat turn under ``scope``; anything else is ignored."""
+        if not (
+            response.get("success")
+            and response.get("task_type") == "chat"
+            and not response.get("execution_plan")
+            and self.eligible(message)
+        ):
+            return False
+        text = normalize(message)
+        if (scope, text) in self._by_text:
+            self._remove(self._by_text[(scope, text)])
+        self._next_id += 1
+        entry = _Entry(
+            self._next_id, scope, message, text,
+            {k: copy.deepcopy(response[k]) for k in _CACHED_FIELDS if k in response},
+        )
+        self._entries[entry.id] = entry
+        self._by_text[(scope, text)] = entry.id
+        for key in entry.bands:
+            self._buckets.setdefault(key, set()).add(entry.id)
+        while len(self._entries) > self.capacity:
+            self._remove(next(iter(self._entries)))
+        metrics.counter("chat_cache_stores").inc()
+        return True
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        if self._by_text.get((entry.scope, entry.text)) == entry_id:
+            del self._by_text[(entry.scope, entry.text)]
+        for key in entry.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def audit(self, message: str, match: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+        """Compare a hit with a fresh pipeline answer; True (and evict) on a false hit."""
+        false_hit = bool(fresh.get("success")) and fresh.get("task_type") != "chat"
+        metrics.counter("chat_cache_audits").inc()
+        if false_hit:
+            metrics.counter("chat_cache_false_hits").inc()
+            self._remove(match["entry"])
+        self._samples.append({
+            "message": message,
+            "matched": match["matched"],
+            "similarity": match["similarity"],
+            "fresh_task_type": fresh.get("task_type"),
+            "fresh_result": fresh.get("result"),
+            "false_hit": false_hit,
+        })
+        return false_hit
+
+    def stats(self) -> Dict[str, Any]:
+        hits = metrics.counter("chat_cache_hits").value
+        misses = metrics.counter("chat_cache_misses").value
+        audits = metrics.counter("chat_cache_audits").value
+        false_hits = metrics.counter("chat_cache_false_hits").value
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "audits": int(audits),
+            "false_hits": int(false_hits),
+            "false_hit_rate": round(false_hits / audits, 4) if audits else None,
+            "samples": list(self._samples),
+        }
@@ -0,0 +1,64 @@
+"""
+Per-request deadlines.
+
+process_message sets the request's absolute deadline (time.monotonic) in a
+context variable for the duration of the turn. Agents check it before every
+LLM call and tool call, and the MCP client bounds its blocking reads by
+whatever time is left, so a slow stage fails fast instead of running past
+the point where nobody is waiting for the answer.
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+
+# Default per-request budget in seconds (0 disables)
+DEFAULT_TIMEOUT = float(os.getenv("MAIDEL_REQUEST_TIMEOUT", "120"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("maidel_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs past its deadline."""
+
+
+@contextmanager
+def scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """Run the block with a deadline ``timeout`` seconds from now.
+
+    A nested scope never extends an outer deadline.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    outer = _deadline.get()
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request (None when unbounded)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(stage: str) -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline exceeded before {stage}")
+
+
+def before_model_callback(callback_context: Any, llm_request: Any) -> None:
+    check(f"llm {callback_context.agent_name}")
+    return None
+
+
+def before_tool_callback(tool: Any, args: Any, tool_context: Any) -> None:
+    check(f"tool {getattr(tool, 'name', tool)}")
+    return None
@@ -0,0 +1,244 @@
+"""
+Hedged and retried LLM calls.
+
+HedgedLlm wraps each agent's model.
+
+- Hedging applies only to the short, idempotent agents in
+  MAIDEL_HEDGE_AGENTS (by default ConversationClassifier and TaskPlanner).
+  When no answer has arrived by the agent's recent latency percentile
+  (MAIDEL_HEDGE_PERCENTILE, default p95), a duplicate request is sent. The
+  first answer wins and the other call is cancelled.
+- Budget: each call earns MAIDEL_HEDGE_BUDGET hedge credits (default 0.1),
+  and a hedge spends one. Duplicates therefore stay at about 10% of calls,
+  however slow the model gets.
+- Retries: transient errors (HTTP 429/5xx, connection errors, timeouts) are
+  retried with full-jitter exponential backoff, up to MAIDEL_LLM_RETRIES
+  times and never past the request deadline.
+
+Streamed calls are hedged up to their first chunk: the threshold is the
+time-to-first-chunk percentile, and whichever stream yields first is the one
+whose output is passed on while the other is closed. Once a chunk has been
+passed on the call is never retried.
+
+Hedging needs MAIDEL_HEDGE_MIN_SAMPLES observed latencies per agent before it
+kicks in.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, List, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from pydantic import PrivateAttr
+
+from backend import deadline
+from backend.metrics import metrics
+
+
+HEDGE_ENABLED = os.getenv("MAIDEL_HEDGE", "true").lower() in ("1", "true", "yes")
+HEDGE_AGENTS = tuple(
+    a.strip() for a in os.getenv("MAIDEL_HEDGE_AGENTS", "ConversationClassifier,TaskPlanner").split(",") if a.strip()
+)
+HEDGE_PERCENTILE = float(os.getenv("MAIDEL_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("MAIDEL_HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("MAIDEL_HEDGE_MIN_SAMPLES", "20"))
+LLM_RETRIES = int(os.getenv("MAIDEL_LLM_RETRIES", "2"))
+RETRY_BASE_SECONDS = 0.2
+RETRY_MAX_SECONDS = 4.0
+LATENCY_WINDOW = 200
+
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return isinstance(code, int) and code in _TRANSIENT_CODES
+
+
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+class LatencyWindow:
+    """Recent call latencies (seconds) for the hedge threshold."""
+
+    def __init__(self, size: int = LATENCY_WINDOW) -> None:
+        self._values: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._values.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if len(self._values) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class HedgeBudget:
+    """Credits earned per call and spent per hedge."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = 3.0) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = 0.0
+
+    def earn(self) -> None:
+        self.credits = min(self.burst, self.credits + self.ratio)
+
+    def spend(self) -> bool:
+        if self.credits >= 1.0:
+            self.credits -= 1.0
+            return True
+        return False
+
+
+class HedgedLlm(BaseLlm):
+    """Wraps an agent's model with hedging and transient-error retries."""
+
+    stage: str
+    inner: BaseLlm
+    hedge: bool = True
+    _latency: LatencyWindow = PrivateAttr(default_factory=LatencyWindow)
+    _budget: HedgeBudget = PrivateAttr(default_factory=HedgeBudget)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        attempt = 0
+        while True:
+            try:
+                if stream:
+                    async for response in self._hedged_stream(llm_request):
+                        yield response
+                        attempt = LLM_RETRIES  # never retry after partial output
+                    return
+                responses = await self._hedged_call(llm_request)
+                break
+            except Exception as e:
+                wait = backoff(attempt)
+                left = deadline.remaining()
+                if attempt >= LLM_RETRIES or not is_transient(e) or (left is not None and left <= wait):
+                    raise
+                attempt += 1
+                metrics.counter(f"llm_retries.{self.stage}").inc()
+                print(f"[Maidel] {self.stage} transient error ({e}); retry {attempt} in {wait:.2f}s", file=sys.stderr)
+                await asyncio.sleep(wait)
+        for response in responses:
+            yield response
+
+    async def _call(self, llm_request: LlmRequest) -> List[LlmResponse]:
+        started = time.perf_counter()
+        responses = [r async for r in self.inner.generate_content_async(llm_request, stream=False)]
+        self._latency.observe(time.perf_counter() - started)
+        return responses
+
+    async def _first(self, stream: AsyncGenerator[LlmResponse, None]) -> Optional[LlmResponse]:
+        """First chunk of ``stream`` (None if it ends without one)."""
+        started = time.perf_counter()
+        try:
+            response = await stream.__anext__()
+        except StopAsyncIteration:
+            response = None
+        self._latency.observe(time.perf_counter() - started)
+        return response
+
+    async def _race(
+        self, primary: "asyncio.Task[Any]", start_backup: Callable[[], "asyncio.Task[Any]"]
+    ) -> "asyncio.Task[Any]":
+        """Finished task to use: ``primary``, or a backup started past the threshold that succeeded first."""
+        threshold = self._latency.percentile(HEDGE_PERCENTILE) if self.hedge else None
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary
+        left = deadline.remaining()
+        if (left is not None and left <= 0) or not self._budget.spend():
+            metrics.counter(f"llm_hedge_skipped.{self.stage}").inc()
+            await asyncio.wait({primary})
+            return primary
+
+        metrics.counter(f"llm_hedges.{self.stage}").inc()
+        backup = start_backup()
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        metrics.counter(f"llm_hedge_wins.{self.stage}").inc()
+                    return task
+        # Both failed: surface the later error
+        return task
+
+    async def _hedged_call(self, llm_request: LlmRequest) -> List[LlmResponse]:
+        self._budget.earn()
+        tasks = [asyncio.ensure_future(self._call(llm_request))]
+
+        def start_backup() -> "asyncio.Task[Any]":
+            # The duplicate gets a copy: callbacks may mutate the request in place
+            tasks.append(asyncio.ensure_future(self._call(llm_request.model_copy(deep=True))))
+            return tasks[-1]
+
+        try:
+            return (await self._race(tasks[0], start_backup)).result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _hedged_stream(self, llm_request: LlmRequest) -> AsyncGenerator[LlmResponse, None]:
+        self._budget.earn()
+        streams: List[AsyncGenerator[LlmResponse, None]] = []
+        tasks: List["asyncio.Task[Any]"] = []
+
+        def start(request: LlmRequest) -> "asyncio.Task[Any]":
+            streams.append(self.inner.generate_content_async(request, stream=True))
+            tasks.append(asyncio.ensure_future(self._first(streams[-1])))
+            return tasks[-1]
+
+        winner = None
+        try:
+            winner = await self._race(start(llm_request), lambda: start(llm_request.model_copy(deep=True)))
+            first = winner.result()
+        finally:
+            # Close every stream but the winner's
+            for task, stream in zip(tasks, streams):
+                if task is not winner:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await stream.aclose()
+        stream = streams[tasks.index(winner)]
+        try:
+            if first is not None:
+                yield first
+                async for response in stream:
+                    yield response
+        finally:
+            await stream.aclose()
+
+
+def install(agents: List[Any], names: Optional[List[str]] = None) -> None:
+    """Wrap every agent's model; ``names`` (default HEDGE_AGENTS) are hedged."""
+    names = list(names or HEDGE_AGENTS)
+    for agent in agents:
+        if isinstance(agent.model, HedgedLlm):
+            continue
+        inner = agent.canonical_model
+        agent.model = HedgedLlm(
+            model=inner.model,
+            stage=agent.name,
+            inner=inner,
+            hedge=HEDGE_ENABLED and agent.name in names,
+        )
+
+
+def hedged_agents(agents: List[Any]) -> List[str]:
+    """Names of the agents whose calls can actually be hedged."""
+    return [a.name for a in agents if isinstance(a.model, HedgedLlm) and a.model.hedge]
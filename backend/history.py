@@ -0,0 +1,263 @@
+"""
+Bounded conversation-history window for agent prompts.
+
+Sessions persist across turns, so every LlmAgent would otherwise receive the
+whole conversation. HistoryManager runs as a ``before_model_callback``: it
+keeps the last N turns verbatim, folds older turns into a rolling summary and
+enforces a per-agent token budget measured with a local estimator.
+
+Summaries are refreshed on a background thread; a request never waits for
+one and uses the most recent summary available.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from backend.metrics import metrics
+
+
+MAX_TURNS = int(os.getenv("MAIDEL_HISTORY_TURNS", "6"))
+SUMMARY_TOKENS = int(os.getenv("MAIDEL_SUMMARY_TOKENS", "300"))
+# Optional model for abstractive summaries; the local extractive one is used otherwise
+SUMMARY_MODEL = os.getenv("MAIDEL_SUMMARY_MODEL", "")
+
+# Token budget for the contents (history + current turn) sent to each agent
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "ConversationClassifier": 800,
+    "TaskPlanner": 1500,
+    "TaskExecutor": 3000,
+}
+
+SUMMARY_HEADER = "[これまでの会話の要約]"
+_OTHER_AGENT_PREFIX = "For context:"
+# ADK quotes other agents' events between these markers after a preamble
+_QUOTE_MARKERS = re.compile(r"\n?<<<(?:BEGIN|END)_QUOTED_AGENT_CONTENT>>>\n?")
+_SAID = re.compile(r"^\[([^\]]+)\] said:\s*")
+
+Turn = List[types.Content]
+Summarizer = Callable[[str, List[str]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate: ~4 ASCII chars per token, 1 token per CJK char."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def content_text(content: types.Content) -> str:
+    parts = []
+    for part in content.parts or []:
+        if part.text:
+            parts.append(part.text)
+        elif part.function_call:
+            parts.append(f"{part.function_call.name}({part.function_call.args})")
+        elif part.function_response:
+            parts.append(str(part.function_response.response))
+    return "\n".join(parts)
+
+
+def message_text(content: types.Content) -> str:
+    """Text of a content without ADK's "For context:" wrapping of other agents' events.
+
+    Every agent sees the other agents' events wrapped differently, so
+    summaries and their fingerprints are built from this text instead.
+    """
+    parts = []
+    for part in content.parts or []:
+        if part.text is None:
+            parts.append(content_text(types.Content(parts=[part])))
+            continue
+        text = part.text
+        if text.startswith(_OTHER_AGENT_PREFIX):
+            text = text[len(_OTHER_AGENT_PREFIX):].lstrip()
+            if text.startswith("below is a transcript"):
+                continue
+        text = _SAID.sub(r"\1: ", _QUOTE_MARKERS.sub("\n", text).strip())
+        if text:
+            parts.append(text)
+    return "\n".join(parts)
+
+
+def content_tokens(content: types.Content) -> int:
+    return estimate_tokens(content_text(content))
+
+
+def _is_user_turn_start(content: types.Content) -> bool:
+    if content.role != "user" or not content.parts:
+        return False
+    first = content.parts[0]
+    return bool(first.text) and not first.text.startswith(_OTHER_AGENT_PREFIX)
+
+
+def split_turns(contents: List[types.Content]) -> List[Turn]:
+    """Group contents into turns, each starting at a real user message."""
+    turns: List[Turn] = []
+    for content in contents:
+        if _is_user_turn_start(content) or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+def extractive_summarizer(previous: str, turns: List[str], limit: int = SUMMARY_TOKENS) -> str:
+    """Cheap local summarizer: keeps the head of each folded turn."""
+    lines = [previous] if previous else []
+    for text in turns:
+        compact = " ".join(text.split())
+        lines.append(compact[:120] + ("…" if len(compact) > 120 else ""))
+    summary = "\n".join(lines)
+    # Keep the most recent part when over the summary budget
+    while estimate_tokens(summary) > limit and "\n" in summary:
+        summary = summary.split("\n", 1)[1]
+    return summary
+
+
+def llm_summarizer(model: str) -> Summarizer:
+    """Summarizer backed by a (small) Gemini model; falls back to extractive."""
+    from google import genai
+
+    client = genai.Client()
+
+    def summarize(previous: str, turns: List[str]) -> str:
+        prompt = (
+            "以下の会話の要約を、重要な事実・数値・ユーザーの意図を残して"
+            f"{SUMMARY_TOKENS}トークン以内の日本語で更新してください。\n\n"
+            f"## これまでの要約\n{previous or '(なし)'}\n\n## 追加の会話\n" + "\n---\n".join(turns)
+        )
+        try:
+            resp = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=types.GenerateContentConfig(max_output_tokens=SUMMARY_TOKENS * 2, temperature=0.0),
+            )
+            text = (resp.text or "").strip()
+            if text:
+                return text
+        except Exception as e:
+            print(f"[Maidel] LLM summarizer failed, using extractive: {e}", file=sys.stderr)
+        return extractive_summarizer(previous, turns)
+
+    return summarize
+
+
+class HistoryManager:
+    """Applies the history window and token budget to each LLM request."""
+
+    def __init__(
+        self,
+        max_turns: int = MAX_TURNS,
+        budgets: Optional[Dict[str, int]] = None,
+        summarizer: Optional[Summarizer] = None,
+        max_sessions: int = 256,
+    ) -> None:
+        self.max_turns = max_turns
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets or {})
+        if summarizer is None:
+            summarizer = llm_summarizer(SUMMARY_MODEL) if SUMMARY_MODEL else extractive_summarizer
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+        # (session_id, agent_name) -> (fingerprint of last folded turn, summary text).
+        # Per agent because each agent sees the other agents' events differently.
+        self._summaries: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    def before_model_callback(self, callback_context: Any, llm_request: Any) -> None:
+        contents: List[types.Content] = list(llm_request.contents or [])
+        current_start = self._current_turn_index(contents, callback_context.user_content)
+        if current_start <= 0:
+            return None
+        history, current = contents[:current_start], contents[current_start:]
+
+        turns = split_turns(history)
+        if self.max_turns > 0:
+            older, recent = turns[:-self.max_turns], turns[-self.max_turns:]
+        else:
+            older, recent = turns, []
+        key = (callback_context.session.id, callback_context.agent_name)
+        summary = self._summary_for(key, older) if older else ""
+
+        budget = self.budgets.get(callback_context.agent_name, 0)
+        fixed = sum(content_tokens(c) for c in current) + estimate_tokens(summary)
+        recent_tokens = [sum(content_tokens(c) for c in turn) for turn in recent]
+        while budget and recent and fixed + sum(recent_tokens) > budget:
+            recent.pop(0)
+            recent_tokens.pop(0)
+            metrics.counter("history_turns_dropped").inc()
+
+        new_contents: List[types.Content] = []
+        if summary:
+            new_contents.append(
+                types.Content(role="user", parts=[types.Part(text=f"{SUMMARY_HEADER}\n{summary}")])
+            )
+        for turn in recent:
+            new_contents.extend(turn)
+        new_contents.extend(current)
+        llm_request.contents = new_contents
+
+        metrics.histogram(
+            f"prompt_tokens_{callback_context.agent_name}", (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+        ).observe(fixed + sum(recent_tokens))
+        return None
+
+    @staticmethod
+    def _current_turn_index(contents: List[types.Content], user_content: Optional[types.Content]) -> int:
+        """Index where the current invocation's user message starts."""
+        target = content_text(user_content) if user_content else None
+        for i in range(len(contents) - 1, -1, -1):
+            if not _is_user_turn_start(contents[i]):
+                continue
+            if target is None or content_text(contents[i]) == target:
+                return i
+        return -1
+
+    def _summary_for(self, key: Tuple[str, str], older: List[Turn]) -> str:
+        """Return the latest available summary and schedule a refresh if stale."""
+        with self._lock:
+            fingerprint, summary = self._summaries.get(key, ("", ""))
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+        texts = ["\n".join(filter(None, (message_text(c) for c in turn))) for turn in older]
+        fingerprints = [str(hash(t)) for t in texts]
+        if fingerprints[-1] == fingerprint:
+            return summary
+        # Fold only the turns after the last one already summarized. If that
+        # turn was trimmed from the session, every remaining older turn is new.
+        start = fingerprints.index(fingerprint) + 1 if fingerprint in fingerprints else 0
+        self._schedule(key, summary, texts[start:], fingerprints[-1])
+        metrics.counter("history_summary_stale").inc()
+        return summary
+
+    def _schedule(self, key: Tuple[str, str], previous: str, texts: List[str], fingerprint: str) -> None:
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight[key] = self._pool.submit(self._summarize, key, previous, texts, fingerprint)
+
+    def _summarize(self, key: Tuple[str, str], previous: str, texts: List[str], fingerprint: str) -> None:
+        try:
+            summary = self.summarizer(previous, texts)
+            with self._lock:
+                self._summaries[key] = (fingerprint, summary)
+                self._summaries.move_to_end(key)
+                # One summary per agent of each session
+                while len(self._summaries) > self.max_sessions * max(1, len(self.budgets)):
+                    self._summaries.popitem(last=False)
+            metrics.counter("history_summaries").inc()
+        except Exception as e:
+            print(f"[Maidel] Summarization failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
@@ -10,31 +10,136 @@ import asyncio
 import json
 import sys
 import os
+import random
+import time
+import unicodedata
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# First backend import: starts the startup clock for the ready handshake
+from backend import startup
+
 from dotenv import load_dotenv
-from google.adk.agents import SequentialAgent
-from google.adk.sessions import InMemorySessionService
-from google.adk import Runner
 
 # Windows文字エンコーディング対応
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
     sys.stderr.reconfigure(encoding='utf-8')
 
-from backend.agents.conversation import conversation_agent
-from backend.agents.planner import planner_agent
-from backend.agents.executor import executor_agent, execution_manager
+# ADK, the agents and the pipeline are imported by MaidelSystem, so --serve
+# and --help never load them
+from backend.agents import factory as agent_factory
+from backend import deadline
+from backend.chat_cache import ChatCache
+from backend.metrics import metrics, SIZE_BUCKETS
+from backend.scheduler import Overloaded, Scheduler, resolve_class
+from backend.singleflight import AsyncSingleFlight
+from backend.tracing import tracer
 
 
 # Load environment from .env
 load_dotenv()
 
 
+# Optional response fields; clients opt in per message via "include"
+VERBOSE_FIELDS = ("session_state", "agent_event", "timings")
+# Other accepted names; "agent_event" adds the "agent_result" field
+INCLUDE_ALIASES = {"agent_result": "agent_event"}
+
+# Agent whose output is the turn's answer (output_key "final_result")
+ANSWER_AUTHOR = "TaskExecutor"
+
+
+def emit(payload: Dict[str, Any]) -> None:
+    """Write one JSONL response to stdout and record its size."""
+    line = json.dumps(payload, ensure_ascii=False)
+    metrics.histogram("response_bytes", SIZE_BUCKETS).observe(len(line.encode("utf-8")))
+    print(line, flush=True)
+
+
+def deadline_response(message: str, error: str) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "message": message,
+        "error": error,
+        "error_type": "deadline_exceeded",
+    }
+
+
+def normalize_message(message: str) -> str:
+    """Key used to detect duplicate messages (width, case and spacing folded)."""
+    return " ".join(unicodedata.normalize("NFKC", message).split()).casefold()
+
+
+def event_summary(event: Any) -> Dict[str, Any]:
+    """Compact, JSON-safe view of an ADK event for streaming clients."""
+    summary: Dict[str, Any] = {"author": getattr(event, "author", None)}
+    content = getattr(event, "content", None)
+    parts = getattr(content, "parts", None) or []
+    text = "".join(p.text for p in parts if getattr(p, "text", None))
+    if text:
+        summary["text"] = text
+    calls = [p.function_call.name for p in parts if getattr(p, "function_call", None)]
+    if calls:
+        summary["tool_calls"] = calls
+    if getattr(event, "partial", False):
+        summary["partial"] = True
+    if text and summary["author"] == ANSWER_AUTHOR:
+        # The reply itself, as opposed to classifier/planner output
+        summary["answer"] = True
+    actions = getattr(event, "actions", None)
+    state_delta = getattr(actions, "state_delta", None) if actions else None
+    if state_delta:
+        summary["state_keys"] = sorted(state_delta)
+    return summary
+
+
 class MaidelSystem:
     """Maidel 2.2 multi‑agent system wrapper."""
 
-    def __init__(self) -> None:
-        # Compose SequentialAgent
-        self.maidel_system = SequentialAgent(
+    def __init__(
+        self,
+        session_backend: Optional[str] = None,
+        session_db: Optional[str] = None,
+        cassette: Optional[str] = None,
+        cassette_mode: Optional[str] = None,
+        replay_speed: Optional[float] = None,
+        speculative: Optional[bool] = None,
+        chat_cache: Optional[bool] = None,
+    ) -> None:
+        """
+        session_backend: "memory" (default) or "sqlite"; falls back to the
+        MAIDEL_SESSION_BACKEND env var. session_db overrides the SQLite path.
+        cassette / cassette_mode ("record" or "replay") / replay_speed enable
+        LLM+MCP capture or offline replay (MAIDEL_CASSETTE,
+        MAIDEL_CASSETTE_MODE, MAIDEL_REPLAY_SPEED).
+        speculative plans concurrently with classification for task-like
+        messages (MAIDEL_SPECULATIVE).
+        chat_cache answers paraphrased small talk from a similarity cache
+        without a model call (MAIDEL_CHAT_CACHE, off by default).
+        """
+        if speculative is None:
+            speculative = os.getenv("MAIDEL_SPECULATIVE", "false").lower() in ("1", "true", "yes")
+        if chat_cache is None:
+            chat_cache = os.getenv("MAIDEL_CHAT_CACHE", "false").lower() in ("1", "true", "yes")
+
+        with startup.phase("imports"):
+            from google.adk import Runner
+            from backend import hedging
+            from backend.agents.hooks import add_callback
+            from backend.agents.pipeline import PlanningPipeline
+            from backend.agents.speculative import SpeculativePipeline
+            from backend.history import HistoryManager
+            from backend.sessions import APP_NAME, BoundedInMemorySessionService, ConversationSessionManager
+
+        with startup.phase("agents"):
+            conversation_agent = agent_factory.get_agent("conversation")
+            planner_agent = agent_factory.get_agent("planner")
+            executor_agent = agent_factory.get_agent("executor")
+
+        # Compose the pipeline
+        pipeline_class = SpeculativePipeline if speculative else PlanningPipeline
+        self.maidel_system = pipeline_class(
             name="MaidelSystem",
             description="Character dialog AI with planning and execution",
             sub_agents=[
@@ -44,82 +149,293 @@ class MaidelSystem:
             ],
         )
 
-        # Session service and runner
-        self.session_service = InMemorySessionService()
-        self.runner = Runner(
-            app_name="Maidel2.2",
-            agent=self.maidel_system,
-            session_service=self.session_service,
-        )
+        with startup.phase("system"):
+            # Hedged/retried model calls; installed before the cassette so a
+            # recording captures their outcome
+            hedging.install([conversation_agent, planner_agent, executor_agent])
+
+            # Optional traffic capture / offline replay
+            self.cassette = None
+            cassette = cassette or os.getenv("MAIDEL_CASSETTE")
+            if cassette:
+                from backend.cassette import Cassette, install
+
+                if replay_speed is None:
+                    replay_speed = float(os.getenv("MAIDEL_REPLAY_SPEED", "0"))
+                self.cassette = Cassette(
+                    cassette,
+                    cassette_mode or os.getenv("MAIDEL_CASSETTE_MODE", "replay"),
+                    speed=replay_speed,
+                )
+                install(self.cassette, [conversation_agent, planner_agent, executor_agent])
+                print(f"[Maidel] Cassette {self.cassette.mode}: {cassette}", file=sys.stderr)
+
+            # Bound prompt size as sessions grow across turns
+            self.history = HistoryManager()
+            for agent in (conversation_agent, planner_agent, executor_agent):
+                add_callback(agent, "before_model_callback", deadline.before_model_callback)
+                add_callback(agent, "before_tool_callback", deadline.before_tool_callback)
+                add_callback(agent, "before_model_callback", self.history.before_model_callback)
+                tracer.attach(agent)
+
+            # Session service and runner
+            backend = (session_backend or os.getenv("MAIDEL_SESSION_BACKEND", "memory")).lower()
+            if backend == "sqlite":
+                from backend.session_store import SqliteSessionService, DEFAULT_DB_PATH
+
+                self.session_service = SqliteSessionService(
+                    session_db or os.getenv("MAIDEL_SESSION_DB", DEFAULT_DB_PATH)
+                )
+            else:
+                self.session_service = BoundedInMemorySessionService()
+            self.sessions = ConversationSessionManager(self.session_service)
+            # conversation_id -> [lock, holders + waiters]
+            self._conversation_locks: Dict[str, list] = {}
+            self.scheduler = Scheduler()
+            # Coalescing of identical in-flight requests
+            self._flights = AsyncSingleFlight("process_message")
+            self._event_listeners: Dict[tuple, list] = {}
+            self.chat_cache = ChatCache() if chat_cache else None
+            self._audits: set = set()
+            self.runner = Runner(
+                app_name=APP_NAME,
+                agent=self.maidel_system,
+                session_service=self.session_service,
+            )
 
-    async def process_message(self, message: str) -> dict:
-        """Run the pipeline and deterministically execute planned tasks."""
-        try:
-            print(f"[Maidel] Received: {message}", file=sys.stderr)
+    async def process_message(
+        self,
+        message: str,
+        include: Optional[Iterable[str]] = None,
+        conversation_id: Optional[str] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+        timeout: Optional[float] = None,
+        priority: Optional[str] = None,
+    ) -> dict:
+        """Run the pipeline and deterministically execute planned tasks.
+
+        The response is compact by default; ``include`` opts in to the
+        verbose fields listed in VERBOSE_FIELDS (an unknown name is answered
+        with error_type ``invalid_include``). Turns sharing a
+        ``conversation_id`` reuse one session and run one at a time; without
+        it the session is discarded after the turn. ``on_event`` receives a
+        small dict per agent event as the pipeline progresses.
+
+        Concurrent identical requests (same normalized message, conversation
+        and ``include``) share one pipeline run; the extra callers get
+        ``"coalesced": true`` on their copy of the response.
+
+        ``timeout`` (seconds, default MAIDEL_REQUEST_TIMEOUT) becomes the
+        turn's deadline: agents and MCP calls check it, and the caller gets a
+        ``deadline_exceeded`` error once it passes. Cancelling the caller
+        cancels the run unless other coalesced callers still wait on it.
+
+        Runs are admitted by the scheduler under ``priority`` (chat, task or
+        background; guessed from the message when omitted). A full queue
+        answers with error_type ``overloaded``.
+        """
+        if timeout is None:
+            timeout = deadline.DEFAULT_TIMEOUT
+        if isinstance(include, str):
+            include = [include]
+        include = {INCLUDE_ALIASES.get(str(name), str(name)) for name in include or ()}
+        unknown = sorted(include - set(VERBOSE_FIELDS))
+        if unknown:
+            return {
+                "success": False,
+                "message": message,
+                "error": f"未知の include です: {unknown}（指定できるのは {list(VERBOSE_FIELDS)}）",
+                "error_type": "invalid_include",
+            }
+        cached = await self._cached_chat(message, include, conversation_id)
+        if cached is not None:
+            return cached
+        key = (conversation_id, normalize_message(message), tuple(sorted(include)))
+        listeners = self._event_listeners.setdefault(key, [])
+        if on_event is not None:
+            listeners.append(on_event)
+
+        def fan_out(event: Dict[str, Any]) -> None:
+            for listener in list(self._event_listeners.get(key, ())):
+                listener(dict(event))
 
-            # Create a fresh session
-            user_id = "user_001"
-            session = await self.session_service.create_session(
-                app_name="Maidel2.2", user_id=user_id, state={}
+        try:
+            response, shared = await asyncio.wait_for(
+                self._flights.do(
+                    key,
+                    lambda: self._run_turn(
+                        message, include, conversation_id, fan_out, timeout, resolve_class(priority, message)
+                    ),
+                ),
+                timeout or None,
+            )
+        except asyncio.TimeoutError:
+            print(f"[Maidel] Deadline exceeded after {timeout:g}s", file=sys.stderr)
+            metrics.counter("requests_deadline_exceeded").inc()
+            return deadline_response(message, f"{timeout:g}秒以内に完了しませんでした")
+        except Overloaded as e:
+            print(f"[Maidel] Rejected: {e}", file=sys.stderr)
+            return {
+                "success": False,
+                "message": message,
+                "error": "混雑しています。しばらくしてから再度お試しください",
+                "error_type": "overloaded",
+            }
+        finally:
+            if on_event is not None:
+                listeners.remove(on_event)
+            if not listeners and self._event_listeners.get(key) is listeners:
+                del self._event_listeners[key]
+        if shared:
+            response["message"] = message
+            response["coalesced"] = True
+        elif self.chat_cache is not None:
+            self.chat_cache.store(message, response, scope=conversation_id)
+        return response
+
+    async def _cached_chat(self, message: str, include: set, conversation_id: Optional[str]) -> Optional[dict]:
+        """Answer from the conversation's chat cache, sampling hits for a background audit."""
+        # Verbose fields need a real run
+        if self.chat_cache is None or not include <= {"timings"}:
+            return None
+        started = time.perf_counter()
+        hit = self.chat_cache.lookup(message, scope=conversation_id)
+        if hit is None:
+            return None
+        response, match = hit
+        if conversation_id is not None:
+            await self._record_cached_turn(conversation_id, message, response)
+        response["message"] = message
+        response["cache"] = {"matched": match["matched"], "similarity": match["similarity"]}
+        if "timings" in include:
+            response["timings"] = {"chat_cache": round((time.perf_counter() - started) * 1000, 3)}
+        print(f"[Maidel] Chat cache hit ({match['similarity']:.2f}): {match['matched']}", file=sys.stderr)
+        if random.random() < self.chat_cache.audit_rate:
+            task = asyncio.ensure_future(self._audit_chat_hit(message, match))
+            self._audits.add(task)
+            task.add_done_callback(self._audits.discard)
+        return response
+
+    async def _record_cached_turn(self, conversation_id: str, message: str, response: Dict[str, Any]) -> None:
+        """Append a turn answered from the cache to the conversation's session.
+
+        Later turns then see it in their history, as if the pipeline had run.
+        """
+        from google.adk.events import Event, EventActions
+        from google.genai import types
+        from backend.sessions import APP_NAME, USER_ID
+
+        async with self._conversation_lock(conversation_id):
+            session_id = await self.sessions.acquire(conversation_id)
+            try:
+                session = await self.session_service.get_session(
+                    app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+                )
+                invocation_id = Event.new_id()
+                await self.session_service.append_event(session, Event(
+                    invocation_id=invocation_id,
+                    author="user",
+                    content=types.Content(role="user", parts=[types.Part(text=message)]),
+                ))
+                await self.session_service.append_event(session, Event(
+                    invocation_id=invocation_id,
+                    author=ANSWER_AUTHOR,
+                    content=types.Content(role="model", parts=[types.Part(text=str(response.get("result") or ""))]),
+                    actions=EventActions(state_delta={
+                        "task_type": response.get("task_type"),
+                        "execution_plan": {"steps": []},
+                        "final_result": response.get("result"),
+                    }),
+                ))
+            finally:
+                await self.sessions.release(conversation_id, session_id)
+
+    async def _audit_chat_hit(self, message: str, match: Dict[str, Any]) -> None:
+        """Re-run a cache hit through the pipeline at background priority."""
+        try:
+            fresh = await self._run_turn(
+                message, set(), None, lambda event: None, deadline.DEFAULT_TIMEOUT, "background"
             )
-            session_id = session.id
+        except Exception as e:
+            print(f"[Maidel] Chat cache audit skipped: {e}", file=sys.stderr)
+            return
+        if self.chat_cache.audit(message, match, fresh):
+            print(f"[Maidel] Chat cache false hit: {message!r} ~ {match['matched']!r}", file=sys.stderr)
+
+    async def _run_turn(
+        self,
+        message: str,
+        include: set,
+        conversation_id: Optional[str],
+        on_event: Callable[[Dict[str, Any]], None],
+        timeout: Optional[float] = None,
+        priority: str = "chat",
+    ) -> dict:
+        with tracer.root("process_message", conversation_id=conversation_id, priority=priority) as root, \
+                deadline.scope(timeout):
+            async with self.scheduler.slot(priority, conversation_id), self._conversation_lock(conversation_id):
+                response = await self._process_message(message, include, conversation_id, on_event)
+        timings = tracer.summary(root.trace_id)
+        if "timings" in include:
+            response["timings"] = timings
+        print(f"[Maidel] Took {timings.get('process_message', 0.0):.0f} ms", file=sys.stderr)
+        return response
+
+    @asynccontextmanager
+    async def _conversation_lock(self, conversation_id: Optional[str]):
+        """Serialize turns of one conversation; locks are dropped when idle."""
+        if conversation_id is None:
+            yield
+            return
+        entry = self._conversation_locks.get(conversation_id)
+        if entry is None:
+            entry = self._conversation_locks[conversation_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._conversation_locks.pop(conversation_id, None)
+
+    async def _process_message(
+        self,
+        message: str,
+        include: set,
+        conversation_id: Optional[str],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> dict:
+        from backend.plan import ExecutionPlan, PlanError, parse_plan, parse_success_rate
+        from backend.sessions import USER_ID
 
-            # Run SequentialAgent with Content message
-            from google.genai import types
+        try:
+            print(f"[Maidel] Received: {message}", file=sys.stderr)
 
-            user_content = types.Content(role="user", parts=[types.Part(text=message)])
-            result_generator = self.runner.run(
-                user_id=user_id, session_id=session_id, new_message=user_content
-            )
+            # Reuse the conversation's session (or create a one-shot one)
+            user_id = USER_ID
+            session_id = await self.sessions.acquire(conversation_id)
 
-            final_event = None
-            session_state: dict = {}
-            for event in result_generator:
-                final_event = event
-                # Merge incremental state deltas if present
-                try:
-                    actions = getattr(event, "actions", None)
-                    state_delta = getattr(actions, "state_delta", None) if actions else None
-                    if isinstance(state_delta, dict):
-                        session_state.update(state_delta)
-                except Exception:
-                    pass
-                # Merge full session snapshot if provided
-                if hasattr(event, "session") and getattr(event, "session"):
-                    try:
-                        session_state.update(dict(event.session.state))
-                    except Exception:
-                        pass
+            try:
+                final_event, session_state = await self._run_pipeline(user_id, session_id, message, on_event)
+            finally:
+                await self.sessions.release(conversation_id, session_id)
 
             # Extract outputs from LLM agents
             task_type = str(session_state.get("task_type", "unknown")).strip()
-            execution_plan_raw = session_state.get("execution_plan", [])
-
-            # Parse execution_plan if it's a JSON string
-            execution_plan = []
-            if isinstance(execution_plan_raw, str):
-                try:
-                    # Extract JSON from markdown code block if present
-                    import re
-                    json_match = re.search(r'```json\s*(\[.*?\])\s*```', execution_plan_raw, re.DOTALL)
-                    if json_match:
-                        execution_plan = json.loads(json_match.group(1))
-                    else:
-                        execution_plan = json.loads(execution_plan_raw)
-                except (json.JSONDecodeError, AttributeError):
-                    execution_plan = []
-            elif isinstance(execution_plan_raw, list):
-                execution_plan = execution_plan_raw
+            plan_error = session_state.get("plan_error")
+            try:
+                plan = parse_plan(session_state.get("execution_plan"))
+            except PlanError as e:
+                plan, plan_error = ExecutionPlan(), str(e)
+            if plan_error:
+                print(f"[Maidel] Invalid execution plan: {plan_error}", file=sys.stderr)
+            execution_plan = [step.model_dump(exclude_none=True) for step in plan.steps]
 
             final_result = session_state.get("final_result")
 
-            # ExecutionManager disabled - ExecutorAgent handles all execution
             # Determine success based on whether we got a meaningful result
             success = bool(final_result and final_result.strip())
-            # Note: ExecutorAgent already executed the plan via SequentialAgent
-
-            # Fallback disabled - SequentialAgent with ExecutorAgent handles all cases
-            # All task classification and execution is now handled by the 3-layer agent system
 
             response = {
                 "success": success,
@@ -127,13 +443,25 @@ class MaidelSystem:
                 "task_type": task_type,
                 "execution_plan": execution_plan,
                 "result": final_result,
-                "session_state": session_state,
-                "agent_result": str(final_event),
+                "plan": {
+                    "valid": plan_error is None,
+                    "error": plan_error,
+                    "output_tokens": session_state.get("planner_output_tokens"),
+                    "parse_success_rate": parse_success_rate(),
+                },
             }
+            if "session_state" in include:
+                response["session_state"] = session_state
+            if "agent_event" in include:
+                response["agent_result"] = str(final_event)
 
             print(f"[Maidel] Type: {task_type}", file=sys.stderr)
             return response
 
+        except deadline.DeadlineExceeded as e:
+            print(f"[Maidel] {e}", file=sys.stderr)
+            metrics.counter("requests_deadline_exceeded").inc()
+            return deadline_response(message, str(e))
         except Exception as e:
             print(f"[Maidel] Error: {e}", file=sys.stderr)
             return {
@@ -143,6 +471,47 @@ class MaidelSystem:
                 "error_type": "system_error",
             }
 
+    async def _run_pipeline(
+        self,
+        user_id: str,
+        session_id: str,
+        message: str,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        """Run the SequentialAgent once; returns (final_event, merged state).
+
+        Uses run_async so concurrent messages share the event loop instead of
+        blocking it for the whole turn.
+        """
+        from google.genai import types
+
+        user_content = types.Content(role="user", parts=[types.Part(text=message)])
+        result_generator = self.runner.run_async(
+            user_id=user_id, session_id=session_id, new_message=user_content
+        )
+
+        final_event = None
+        session_state: dict = {}
+        async for event in result_generator:
+            final_event = event
+            if on_event is not None:
+                on_event(event_summary(event))
+            # Merge incremental state deltas if present
+            try:
+                actions = getattr(event, "actions", None)
+                state_delta = getattr(actions, "state_delta", None) if actions else None
+                if isinstance(state_delta, dict):
+                    session_state.update(state_delta)
+            except Exception:
+                pass
+            # Merge full session snapshot if provided
+            if hasattr(event, "session") and getattr(event, "session"):
+                try:
+                    session_state.update(dict(event.session.state))
+                except Exception:
+                    pass
+        return final_event, session_state
+
     async def run_interactive(self) -> None:
         """Interactive CLI loop (manual testing)."""
         print("=" * 60)
@@ -160,7 +529,7 @@ class MaidelSystem:
                 if not user_input:
                     continue
 
-                response = await self.process_message(user_input)
+                response = await self.process_message(user_input, conversation_id="interactive")
                 if response.get("success"):
                     print(response.get("result") or "処理が完了しました")
                 else:
@@ -172,9 +541,82 @@ class MaidelSystem:
             except Exception as e:
                 print(f"System error: {e}")
 
+    async def handle_request(self, request: Dict[str, Any], send: Callable[[Dict[str, Any]], None]) -> None:
+        """Answer one protocol request, writing response lines through ``send``.
+
+        ``request_id`` is echoed on every line for the request so clients can
+        have several messages in flight; with ``"stream": true`` pipeline
+        events are sent as ``{"type": "event"}`` lines before the response.
+        """
+        request_id = request.get("request_id")
+
+        def reply(payload: Dict[str, Any]) -> None:
+            if request_id is not None:
+                payload["request_id"] = request_id
+            send(payload)
+
+        if request.get("type") == "metrics":
+            from backend.tools import registry as mcp_registry
+
+            reply({
+                "type": "metrics",
+                "metrics": metrics.snapshot(),
+                "sessions": self.sessions.stats(),
+                "scheduler": self.scheduler.stats(),
+                "agents": agent_factory.summary(),
+                "chat_cache": self.chat_cache.stats() if self.chat_cache is not None else None,
+                "mcp": mcp_registry.loaded().stats() if mcp_registry.loaded() is not None else None,
+            })
+            return
+        message = request.get("message", "")
+        if not message:
+            reply({
+                "success": False,
+                "error": "メッセージが空です",
+                "error_type": "empty_message"
+            })
+            return
+        on_event = None
+        if request.get("stream"):
+            on_event = lambda event: reply({"type": "event", **event})
+        timeout_ms = request.get("timeout_ms")
+        try:
+            response = await self.process_message(
+                message,
+                include=request.get("include"),
+                conversation_id=request.get("conversation_id"),
+                on_event=on_event,
+                timeout=float(timeout_ms) / 1000 if timeout_ms else None,
+                priority=request.get("priority"),
+            )
+        except asyncio.CancelledError:
+            metrics.counter("requests_cancelled").inc()
+            reply({
+                "success": False,
+                "message": message,
+                "error": "キャンセルされました",
+                "error_type": "cancelled",
+            })
+            raise
+        reply(response)
+
     async def run_stdio(self) -> None:
-        """JSONL stdio mode for Electron bridge."""
-        print("Maidel 2.2 stdio mode ready", file=sys.stderr)
+        """JSONL stdio mode for Electron bridge.
+
+        Requests are handled concurrently; turns of one conversation still
+        run in arrival order. ``{"type": "cancel", "request_id": ...}``
+        aborts an in-flight request, which then answers with error_type
+        ``cancelled``.
+
+        The first line written is the handshake
+        ``{"type": "ready", "pid": ..., "startup_ms": {...}}``; clients can
+        send as soon as they see it.
+        """
+        startup_ms = startup.summary()
+        emit({"type": "ready", "pid": os.getpid(), "startup_ms": startup_ms})
+        print(f"Maidel 2.2 stdio mode ready ({startup_ms['total']:.0f} ms)", file=sys.stderr)
+        pending = set()
+        by_id: Dict[Any, asyncio.Task] = {}
         try:
             loop = asyncio.get_event_loop()
             while True:
@@ -187,34 +629,101 @@ class MaidelSystem:
 
                 try:
                     request = json.loads(line)
-                    message = request.get("message", "")
-                    if message:
-                        response = await self.process_message(message)
-                        print(json.dumps(response, ensure_ascii=False), flush=True)
-                    else:
-                        print(json.dumps({
-                            "success": False,
-                            "error": "メッセージが空です",
-                            "error_type": "empty_message"
-                        }, ensure_ascii=False), flush=True)
                 except json.JSONDecodeError as e:
-                    print(json.dumps({
+                    emit({
                         "success": False,
                         "error": f"JSON解析エラー: {e}",
                         "error_type": "json_parse_error",
-                    }, ensure_ascii=False), flush=True)
+                    })
+                    continue
+                request_id = request.get("request_id")
+                if request.get("type") == "cancel":
+                    task = by_id.get(request_id)
+                    if task is not None:
+                        task.cancel()
+                    else:
+                        print(f"[Maidel] Cancel for unknown request {request_id!r}", file=sys.stderr)
+                    continue
+                task = asyncio.create_task(self.handle_request(request, emit))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                if request_id is not None:
+                    by_id[request_id] = task
+                    task.add_done_callback(lambda t, rid=request_id: by_id.get(rid) is t and by_id.pop(rid))
 
         except Exception as e:
             print(f"stdio通信エラー: {e}", file=sys.stderr)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self) -> None:
+        """Flush any write-behind session state and the cassette; stop MCP servers."""
+        from backend.tools import registry as mcp_registry
+
+        for task in self._audits:
+            task.cancel()
+        mcp_registry.shutdown()
+        close = getattr(self.session_service, "close", None)
+        if close is not None:
+            close()
+        if self.cassette is not None:
+            self.cassette.close()
 
 
 async def main() -> None:
-    if len(sys.argv) > 1 and sys.argv[1] == "--stdio":
-        maidel = MaidelSystem()
-        await maidel.run_stdio()
-    else:
-        maidel = MaidelSystem()
-        await maidel.run_interactive()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maidel 2.2 backend")
+    parser.add_argument("--stdio", action="store_true", help="JSONL stdio mode for Electron")
+    parser.add_argument("--batch", metavar="INPUT", help="process a JSONL file of messages")
+    parser.add_argument("--out", metavar="OUTPUT", help="results JSONL for --batch")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("MAIDEL_BATCH_RPM", "0")),
+                        help="max messages per minute (0 = unlimited)")
+    parser.add_argument("--order", choices=["input", "completion"], default="input")
+    parser.add_argument("--checkpoint", metavar="PATH", help="defaults to <out>.ckpt")
+    parser.add_argument("--field", default="message", help="input field holding the message")
+    parser.add_argument("--serve", action="store_true", help="multi-client WebSocket/HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --serve")
+    parser.add_argument("--worker-module", default="backend.main", help="module each --serve worker runs")
+    args = parser.parse_args()
+
+    if args.serve:
+        # The front process only routes; each worker builds its own MaidelSystem
+        from backend import server
+
+        await server.run_server(
+            host=args.host,
+            port=args.port or server.DEFAULT_PORT,
+            workers=args.workers or server.DEFAULT_WORKERS,
+            command=server.worker_command(args.worker_module),
+        )
+        return
+
+    # Batch runs are often evaluations; every message gets a real pipeline run
+    maidel = MaidelSystem(chat_cache=False if args.batch else None)
+    try:
+        if args.batch:
+            from backend.batch import run_batch
+
+            await run_batch(
+                maidel,
+                args.batch,
+                args.out or os.path.splitext(args.batch)[0] + ".results.jsonl",
+                concurrency=args.concurrency,
+                rpm=args.rpm,
+                order=args.order,
+                checkpoint_path=args.checkpoint,
+                field=args.field,
+            )
+        elif args.stdio:
+            await maidel.run_stdio()
+        else:
+            await maidel.run_interactive()
+    finally:
+        maidel.close()
 
 
 if __name__ == "__main__":
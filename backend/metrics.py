@@ -0,0 +1,106 @@
+"""
+Maidel 2.2 in-process metrics
+
+Minimal counters, gauges and histograms kept in memory. A snapshot is served
+over the stdio protocol ({"type": "metrics"}) so payload and latency
+regressions are visible without an external collector.
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# Byte-size buckets used for response payloads (upper bounds, inclusive)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144)
+# Latency buckets in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Gauge:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Fixed-bucket histogram (last bucket is +Inf)."""
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets: List[float] = sorted(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = [str(b) for b in self.buckets] + ["+Inf"]
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "mean": (self.sum / self.count) if self.count else 0.0,
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class MetricsRegistry:
+    """Name -> metric registry; metrics are created on first use."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, factory) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = factory()
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get(name, Gauge)
+
+    def histogram(self, name: str, buckets: Optional[Iterable[float]] = None) -> Histogram:
+        return self._get(name, lambda: Histogram(buckets or LATENCY_BUCKETS_MS))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+metrics = MetricsRegistry()
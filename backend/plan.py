@@ -0,0 +1,197 @@
+"""
+Typed execution plan produced by the TaskPlanner.
+
+The planner is bound to ExecutionPlan as its output schema, so Gemini
+returns compact JSON (``{"steps": [...]}``) instead of a fenced code block.
+validate_plan_callback checks each planner response before it reaches the
+session. An invalid plan is replaced by an empty one and the reason is kept
+in ``plan_error``, so a bad plan is reported instead of silently becoming
+``[]``. Parse outcomes and planner output tokens are counted in metrics.
+
+PlanStreamParser reads the same JSON while it is still being generated and
+returns each step as soon as its object closes.
+"""
+
+import json
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from google.adk.models import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+
+from backend.metrics import metrics
+
+
+class PlanError(ValueError):
+    """The planner output is not a valid ExecutionPlan."""
+
+
+# "{2}" in an expression is replaced by the result of step 2
+STEP_REFERENCE = re.compile(r"\{(\d+)\}")
+
+
+class PlanStep(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    step_id: int = Field(ge=1)
+    name: str
+    tool: Optional[str] = None
+    expression: Optional[str] = None
+    dependencies: List[int] = Field(default_factory=list)
+
+    def inputs(self) -> Set[int]:
+        """Steps that must finish first: declared dependencies plus referenced results."""
+        return set(self.dependencies) | {int(m) for m in STEP_REFERENCE.findall(self.expression or "")}
+
+
+def topological_order(steps: List[PlanStep]) -> List[PlanStep]:
+    """Steps in dependency order (Kahn); PlanError on missing steps or cycles."""
+    by_id: Dict[int, PlanStep] = {step.step_id: step for step in steps}
+    for step in steps:
+        missing = sorted(step.inputs() - by_id.keys())
+        if missing:
+            raise PlanError(f"step {step.step_id} depends on unknown steps {missing}")
+    waiting = {step.step_id: len(step.inputs()) for step in steps}
+    dependents: Dict[int, List[int]] = {step_id: [] for step_id in by_id}
+    for step in steps:
+        for dep in step.inputs():
+            dependents[dep].append(step.step_id)
+    ready = deque(step.step_id for step in steps if not waiting[step.step_id])
+    order: List[PlanStep] = []
+    while ready:
+        step_id = ready.popleft()
+        order.append(by_id[step_id])
+        for dependent in dependents[step_id]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                ready.append(dependent)
+    if len(order) < len(steps):
+        cycle = sorted(step_id for step_id, count in waiting.items() if count)
+        raise PlanError(f"dependency cycle among steps {cycle}")
+    return order
+
+
+class ExecutionPlan(BaseModel):
+    """Ordered plan steps; empty for chat."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    steps: List[PlanStep] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def _check_references(self) -> "ExecutionPlan":
+        ids = [step.step_id for step in self.steps]
+        if len(ids) != len(set(ids)):
+            raise ValueError(f"duplicate step_id in {ids}")
+        topological_order(self.steps)
+        return self
+
+
+EMPTY_PLAN_JSON = json.dumps({"steps": []})
+
+
+def parse_plan(raw: Any) -> ExecutionPlan:
+    """Validate planner output (schema dict, JSON text or a bare step list)."""
+    try:
+        if raw is None:
+            return ExecutionPlan()
+        if isinstance(raw, str):
+            raw = json.loads(raw) if raw.strip() else {}
+        if isinstance(raw, list):
+            raw = {"steps": raw}
+        return ExecutionPlan.model_validate(raw)
+    except ValidationError as e:
+        first = e.errors()[0]
+        where = ".".join(str(part) for part in first["loc"])
+        message = str(first["ctx"]["error"]) if first["type"] == "value_error" else first["msg"]
+        raise PlanError(f"{where}: {message}" if where else message) from e
+    except (json.JSONDecodeError, TypeError) as e:
+        raise PlanError(f"{type(e).__name__}: {e}") from e
+
+
+class PlanStreamParser:
+    """Incremental parser over streamed planner text.
+
+    ``feed`` takes chunks of ``{"steps": [...]}`` (or a bare step list) and
+    returns the steps whose objects closed in that chunk. Every character is
+    scanned once; only the text of the open step object is kept. Steps that
+    fail validation are skipped here and reported by the full-plan check.
+    """
+
+    def __init__(self) -> None:
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._current: Optional[List[str]] = None
+
+    def _at_step_level(self) -> bool:
+        # Inside the top-level list or the list directly under the top object
+        return 0 < len(self._stack) <= 2 and self._stack[-1] == "["
+
+    def feed(self, chunk: str) -> List[PlanStep]:
+        steps: List[PlanStep] = []
+        for ch in chunk:
+            if self._current is not None:
+                self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                if ch == "{" and self._current is None and self._at_step_level():
+                    self._current = [ch]
+                self._stack.append(ch)
+            elif ch == "}" or ch == "]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._current is not None and self._at_step_level():
+                    step = self._parse_step("".join(self._current))
+                    self._current = None
+                    if step is not None:
+                        steps.append(step)
+        return steps
+
+    @staticmethod
+    def _parse_step(text: str) -> Optional[PlanStep]:
+        try:
+            return PlanStep.model_validate(json.loads(text))
+        except (json.JSONDecodeError, ValidationError, TypeError):
+            return None
+
+
+def parse_success_rate() -> Optional[float]:
+    ok = metrics.counter("plan_parse_ok").value
+    failed = metrics.counter("plan_parse_failed").value
+    return round(ok / (ok + failed), 4) if ok + failed else None
+
+
+def validate_plan_callback(callback_context: Any, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """after_model_callback for the planner: validate, count and record tokens."""
+    if llm_response.partial or not llm_response.content or not llm_response.content.parts:
+        return None
+    usage = llm_response.usage_metadata
+    output_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if output_tokens is not None:
+        metrics.histogram("planner_output_tokens").observe(output_tokens)
+    callback_context.state["planner_output_tokens"] = output_tokens
+
+    text = "".join(p.text for p in llm_response.content.parts if p.text and not p.thought)
+    try:
+        parse_plan(text)
+    except PlanError as e:
+        metrics.counter("plan_parse_failed").inc()
+        callback_context.state["plan_error"] = str(e)
+        return LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=EMPTY_PLAN_JSON)]),
+            usage_metadata=usage,
+        )
+    metrics.counter("plan_parse_ok").inc()
+    callback_context.state["plan_error"] = None
+    return None
@@ -0,0 +1,179 @@
+"""
+Priority scheduling of pipeline runs.
+
+Every turn takes one of MAIDEL_MAX_CONCURRENCY run slots before it starts.
+Waiting turns are queued by class. Interactive ``chat`` turns go first, then
+``task``, then ``background``. Within a class, conversations are served
+round-robin, and a conversation whose previous turn is still running is
+skipped, so one chatty client cannot hold every slot. A lower-class turn
+that has waited longer than MAIDEL_SCHEDULER_AGING seconds is served next,
+so background work cannot starve forever.
+
+Admission control rejects a turn with Overloaded when its class queue is
+full. Queue depth and wait time are exported per class as
+``queue_depth.<class>`` and ``queue_wait_ms.<class>``.
+"""
+
+import asyncio
+import itertools
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, Optional
+
+from backend.metrics import metrics, LATENCY_BUCKETS_MS
+
+
+CLASSES = ("chat", "task", "background")
+MAX_CONCURRENCY = int(os.getenv("MAIDEL_MAX_CONCURRENCY", "8"))
+QUEUE_LIMIT = int(os.getenv("MAIDEL_QUEUE_LIMIT", "64"))
+AGING_SECONDS = float(os.getenv("MAIDEL_SCHEDULER_AGING", "10"))
+
+# Cheap pre-classification used when the request does not name a class
+_TASK_HINT = re.compile(r"[0-9０-９].*[+\-*/×÷^＋－＊／]|計算|求め|答え|いくつ|sqrt|sin|cos|log")
+
+
+class Overloaded(Exception):
+    """The request's class queue is full."""
+
+
+def guess_class(message: str) -> str:
+    return "task" if _TASK_HINT.search(message or "") else "chat"
+
+
+def resolve_class(requested: Optional[str], message: str) -> str:
+    if requested in CLASSES:
+        return requested
+    return guess_class(message)
+
+
+class _Waiter:
+    __slots__ = ("cls", "conversation", "future", "enqueued")
+
+    def __init__(self, cls: str, conversation: Hashable, future: asyncio.Future) -> None:
+        self.cls = cls
+        self.conversation = conversation
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class Scheduler:
+    """Slot-limited priority queue with per-conversation fairness."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        queue_limit: int = QUEUE_LIMIT,
+        aging_seconds: float = AGING_SECONDS,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        # Background work gets a quarter of the queue
+        self.limits = {"chat": queue_limit, "task": queue_limit, "background": max(1, queue_limit // 4)}
+        self.aging_seconds = aging_seconds
+        self.running = 0
+        self._busy: Dict[Hashable, int] = {}
+        # class -> conversation -> waiters, conversations in round-robin order
+        self._queues: Dict[str, "OrderedDict[Hashable, Deque[_Waiter]]"] = {c: OrderedDict() for c in CLASSES}
+        self._depth = {c: 0 for c in CLASSES}
+        self._oneshot_ids = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, cls: str, conversation_id: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold a run slot for the duration of the block."""
+        cls = cls if cls in CLASSES else "chat"
+        conversation = conversation_id if conversation_id is not None else ("oneshot", next(self._oneshot_ids))
+        await self._acquire(cls, conversation)
+        try:
+            yield
+        finally:
+            self._release(conversation)
+
+    async def _acquire(self, cls: str, conversation: Hashable) -> None:
+        if self._depth[cls] >= self.limits[cls]:
+            metrics.counter(f"admission_rejected.{cls}").inc()
+            raise Overloaded(f"{cls} queue is full ({self._depth[cls]} waiting)")
+        waiter = _Waiter(cls, conversation, asyncio.get_running_loop().create_future())
+        self._queues[cls].setdefault(conversation, deque()).append(waiter)
+        self._set_depth(cls, 1)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we were cancelled; hand the slot on
+                self._release(conversation)
+            else:
+                self._remove(waiter)
+            raise
+        metrics.histogram(f"queue_wait_ms.{cls}", LATENCY_BUCKETS_MS).observe(
+            (time.monotonic() - waiter.enqueued) * 1000
+        )
+
+    def _release(self, conversation: Hashable) -> None:
+        self.running -= 1
+        left = self._busy.get(conversation, 1) - 1
+        if left > 0:
+            self._busy[conversation] = left
+        else:
+            self._busy.pop(conversation, None)
+        metrics.gauge("scheduler_running").set(self.running)
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.cls].get(waiter.conversation)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.cls][waiter.conversation]
+        self._set_depth(waiter.cls, -1)
+
+    def _set_depth(self, cls: str, delta: int) -> None:
+        self._depth[cls] += delta
+        metrics.gauge(f"queue_depth.{cls}").set(self._depth[cls])
+
+    def _head(self, cls: str) -> Optional[_Waiter]:
+        """Oldest waiter of the first idle conversation in round-robin order."""
+        for conversation, queue in self._queues[cls].items():
+            if conversation not in self._busy:
+                return queue[0]
+        return None
+
+    def _next(self) -> Optional[_Waiter]:
+        heads = [h for h in (self._head(c) for c in CLASSES) if h is not None]
+        if not heads:
+            return None
+        now = time.monotonic()
+        aged = [h for h in heads[1:] if now - h.enqueued >= self.aging_seconds]
+        if aged:
+            return min(aged, key=lambda h: h.enqueued)
+        return heads[0]
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            waiter = self._next()
+            if waiter is None:
+                return
+            queues = self._queues[waiter.cls]
+            queue = queues.pop(waiter.conversation)
+            queue.popleft()
+            if queue:
+                # Back of the line for this conversation's next turn
+                queues[waiter.conversation] = queue
+            self._set_depth(waiter.cls, -1)
+            if waiter.future.done():
+                # Cancelled while queued; its task has not run its cleanup yet
+                continue
+            self.running += 1
+            self._busy[waiter.conversation] = self._busy.get(waiter.conversation, 0) + 1
+            metrics.gauge("scheduler_running").set(self.running)
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": dict(self._depth),
+        }
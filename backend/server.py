@@ -0,0 +1,444 @@
+"""
+Multi-client local server mode.
+
+    python -m backend.main --serve --port 8765 --workers 4
+
+A front process accepts WebSocket clients on ws://HOST:PORT/. Each text
+message is one request of the stdio JSONL protocol, and response and
+streaming-event lines come back as messages with the client's
+``request_id`` echoed. ``GET /health`` and ``GET /metrics`` are answered
+over plain HTTP on the same port.
+
+Requests are forwarded to a pool of worker processes started with the
+server. Each worker is a ``backend.main --stdio`` instance with its own
+MaidelSystem. A
+conversation always goes to the same worker (crc32 of conversation_id), so
+its session stays local. One-shot requests go to the least busy worker. A
+crashed worker is restarted, and its in-flight requests fail with
+error_type "worker_crashed". ``cancel`` messages are forwarded to the
+owning worker, and a client's in-flight requests are cancelled when it
+disconnects.
+
+Each connection buffers at most OUTBOX_LIMIT outgoing lines. While its
+buffer is full the server stops reading that client's requests, and a
+client that still falls behind the events streamed to it is disconnected.
+Writes to a worker wait for its stdin to drain.
+
+On shutdown the server stops accepting connections and requests, waits up
+to DRAIN_TIMEOUT seconds for in-flight requests to be answered and sent, and
+then closes the connections and stops the workers.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.metrics import metrics
+
+try:
+    from websockets.asyncio.server import serve as ws_serve
+    from websockets.exceptions import ConnectionClosed
+    _HAVE_WEBSOCKETS = True
+except Exception:  # pragma: no cover - optional dependency
+    _HAVE_WEBSOCKETS = False
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.getenv("MAIDEL_SERVE_PORT", "8765"))
+DEFAULT_WORKERS = int(os.getenv("MAIDEL_SERVE_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Worker stdout lines can carry full session_state
+LINE_LIMIT = 16 * 1024 * 1024
+# Outgoing lines buffered per connection before the client counts as too slow
+OUTBOX_LIMIT = int(os.getenv("MAIDEL_SERVE_OUTBOX", "1024"))
+# How long shutdown waits for in-flight requests
+DRAIN_TIMEOUT = float(os.getenv("MAIDEL_SERVE_DRAIN_TIMEOUT", "30"))
+
+Callback = Callable[[Dict[str, Any]], None]
+
+
+def is_final(payload: Dict[str, Any]) -> bool:
+    """True for the last line of a request (anything but a streaming event)."""
+    return payload.get("type") != "event"
+
+
+class Worker:
+    """One ``--stdio`` backend process and the requests in flight on it."""
+
+    def __init__(self, index: int, command: List[str]) -> None:
+        self.index = index
+        self.command = command
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.pending: Dict[str, Callback] = {}
+        self.restarts = 0
+        self.closing = False
+        # Set by the worker's {"type": "ready"} handshake line
+        self.ready = False
+        self.startup_ms: Optional[Dict[str, float]] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        env = dict(os.environ, MAIDEL_WORKER_INDEX=str(self.index))
+        self.ready = False
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=PROJECT_ROOT,
+            env=env,
+            limit=LINE_LIMIT,
+        )
+        self._reader = asyncio.create_task(self._read_loop(self.process))
+        print(f"[Server] Worker {self.index} started (pid {self.process.pid})", file=sys.stderr)
+
+    async def send(self, request: Dict[str, Any], callback: Callback) -> None:
+        self.pending[request["request_id"]] = callback
+        await self.send_raw(request)
+
+    async def send_raw(self, request: Dict[str, Any]) -> None:
+        stdin = self.process.stdin
+        stdin.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        try:
+            await stdin.drain()
+        except ConnectionError:
+            # The worker died; the read loop fails its pending requests
+            pass
+
+    async def _read_loop(self, process: asyncio.subprocess.Process) -> None:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            try:
+                payload = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[Server] Worker {self.index} wrote a non-JSON line", file=sys.stderr)
+                continue
+            if payload.get("type") == "ready":
+                self.ready = True
+                self.startup_ms = payload.get("startup_ms")
+                continue
+            request_id = payload.get("request_id")
+            callback = self.pending.get(request_id)
+            if callback is None:
+                continue
+            if is_final(payload):
+                del self.pending[request_id]
+            callback(payload)
+        await process.wait()
+        self._fail_pending()
+        if not self.closing:
+            await self._restart(process.returncode)
+
+    def _fail_pending(self) -> None:
+        pending, self.pending = self.pending, {}
+        for request_id, callback in pending.items():
+            callback({
+                "success": False,
+                "request_id": request_id,
+                "error": f"worker {self.index} exited",
+                "error_type": "worker_crashed",
+            })
+
+    async def _restart(self, returncode: Optional[int]) -> None:
+        self.restarts += 1
+        metrics.counter("server_worker_restarts").inc()
+        # Back off when a worker keeps dying at startup
+        delay = min(5.0, 0.2 * 2 ** min(self.restarts, 5))
+        print(f"[Server] Worker {self.index} exited ({returncode}); restarting in {delay:.1f}s", file=sys.stderr)
+        await asyncio.sleep(delay)
+        if not self.closing:
+            await self.start()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        self.closing = True
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        # EOF lets run_stdio finish in-flight requests and flush sessions
+        process.stdin.close()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        if self._reader is not None:
+            await self._reader
+
+
+class WorkerPool:
+    """Routes requests to workers, sharding by conversation id."""
+
+    def __init__(self, size: int, command: List[str]) -> None:
+        self.workers = [Worker(i, command) for i in range(max(1, size))]
+        self._ids = itertools.count(1)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(w.start() for w in self.workers))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(w.close() for w in self.workers))
+
+    def pick(self, conversation_id: Optional[str]) -> Worker:
+        if conversation_id is not None:
+            shard = zlib.crc32(str(conversation_id).encode("utf-8")) % len(self.workers)
+            return self.workers[shard]
+        live = [w for w in self.workers if w.alive] or self.workers
+        return min(live, key=lambda w: len(w.pending))
+
+    async def submit(
+        self, request: Dict[str, Any], callback: Callback, worker: Optional[Worker] = None
+    ) -> Optional[Tuple[Worker, str]]:
+        """Forward ``request``; ``callback`` sees its lines with the client's id restored.
+
+        Returns the (worker, internal id) handle for ``cancel``.
+        """
+        worker = worker or self.pick(request.get("conversation_id"))
+        client_id = request.get("request_id")
+        internal_id = f"s{next(self._ids)}"
+
+        def relay(payload: Dict[str, Any]) -> None:
+            if client_id is None:
+                payload.pop("request_id", None)
+            else:
+                payload["request_id"] = client_id
+            payload["worker"] = worker.index
+            callback(payload)
+
+        if not worker.alive:
+            relay({"success": False, "error": f"worker {worker.index} is restarting", "error_type": "worker_unavailable"})
+            return None
+        metrics.counter("server_requests").inc()
+        await worker.send(dict(request, request_id=internal_id), relay)
+        return worker, internal_id
+
+    def in_flight(self) -> int:
+        return sum(len(w.pending) for w in self.workers)
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no worker has a request in flight; False on timeout."""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while self.in_flight():
+            if loop.time() >= end:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def cancel(self, handle: Tuple[Worker, str]) -> None:
+        worker, internal_id = handle
+        if internal_id in worker.pending and worker.alive:
+            await worker.send_raw({"type": "cancel", "request_id": internal_id})
+
+    async def collect_metrics(self, timeout: float = 5.0) -> Dict[str, Any]:
+        """Front-process metrics plus each live worker's metrics reply."""
+        loop = asyncio.get_running_loop()
+
+        async def ask(worker: Worker) -> Dict[str, Any]:
+            future = loop.create_future()
+            await self.submit({"type": "metrics"}, lambda p: future.done() or future.set_result(p), worker)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return {"worker": worker.index, "error": "timeout"}
+
+        return {
+            "type": "metrics",
+            "server": metrics.snapshot(),
+            "workers": await asyncio.gather(*(ask(w) for w in self.workers)),
+        }
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok" if all(w.alive and w.ready for w in self.workers) else "degraded",
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.process.pid if w.process else None,
+                    "alive": w.alive,
+                    "ready": w.ready,
+                    "startup_ms": w.startup_ms,
+                    "in_flight": len(w.pending),
+                    "restarts": w.restarts,
+                }
+                for w in self.workers
+            ],
+        }
+
+
+async def drain(pool: WorkerPool, outboxes: Set[asyncio.Queue], timeout: float = DRAIN_TIMEOUT) -> None:
+    """Wait for in-flight requests to be answered and their replies sent."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    print(f"[Server] Draining {pool.in_flight()} in-flight requests", file=sys.stderr)
+    if not await pool.drain(timeout):
+        print(f"[Server] {pool.in_flight()} requests still in flight after {timeout:.0f}s", file=sys.stderr)
+        return
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(outbox.join() for outbox in list(outboxes))),
+            max(0.0, end - loop.time()),
+        )
+    except asyncio.TimeoutError:
+        print("[Server] Replies not sent before the drain timeout", file=sys.stderr)
+
+
+def worker_command(module: str = "backend.main") -> List[str]:
+    return [sys.executable, "-m", module, "--stdio"]
+
+
+async def run_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = DEFAULT_WORKERS,
+    command: Optional[List[str]] = None,
+) -> None:
+    if not _HAVE_WEBSOCKETS:
+        raise RuntimeError("--serve requires the 'websockets' package (pip install websockets)")
+
+    pool = WorkerPool(workers, command or worker_command())
+    await pool.start()
+    open_connections = 0
+    draining = False
+    # Every connection's outbox, so shutdown can wait for answers to be sent
+    outboxes: Set[asyncio.Queue] = set()
+
+    async def handle(connection: Any) -> None:
+        nonlocal open_connections
+        open_connections += 1
+        metrics.gauge("server_connections").set(open_connections)
+        outbox: asyncio.Queue = asyncio.Queue(OUTBOX_LIMIT)
+        outboxes.add(outbox)
+        # client request_id -> worker handle, for cancel and disconnect
+        in_flight: Dict[Any, Tuple[Worker, str]] = {}
+        # Metrics replies being collected; they must not hold up the read loop
+        metrics_tasks: Set[asyncio.Task] = set()
+        # Set by the writer whenever it frees a slot in the outbox
+        room = asyncio.Event()
+        dropped = False
+
+        def deliver(payload: Dict[str, Any]) -> None:
+            nonlocal dropped
+            if is_final(payload):
+                in_flight.pop(payload.get("request_id"), None)
+            if dropped:
+                return
+            try:
+                outbox.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Worker output cannot wait for one slow reader; drop the client
+                dropped = True
+                metrics.counter("server_slow_clients").inc()
+                print(f"[Server] Closing a client that is {OUTBOX_LIMIT} lines behind", file=sys.stderr)
+                asyncio.ensure_future(connection.close(1008, "client too slow"))
+
+        async def writer() -> None:
+            while True:
+                payload = await outbox.get()
+                room.set()
+                try:
+                    await connection.send(json.dumps(payload, ensure_ascii=False))
+                finally:
+                    outbox.task_done()
+
+        async def reply_metrics(request: Dict[str, Any]) -> None:
+            reply = await pool.collect_metrics()
+            if "request_id" in request:
+                reply["request_id"] = request["request_id"]
+            await outbox.put(reply)
+
+        write_task = asyncio.create_task(writer())
+        try:
+            async for raw in connection:
+                # Stop reading this client's requests until it reads its answers
+                while outbox.full():
+                    room.clear()
+                    await room.wait()
+                try:
+                    request = json.loads(raw)
+                    if not isinstance(request, dict):
+                        raise json.JSONDecodeError("expected an object", str(raw), 0)
+                except json.JSONDecodeError as e:
+                    await outbox.put({
+                        "success": False,
+                        "error": f"JSON解析エラー: {e}",
+                        "error_type": "json_parse_error",
+                    })
+                    continue
+                if request.get("type") == "cancel":
+                    handle = in_flight.get(request.get("request_id"))
+                    if handle is not None:
+                        await pool.cancel(handle)
+                    continue
+                if draining:
+                    reply = {"success": False, "error": "server is shutting down", "error_type": "server_shutting_down"}
+                    if "request_id" in request:
+                        reply["request_id"] = request["request_id"]
+                    await outbox.put(reply)
+                    continue
+                if request.get("type") == "metrics":
+                    task = asyncio.create_task(reply_metrics(request))
+                    metrics_tasks.add(task)
+                    task.add_done_callback(metrics_tasks.discard)
+                    continue
+                handle = await pool.submit(request, deliver)
+                if handle is not None and request.get("request_id") is not None:
+                    in_flight[request["request_id"]] = handle
+        except ConnectionClosed:
+            pass
+        finally:
+            # Nobody is left to read these answers
+            for handle in list(in_flight.values()):
+                await pool.cancel(handle)
+            for task in metrics_tasks:
+                task.cancel()
+            write_task.cancel()
+            outboxes.discard(outbox)
+            while not outbox.empty():
+                outbox.get_nowait()
+                outbox.task_done()
+            open_connections -= 1
+            metrics.gauge("server_connections").set(open_connections)
+
+    async def process_request(connection: Any, request: Any) -> Any:
+        # Plain HTTP endpoints; everything else goes on to the WebSocket handshake
+        path = request.path.split("?", 1)[0]
+        if path == "/health":
+            body = pool.health()
+        elif path == "/metrics":
+            body = await pool.collect_metrics()
+        else:
+            return None
+        response = connection.respond(200, json.dumps(body, ensure_ascii=False) + "\n")
+        response.headers["Content-Type"] = "application/json; charset=utf-8"
+        return response
+
+    try:
+        async with ws_serve(handle, host, port, process_request=process_request, max_size=LINE_LIMIT) as server:
+            bound = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+            print(f"Maidel 2.2 serve mode ready on {bound} ({len(pool.workers)} workers)", file=sys.stderr)
+            stop = asyncio.Event()
+            try:
+                # SIGTERM shuts down like Ctrl-C, draining first
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+            try:
+                await stop.wait()
+            finally:
+                # Stop accepting connections; open ones are closed on leaving
+                # the context manager, once their replies are sent
+                draining = True
+                server.server.close()
+                await drain(pool, outboxes)
+    finally:
+        await pool.close()
@@ -0,0 +1,385 @@
+"""
+SQLite-backed ADK session service with write-behind batching.
+
+Sessions survive backend restarts (Electron restarts the process on errors
+via ``restart-adk``). Hot sessions are served from an in-memory LRU cache;
+event appends and state changes are queued and flushed in batches by a
+background thread, so a turn never waits on disk I/O; cache misses are
+loaded on a worker thread. Sessions created without an id are one-shot
+(ConversationSessionManager deletes them after the turn) and are kept in
+memory only.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+from backend.metrics import metrics
+
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".maidel", "sessions.sqlite3")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("MAIDEL_SESSION_FLUSH_INTERVAL", "0.2"))
+CACHE_SIZE = int(os.getenv("MAIDEL_SESSION_CACHE", "64"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, seq)
+);
+"""
+
+_Key = Tuple[str, str, str]
+
+
+def _persistable_state(state: Any) -> Dict[str, Any]:
+    # temp: keys live for one invocation only and are never persisted
+    return {k: v for k, v in dict(state).items() if not k.startswith("temp:")}
+
+
+class SqliteSessionService(BaseSessionService):
+    """BaseSessionService backed by a local SQLite file in WAL mode."""
+
+    persistent = True
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        cache_size: int = CACHE_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+        self._cache: "OrderedDict[_Key, Session]" = OrderedDict()
+        # One-shot sessions: never persisted and never evicted by the LRU
+        self._transient: Dict[_Key, Session] = {}
+        # Next event sequence number per cached session
+        self._seq: Dict[_Key, int] = {}
+
+        # Write-behind queue: ordered ops plus coalesced state snapshots
+        self._pending_ops: List[Tuple[Any, ...]] = []
+        self._pending_state: Dict[_Key, Tuple[Dict[str, Any], float]] = {}
+        self._pending_cond = threading.Condition()
+        # Held across take-and-write so a reader's flush waits for a batch
+        # the writer thread has taken but not committed yet
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    # --- BaseSessionService -------------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        transient = not (session_id or "").strip()
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        now = time.time()
+        session = Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=dict(state or {}),
+            events=[],
+            last_update_time=now,
+        )
+        key = (app_name, user_id, session_id)
+        if transient:
+            self._transient[key] = session
+            return session
+        self._cache_put(key, session)
+        self._seq[key] = 0
+        self._enqueue(("create", key, _persistable_state(session.state), now))
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        session = self._transient.get(key) or self._cache.get(key)
+        if session is not None:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            metrics.counter("session_cache_hits").inc()
+        else:
+            metrics.counter("session_cache_misses").inc()
+            loaded = await asyncio.to_thread(self._load, key)
+            if loaded is None:
+                return None
+            # Another turn may have loaded or created it while we were reading
+            session = self._cache.get(key)
+            if session is None:
+                session, self._seq[key] = loaded
+                self._cache_put(key, session)
+
+        if config is None:
+            return session
+        view = copy.copy(session)
+        events = list(session.events)
+        if getattr(config, "after_timestamp", None):
+            events = [e for e in events if e.timestamp >= config.after_timestamp]
+        if getattr(config, "num_recent_events", None):
+            events = events[-config.num_recent_events:]
+        view.events = events
+        return view
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        await asyncio.to_thread(self.flush_pending)
+        query = "SELECT user_id, id, state, last_update_time FROM sessions WHERE app_name=?"
+        params: Tuple[str, ...] = (app_name,)
+        if user_id is not None:
+            query += " AND user_id=?"
+            params += (user_id,)
+        with self._db_lock:
+            rows = self._conn.execute(query + " ORDER BY last_update_time", params).fetchall()
+        sessions = [
+            Session(
+                id=sid,
+                app_name=app_name,
+                user_id=uid,
+                state=json.loads(state),
+                events=[],
+                last_update_time=ts,
+            )
+            for uid, sid, state, ts in rows
+        ]
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        if self._transient.pop(key, None) is not None:
+            return
+        self._cache.pop(key, None)
+        self._seq.pop(key, None)
+        self._enqueue(("delete", key))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        key = (session.app_name, session.user_id, session.id)
+        cached = self._transient.get(key) or self._cache.get(key)
+        if cached is not None and cached is not session:
+            # Caller holds a detached copy; keep the cached object in sync
+            cached.events.append(event)
+            cached.state.update(session.state)
+            cached.last_update_time = event.timestamp
+        if key in self._transient:
+            return event
+        seq = self._seq.get(key)
+        if seq is None:
+            stored = await asyncio.to_thread(self._stored_seq, key)
+            seq = self._seq.get(key, stored)
+        self._seq[key] = seq + 1
+        self._enqueue(("event", key, seq, event))
+        with self._pending_cond:
+            self._pending_state[key] = (_persistable_state(session.state), event.timestamp)
+        return event
+
+    # --- ConversationSessionManager hooks -----------------------------------
+
+    def trim_events(self, app_name: str, user_id: str, session_id: str, max_events: int) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        session = self._cache.get(key)
+        if session is None:
+            return self._transient.get(key)
+        events = session.events
+        if max_events > 0 and len(events) > max_events:
+            cut = len(events) - max_events
+            for i in range(cut, len(events)):
+                if getattr(events[i], "author", None) == "user":
+                    cut = i
+                    break
+            del events[:cut]
+            self._enqueue(("trim", key, self._seq.get(key, 0) - len(events)))
+        return session
+
+    def evict(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Drop a session from memory; it stays on disk."""
+        key = (app_name, user_id, session_id)
+        self._cache.pop(key, None)
+        self._seq.pop(key, None)
+
+    # --- persistence ----------------------------------------------------------
+
+    def _cache_put(self, key: _Key, session: Session) -> None:
+        self._cache[key] = session
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            old_key, _ = self._cache.popitem(last=False)
+            self._seq.pop(old_key, None)
+
+    def _stored_seq(self, key: _Key) -> int:
+        """Next event sequence number of a session that is not cached (worker thread)."""
+        self.flush_pending()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT MAX(seq) FROM events WHERE app_name=? AND user_id=? AND session_id=?",
+                key,
+            ).fetchone()
+        return (row[0] + 1) if row and row[0] is not None else 0
+
+    def _load(self, key: _Key) -> Optional[Tuple[Session, int]]:
+        """Read a session and its next event sequence number (worker thread)."""
+        # Reads must observe queued writes for this session
+        self.flush_pending()
+        started = time.perf_counter()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT state, last_update_time FROM sessions WHERE app_name=? AND user_id=? AND id=?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            event_rows = self._conn.execute(
+                "SELECT seq, data FROM events WHERE app_name=? AND user_id=? AND session_id=? ORDER BY seq",
+                key,
+            ).fetchall()
+        events = [Event.model_validate_json(data) for _, data in event_rows]
+        metrics.histogram("session_load_ms").observe((time.perf_counter() - started) * 1000)
+        session = Session(
+            id=key[2],
+            app_name=key[0],
+            user_id=key[1],
+            state=json.loads(row[0]),
+            events=events,
+            last_update_time=row[1],
+        )
+        return session, (event_rows[-1][0] + 1) if event_rows else 0
+
+    def _enqueue(self, op: Tuple[Any, ...]) -> None:
+        with self._pending_cond:
+            self._pending_ops.append(op)
+            self._pending_cond.notify()
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._pending_cond:
+                while not self._pending_ops and not self._closed:
+                    self._pending_cond.wait()
+                closed = self._closed
+            if not closed:
+                # Let the rest of the turn's writes accumulate into one batch
+                time.sleep(self.flush_interval)
+            try:
+                self.flush_pending()
+            except Exception as e:
+                print(f"[Maidel] Session flush failed: {e}", file=sys.stderr)
+            if closed:
+                return
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self.flush_pending)
+
+    def flush_pending(self) -> None:
+        """Write all queued operations in one transaction."""
+        with self._flush_lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        with self._pending_cond:
+            ops, self._pending_ops = self._pending_ops, []
+            states, self._pending_state = self._pending_state, {}
+        if not ops and not states:
+            return
+        started = time.perf_counter()
+        with self._db_lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for op in ops:
+                    kind, key = op[0], op[1]
+                    if kind == "create":
+                        cur.execute(
+                            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                            (*key, json.dumps(op[2], ensure_ascii=False, default=str), op[3]),
+                        )
+                        cur.execute(
+                            "DELETE FROM events WHERE app_name=? AND user_id=? AND session_id=?", key
+                        )
+                    elif kind == "event":
+                        cur.execute(
+                            "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                            (*key, op[2], op[3].model_dump_json(exclude_none=True)),
+                        )
+                    elif kind == "trim":
+                        cur.execute(
+                            "DELETE FROM events WHERE app_name=? AND user_id=? AND session_id=? AND seq < ?",
+                            (*key, op[2]),
+                        )
+                    elif kind == "delete":
+                        cur.execute(
+                            "DELETE FROM sessions WHERE app_name=? AND user_id=? AND id=?", key
+                        )
+                        cur.execute(
+                            "DELETE FROM events WHERE app_name=? AND user_id=? AND session_id=?", key
+                        )
+                        states.pop(key, None)
+                for key, (state, ts) in states.items():
+                    cur.execute(
+                        "UPDATE sessions SET state=?, last_update_time=? WHERE app_name=? AND user_id=? AND id=?",
+                        (json.dumps(state, ensure_ascii=False, default=str), ts, *key),
+                    )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        metrics.counter("session_flushes").inc()
+        metrics.histogram("session_flush_ms").observe((time.perf_counter() - started) * 1000)
+        metrics.histogram("session_flush_batch", (1, 2, 4, 8, 16, 32, 64, 128, 256)).observe(
+            len(ops) + len(states)
+        )
+
+    def close(self) -> None:
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify()
+        self._writer.join(timeout=5)
+        self.flush_pending()
+        with self._db_lock:
+            self._conn.close()
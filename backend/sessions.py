@@ -0,0 +1,223 @@
+"""
+Conversation-scoped session management.
+
+Sessions are reused across turns of the same client-supplied conversation id
+and evicted by LRU/TTL so a long-running desktop process keeps flat memory.
+A session is pinned from ``acquire`` to ``release`` and is never evicted
+while a turn is using it. The number of events retained per session is
+capped after every turn.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from google.adk.sessions import InMemorySessionService
+
+from backend.metrics import metrics
+
+
+APP_NAME = "Maidel2.2"
+USER_ID = "user_001"
+
+MAX_SESSIONS = int(os.getenv("MAIDEL_MAX_SESSIONS", "32"))
+SESSION_TTL_SECONDS = float(os.getenv("MAIDEL_SESSION_TTL", str(6 * 3600)))
+MAX_SESSION_EVENTS = int(os.getenv("MAIDEL_MAX_SESSION_EVENTS", "50"))
+
+# State written afresh by every turn (agent output_keys and plan callbacks);
+# a recovered session must not feed the previous turn's values to the agents
+TURN_STATE_KEYS = (
+    "task_type",
+    "execution_plan",
+    "plan_error",
+    "planner_output_tokens",
+    "step_results",
+    "final_result",
+)
+
+
+def session_id_for(conversation_id: str) -> str:
+    return f"conv-{conversation_id}"
+
+
+def estimate_session_bytes(session: Any) -> int:
+    """Rough resident size of a session: serialized state plus events."""
+    total = 0
+    try:
+        total += len(json.dumps(dict(session.state), ensure_ascii=False, default=str))
+    except Exception:
+        pass
+    for event in getattr(session, "events", None) or []:
+        try:
+            total += len(event.model_dump_json(exclude_none=True))
+        except Exception:
+            total += len(str(event))
+    return total
+
+
+class BoundedInMemorySessionService(InMemorySessionService):
+    """InMemorySessionService that can drop old events from stored sessions."""
+
+    def trim_events(self, app_name: str, user_id: str, session_id: str, max_events: int) -> Optional[Any]:
+        stored = self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+        if stored is None:
+            return None
+        events = stored.events
+        if max_events > 0 and len(events) > max_events:
+            cut = len(events) - max_events
+            # Prefer to start the retained window at a user turn so that
+            # function call/response pairs are never split.
+            for i in range(cut, len(events)):
+                if getattr(events[i], "author", None) == "user":
+                    cut = i
+                    break
+            del events[:cut]
+        return stored
+
+
+@dataclass
+class _Entry:
+    session_id: str
+    last_used: float
+    size_bytes: int = 0
+    # Turns currently using the session; pinned entries are not evicted
+    pins: int = 0
+
+
+class ConversationSessionManager:
+    """Maps conversation ids to ADK sessions with LRU/TTL eviction."""
+
+    def __init__(
+        self,
+        session_service: Any,
+        max_sessions: int = MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_events: int = MAX_SESSION_EVENTS,
+    ) -> None:
+        self.session_service = session_service
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    async def acquire(self, conversation_id: Optional[str]) -> str:
+        """Return the session id for a conversation, creating it if needed.
+
+        Conversation sessions use a deterministic id so a persistent session
+        service can recover them after a restart. Without a conversation id
+        a one-shot session is created; ``release`` deletes it.
+        """
+        await self._evict_expired()
+        if conversation_id is None:
+            session = await self.session_service.create_session(
+                app_name=APP_NAME, user_id=USER_ID, state={}
+            )
+            return session.id
+
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            entry.pins += 1
+            self._entries.move_to_end(conversation_id)
+            return entry.session_id
+
+        session_id = session_id_for(conversation_id)
+        existing = await self.session_service.get_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+        )
+        if existing is not None:
+            # The persistent service hands out its stored object, so the
+            # reset sticks and is written with the next event
+            for key in TURN_STATE_KEYS:
+                existing.state.pop(key, None)
+            metrics.counter("sessions_recovered").inc()
+        else:
+            await self.session_service.create_session(
+                app_name=APP_NAME, user_id=USER_ID, state={}, session_id=session_id
+            )
+            metrics.counter("sessions_created").inc()
+        self._entries[conversation_id] = _Entry(session_id, time.monotonic(), pins=1)
+        await self._evict_lru()
+        self._publish()
+        return session_id
+
+    async def release(self, conversation_id: Optional[str], session_id: str) -> None:
+        """Finish a turn: trim retained events and update memory accounting."""
+        if conversation_id is None:
+            await self._delete(session_id)
+            return
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return
+        entry.pins = max(0, entry.pins - 1)
+        stored = None
+        trim = getattr(self.session_service, "trim_events", None)
+        if trim is not None:
+            stored = trim(APP_NAME, USER_ID, session_id, self.max_events)
+        if stored is None:
+            stored = await self.session_service.get_session(
+                app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+            )
+        if stored is not None:
+            entry.size_bytes = estimate_session_bytes(stored)
+        entry.last_used = time.monotonic()
+        # Sessions kept over the limit while pinned go now
+        await self._evict_lru()
+        self._publish()
+
+    async def _evict_lru(self) -> None:
+        while len(self._entries) > self.max_sessions:
+            old_id = next((cid for cid, e in self._entries.items() if not e.pins), None)
+            if old_id is None:
+                # Every session is in use; evict once their turns finish
+                return
+            await self._evict(old_id, reason="lru")
+
+    async def _evict_expired(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        expired = [
+            cid for cid, e in self._entries.items() if not e.pins and now - e.last_used > self.ttl_seconds
+        ]
+        for cid in expired:
+            await self._evict(cid, reason="ttl")
+        if expired:
+            self._publish()
+
+    async def _evict(self, conversation_id: str, reason: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            return
+        if getattr(self.session_service, "persistent", False):
+            # Keep it on disk, just drop it from memory
+            self.session_service.evict(APP_NAME, USER_ID, entry.session_id)
+        else:
+            await self._delete(entry.session_id)
+        metrics.counter(f"sessions_evicted_{reason}").inc()
+        print(f"[Maidel] Evicted session for {conversation_id} ({reason})", file=sys.stderr)
+
+    async def _delete(self, session_id: str) -> None:
+        try:
+            await self.session_service.delete_session(
+                app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+            )
+        except Exception as e:
+            print(f"[Maidel] Session delete failed: {e}", file=sys.stderr)
+
+    def _publish(self) -> None:
+        metrics.gauge("sessions_active").set(len(self._entries))
+        metrics.gauge("sessions_memory_bytes").set(sum(e.size_bytes for e in self._entries.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._entries),
+            "memory_bytes": sum(e.size_bytes for e in self._entries.values()),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_events": self.max_events,
+        }
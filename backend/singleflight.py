@@ -0,0 +1,102 @@
+"""
+In-flight request coalescing ("singleflight").
+
+Concurrent callers with the same key share one execution: the first caller
+starts it and later callers wait for the same result. Every caller gets its
+own deep copy, so per-request fields such as request_id can be added without
+affecting the others. Nothing is cached; a key is forgotten as soon as its
+execution finishes.
+
+AsyncSingleFlight is for coroutines (MaidelSystem.process_message) and
+SingleFlight for blocking calls made from tool threads (MCP ``calculate``).
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from backend.metrics import metrics
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent coroutine calls by key."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # key -> [shared task, number of callers waiting on it]
+        self._flights: Dict[Hashable, List[Any]] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); ``shared`` is False only for the caller that ran ``fn``.
+
+        The execution runs as its own task, so it survives the caller that
+        started it being cancelled; it is only cancelled once every caller
+        waiting on it has been.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            metrics.counter(f"singleflight_shared.{self.name}").inc()
+        else:
+            task = asyncio.ensure_future(fn())
+            flight = self._flights[key] = [task, 0]
+
+            def forget(_task: asyncio.Future) -> None:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+            task.add_done_callback(forget)
+        flight[1] += 1
+        try:
+            result = await asyncio.shield(flight[0])
+        except asyncio.CancelledError:
+            if not flight[0].done() and flight[1] == 1:
+                flight[0].cancel()
+            raise
+        finally:
+            flight[1] -= 1
+        return copy.deepcopy(result), shared
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe coalescing of blocking calls by key."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if not shared:
+                call = self._calls[key] = _Call()
+        if shared:
+            metrics.counter(f"singleflight_shared.{self.name}").inc()
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result), shared
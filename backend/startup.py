@@ -0,0 +1,36 @@
+"""
+Startup phase timing.
+
+backend.main imports this module first and wraps each startup phase
+(ADK imports, agent construction, runner setup) in ``phase``. ``summary``
+feeds the ``ready`` handshake line, which tells clients how long the
+backend took to become usable and where that time went. Interpreter startup
+before this import is not included; benchmarks.startup_bench measures it
+from outside.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from backend.metrics import metrics
+
+
+_STARTED = time.perf_counter()
+phases: Dict[str, float] = {}
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        phases[name] = round(phases.get(name, 0.0) + elapsed_ms, 1)
+        metrics.gauge(f"startup_ms.{name}").set(phases[name])
+
+
+def summary() -> Dict[str, float]:
+    """Per-phase milliseconds plus ``total`` since backend.main was imported."""
+    return {**phases, "total": round((time.perf_counter() - _STARTED) * 1000, 1)}
@@ -0,0 +1,53 @@
+"""Tests for batch mode input handling and resume (pytest backend/test_batch.py)."""
+
+import asyncio
+import json
+
+from backend.batch import run_batch
+
+
+class EchoMaidel:
+    def __init__(self):
+        self.messages = []
+
+    async def process_message(self, message, include=None, conversation_id=None, priority=None):
+        self.messages.append(message)
+        return {"success": True, "message": message, "response": message.upper()}
+
+
+def run(maidel, tmp_path):
+    return asyncio.run(run_batch(maidel, str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")))
+
+
+def output(tmp_path):
+    lines = (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def test_record_without_message_fails_without_running(tmp_path):
+    (tmp_path / "in.jsonl").write_text('{"message": "a"}\n{"id": 7}\n{"message": ""}\nb\n', encoding="utf-8")
+    maidel = EchoMaidel()
+    summary = run(maidel, tmp_path)
+    assert maidel.messages == ["a", "b"]
+    assert summary["error_types"] == {"missing_input": 2}
+    assert [r["response"]["success"] for r in output(tmp_path)] == [True, False, False, True]
+
+
+def test_resume_drops_output_written_after_the_checkpoint(tmp_path):
+    (tmp_path / "in.jsonl").write_text("a\nb\nc\n", encoding="utf-8")
+    run(EchoMaidel(), tmp_path)
+    ckpt = tmp_path / "out.jsonl.ckpt"
+    lines = ckpt.read_text(encoding="utf-8").splitlines(keepends=True)
+    # Crash after "c" reached the output but while its checkpoint line was being written
+    ckpt.write_text("".join(lines[:-1]) + lines[-1][:2], encoding="utf-8")
+
+    maidel = EchoMaidel()
+    run(maidel, tmp_path)
+    assert maidel.messages == ["c"]
+    assert [r["index"] for r in output(tmp_path)] == [0, 1, 2]
+
+    # Nothing left to do, and the repaired checkpoint still parses
+    maidel = EchoMaidel()
+    run(maidel, tmp_path)
+    assert maidel.messages == []
+    assert [r["index"] for r in output(tmp_path)] == [0, 1, 2]
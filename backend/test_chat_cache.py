@@ -0,0 +1,31 @@
+"""Tests for the small-talk similarity cache (pytest backend/test_chat_cache.py)."""
+
+from backend.chat_cache import ChatCache
+
+GREETING = {"success": True, "task_type": "chat", "execution_plan": [], "result": "こんにちは！"}
+
+
+def test_paraphrase_hits_within_scope():
+    cache = ChatCache(audit_rate=0.0)
+    assert cache.store("こんにちは！", GREETING, scope="a")
+    hit = cache.lookup("こんにちはー", scope="a")
+    assert hit is not None
+    response, match = hit
+    assert response["result"] == "こんにちは！"
+    assert match["similarity"] == 1.0
+
+
+def test_other_conversations_do_not_share_entries():
+    cache = ChatCache(audit_rate=0.0)
+    cache.store("私の名前は？", dict(GREETING, result="たろうさんです"), scope="a")
+    assert cache.lookup("私の名前は？", scope="b") is None
+    assert cache.lookup("私の名前は？") is None
+    assert cache.lookup("私の名前は？", scope="a") is not None
+
+
+def test_digits_and_tasks_never_hit():
+    cache = ChatCache(audit_rate=0.0)
+    cache.store("3時に起きた", GREETING)
+    assert cache.lookup("4時に起きた") is None
+    assert not cache.store("2+3を計算して", GREETING)
+    assert not cache.store("こんばんは", dict(GREETING, task_type="task"))
@@ -0,0 +1,118 @@
+"""Tests for running plan steps as their dependencies finish (pytest backend/test_executor.py)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.agents import executor
+from backend.agents.executor import StepRunner
+from backend.plan import PlanStep
+
+
+def step(step_id, expression, dependencies=()):
+    return PlanStep(
+        step_id=step_id, name=f"s{step_id}", tool="calculator", expression=expression, dependencies=list(dependencies)
+    )
+
+
+@pytest.fixture
+def ran(monkeypatch):
+    """step_ids in the order run_step was called, evaluated locally."""
+    monkeypatch.setenv("USE_MCP", "false")
+    order = []
+    run_step = executor.run_step
+
+    def recording(step, results):
+        order.append(step.step_id)
+        return run_step(step, results)
+
+    monkeypatch.setattr(executor, "run_step", recording)
+    return order
+
+
+def test_steps_run_in_dependency_order_with_results_substituted(ran):
+    async def scenario():
+        runner = StepRunner()
+        runner.add(step(3, "{1} + {2}"))
+        runner.add(step(2, "{1} / 2", [1]))
+        runner.add(step(1, "3 * 4"))
+        results = await runner.join()
+        assert ran == [1, 2, 3]
+        assert results[2] == {"success": True, "result": "6.0", "expression": "12 / 2"}
+        assert results[3]["expression"] == "12 + 6.0"
+        assert results[3]["result"] == "18.0"
+
+    asyncio.run(scenario())
+
+
+def test_step_added_after_its_input_finished_still_runs(ran):
+    async def scenario():
+        runner = StepRunner()
+        runner.add(step(1, "2 + 3"))
+        await runner.join()
+        # The plan is still streaming in
+        runner.add(step(2, "{1} * 10"))
+        runner.add(step(1, "999"))
+        results = await runner.join()
+        assert ran == [1, 2]
+        assert results[2]["result"] == "50"
+
+    asyncio.run(scenario())
+
+
+def test_failed_dependency_skips_the_step(ran):
+    async def scenario():
+        runner = StepRunner()
+        runner.add(step(1, "1 / 0"))
+        runner.add(step(2, "{1} + 1"))
+        runner.add(step(3, "{2} + 1"))
+        results = await runner.join()
+        assert ran == [1]
+        assert not results[1]["success"]
+        assert results[2] == {"success": False, "error": "依存ステップ [1] が失敗しました"}
+        assert results[3] == {"success": False, "error": "依存ステップ [2] が失敗しました"}
+
+    asyncio.run(scenario())
+
+
+def test_join_reports_steps_that_never_ran(ran):
+    async def scenario():
+        runner = StepRunner()
+        runner.add(step(1, "1 + 1"))
+        runner.add(step(2, "{1} + {5}"))
+        results = await runner.join()
+        assert ran == [1]
+        assert results[1]["success"]
+        assert results[2] == {"success": False, "error": "依存ステップ [5] が実行されませんでした"}
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def slow_step(step, results):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return {"success": True, "result": str(step.step_id)}
+
+    monkeypatch.setattr(executor, "run_step", slow_step)
+
+    async def scenario():
+        runner = StepRunner(concurrency=2)
+        for step_id in range(1, 6):
+            runner.add(step(step_id, "1"))
+        results = await runner.join()
+        assert sorted(results) == [1, 2, 3, 4, 5]
+        assert peak == 2
+
+    asyncio.run(scenario())
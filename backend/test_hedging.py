@@ -0,0 +1,119 @@
+"""Tests for hedged and retried LLM calls (pytest backend/test_hedging.py)."""
+
+import asyncio
+from typing import Any, List
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from backend import hedging
+from backend.hedging import HedgedLlm
+from backend.metrics import metrics
+
+
+class ScriptedLlm(BaseLlm):
+    """Answers call n from script[n] = ([(delay, text), ...], error) and records how it ended."""
+
+    model: str = "scripted"
+    script: List[Any] = []
+    outcomes: List[str] = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        chunks, error = self.script[len(self.outcomes)]
+        index = len(self.outcomes)
+        self.outcomes.append("running")
+        try:
+            for delay, text in chunks:
+                await asyncio.sleep(delay)
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), partial=stream)
+            if error is not None:
+                raise error
+            self.outcomes[index] = "done"
+        finally:
+            if self.outcomes[index] == "running":
+                self.outcomes[index] = "failed" if error is not None else "stopped"
+
+
+def hedged_llm(stage, script, credits=3.0):
+    """A HedgedLlm with a 10 ms hedge threshold and ``credits`` to spend."""
+    llm = HedgedLlm(model="scripted", stage=stage, inner=ScriptedLlm(script=script))
+    for _ in range(hedging.HEDGE_MIN_SAMPLES):
+        llm._latency.observe(0.01)
+    llm._budget.credits = credits
+    return llm
+
+
+async def texts(llm, stream):
+    request = LlmRequest(contents=[types.Content(role="user", parts=[types.Part(text="1+2")])])
+    return [r.content.parts[0].text async for r in llm.generate_content_async(request, stream=stream)]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_backup_wins_and_the_loser_is_cancelled(stream):
+    async def scenario():
+        stage = f"test_backup_wins_{stream}"
+        llm = hedged_llm(stage, [([(1.0, "slow")], None), ([(0.0, "fast"), (0.0, "er")], None)])
+        assert await texts(llm, stream) == ["fast", "er"]
+        assert llm.inner.outcomes == ["stopped", "done"]
+        assert metrics.counter(f"llm_hedges.{stage}").value == 1
+        assert metrics.counter(f"llm_hedge_wins.{stage}").value == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_commits_to_the_first_chunk():
+    async def scenario():
+        stage = "test_stream_commits"
+        # The primary yields first but finishes long after the backup would have
+        llm = hedged_llm(stage, [([(0.02, "a"), (0.1, "b")], None), ([(0.025, "x")], None)])
+        assert await texts(llm, True) == ["a", "b"]
+        assert llm.inner.outcomes == ["done", "stopped"]
+        assert metrics.counter(f"llm_hedges.{stage}").value == 1
+        assert metrics.counter(f"llm_hedge_wins.{stage}").value == 0
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_no_hedge_without_budget(stream):
+    async def scenario():
+        stage = f"test_no_budget_{stream}"
+        llm = hedged_llm(stage, [([(0.05, "only")], None)], credits=0.0)
+        assert await texts(llm, stream) == ["only"]
+        assert llm.inner.outcomes == ["done"]
+        assert metrics.counter(f"llm_hedges.{stage}").value == 0
+        assert metrics.counter(f"llm_hedge_skipped.{stage}").value == 1
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_transient_error_is_retried(stream, monkeypatch):
+    monkeypatch.setattr(hedging, "backoff", lambda attempt: 0.0)
+
+    async def scenario():
+        stage = f"test_retry_{stream}"
+        llm = hedged_llm(stage, [([], ConnectionError("reset")), ([(0.0, "ok")], None)])
+        assert await texts(llm, stream) == ["ok"]
+        assert llm.inner.outcomes == ["failed", "done"]
+        assert metrics.counter(f"llm_retries.{stage}").value == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_is_not_retried_after_partial_output(monkeypatch):
+    monkeypatch.setattr(hedging, "backoff", lambda attempt: 0.0)
+
+    async def scenario():
+        stage = "test_no_retry_after_output"
+        llm = hedged_llm(stage, [([(0.0, "part")], ConnectionError("reset")), ([(0.0, "again")], None)])
+        received = []
+        with pytest.raises(ConnectionError):
+            async for response in llm.generate_content_async(LlmRequest(), stream=True):
+                received.append(response.content.parts[0].text)
+        assert received == ["part"]
+        assert llm.inner.outcomes == ["failed"]
+        assert metrics.counter(f"llm_retries.{stage}").value == 0
+
+    asyncio.run(scenario())
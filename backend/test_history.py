@@ -0,0 +1,66 @@
+"""Tests for the history window's rolling summaries (pytest backend/test_history.py)."""
+
+from types import SimpleNamespace
+
+from google.genai import types
+
+from backend.history import HistoryManager, message_text
+
+AGENTS = ["ConversationClassifier", "TaskPlanner", "TaskExecutor"]
+QUOTE_BEGIN = "<<<BEGIN_QUOTED_AGENT_CONTENT>>>"
+QUOTE_END = "<<<END_QUOTED_AGENT_CONTENT>>>"
+PREAMBLE = "For context: below is a transcript of what another agent did, quoted between markers."
+
+
+def user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def seen_by(viewer, author, text):
+    """An agent event as ADK presents it to ``viewer``."""
+    if viewer == author:
+        return types.Content(role="model", parts=[types.Part(text=text)])
+    quoted = f"[{author}] said:\n{QUOTE_BEGIN}\n{text}\n{QUOTE_END}"
+    return types.Content(role="user", parts=[types.Part(text=PREAMBLE), types.Part(text=quoted)])
+
+
+def history_for(viewer, turns):
+    contents = []
+    for turn in range(turns):
+        contents.append(user(f"質問{turn}"))
+        contents.extend(seen_by(viewer, agent, f"{agent}の回答{turn}") for agent in AGENTS)
+    return contents
+
+
+def run_turn(manager, turn):
+    for agent in AGENTS:
+        current = user(f"質問{turn}")
+        request = SimpleNamespace(contents=history_for(agent, turn) + [current])
+        context = SimpleNamespace(session=SimpleNamespace(id="s1"), agent_name=agent, user_content=current)
+        manager.before_model_callback(context, request)
+        for future in list(manager._in_flight.values()):
+            future.result()
+
+
+def test_message_text_unwraps_other_agents():
+    content = seen_by("TaskPlanner", "TaskExecutor", "2 + 3 = 5")
+    assert message_text(content) == "TaskExecutor: 2 + 3 = 5"
+
+
+def test_summary_per_agent_folds_each_turn_once():
+    folded = []
+
+    def summarizer(previous, texts):
+        folded.append(len(texts))
+        return "\n".join(([previous] if previous else []) + [t.splitlines()[0] for t in texts])
+
+    manager = HistoryManager(max_turns=3, budgets={agent: 0 for agent in AGENTS}, summarizer=summarizer)
+    for turn in range(8):
+        run_turn(manager, turn)
+    for agent in AGENTS:
+        fingerprint, summary = manager._summaries[("s1", agent)]
+        # Turns 0..3 fell out of the 3-turn window before turn 7 ran
+        assert summary.splitlines() == [f"質問{t}" for t in range(4)]
+        assert "For context" not in summary
+    # Every older turn is folded once per agent
+    assert sum(folded) == 4 * len(AGENTS)
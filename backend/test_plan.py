@@ -0,0 +1,131 @@
+"""Tests for execution plan parsing and ordering (pytest backend/test_plan.py)."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from backend.plan import (
+    EMPTY_PLAN_JSON,
+    PlanError,
+    PlanStep,
+    PlanStreamParser,
+    parse_plan,
+    topological_order,
+    validate_plan_callback,
+)
+
+PLAN = {
+    "steps": [
+        {"step_id": 3, "name": "合計", "tool": "calculator", "expression": "{1} + {2}"},
+        {"step_id": 1, "name": "積", "tool": "calculator", "expression": "3 * 4"},
+        {"step_id": 2, "name": "商", "tool": "calculator", "expression": "10 / 2", "dependencies": [1]},
+    ]
+}
+
+
+def steps(*specs):
+    return [PlanStep(step_id=step_id, name=f"s{step_id}", dependencies=deps) for step_id, deps in specs]
+
+
+def test_topological_order_follows_dependencies_and_references():
+    order = topological_order(parse_plan(PLAN).steps)
+    assert [step.step_id for step in order] == [1, 2, 3]
+    assert PlanStep(step_id=4, name="x", expression="{2} * {3}", dependencies=[1]).inputs() == {1, 2, 3}
+
+
+def test_topological_order_detects_cycles():
+    with pytest.raises(PlanError, match=r"cycle among steps \[1, 2\]"):
+        topological_order(steps((1, [2]), (2, [1])))
+    with pytest.raises(PlanError, match=r"cycle among steps \[2, 3\]"):
+        topological_order(steps((1, []), (2, [3]), (3, [2, 1])))
+    with pytest.raises(PlanError, match=r"cycle among steps \[1\]"):
+        topological_order(steps((1, [1])))
+
+
+def test_topological_order_rejects_unknown_steps():
+    with pytest.raises(PlanError, match=r"step 2 depends on unknown steps \[5\]"):
+        topological_order(steps((1, []), (2, [1, 5])))
+
+
+def test_parse_plan_accepts_every_planner_shape():
+    assert parse_plan(None).steps == []
+    assert parse_plan("  ").steps == []
+    assert len(parse_plan(json.dumps(PLAN)).steps) == 3
+    assert len(parse_plan(PLAN["steps"]).steps) == 3
+    # Unknown fields are ignored
+    assert parse_plan({"steps": [{"step_id": 1, "name": "a", "note": "x"}], "extra": 1}).steps[0].name == "a"
+
+
+@pytest.mark.parametrize(
+    "raw, message",
+    [
+        ('{"steps": [', "JSONDecodeError"),
+        ("計画はありません", "JSONDecodeError"),
+        ('{"steps": "none"}', "steps"),
+        ('[{"name": "a"}]', "steps.0.step_id"),
+        ('[{"step_id": 0, "name": "a"}]', "steps.0.step_id"),
+        ('[{"step_id": 1}]', "steps.0.name"),
+        ('[{"step_id": 1, "name": "a"}, {"step_id": 1, "name": "b"}]', "duplicate step_id in [1, 1]"),
+        ('[{"step_id": 1, "name": "a", "dependencies": [2]}]', "unknown steps [2]"),
+        ('[{"step_id": 1, "name": "a", "expression": "{1} + 1"}]', "cycle among steps [1]"),
+        ("42", "ExecutionPlan"),
+    ],
+)
+def test_parse_plan_reports_malformed_input(raw, message):
+    with pytest.raises(PlanError) as info:
+        parse_plan(raw)
+    assert message in str(info.value)
+
+
+def feed_in_chunks(text, size):
+    parser = PlanStreamParser()
+    found = []
+    for start in range(0, len(text), size):
+        found.extend(parser.feed(text[start:start + size]))
+    return found
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_stream_parser_yields_each_step_across_chunk_boundaries(size):
+    plan = {
+        "steps": [
+            # Braces, brackets and escaped quotes inside strings are not structure
+            {"step_id": 1, "name": 'say "{hi}" [x]', "tool": "calculator", "expression": "(1 + 2) * 3"},
+            {"step_id": 2, "name": "back\\slash", "args": {"nested": [1, {"deep": True}]}, "dependencies": [1]},
+        ]
+    }
+    text = json.dumps(plan, ensure_ascii=False)
+    found = feed_in_chunks(text, size)
+    assert [step.step_id for step in found] == [1, 2]
+    assert found[0].name == 'say "{hi}" [x]'
+    assert found[1].name == "back\\slash"
+
+
+def test_stream_parser_reports_steps_as_soon_as_they_close():
+    parser = PlanStreamParser()
+    text = json.dumps(PLAN, ensure_ascii=False)
+    first_end = text.index("}, {") + 1
+    assert parser.feed(text[:first_end - 1]) == []
+    assert [step.step_id for step in parser.feed(text[first_end - 1:first_end])] == [3]
+
+
+def test_stream_parser_reads_bare_lists_and_skips_invalid_steps():
+    text = '[{"step_id": 1, "name": "a"}, {"name": "no id"}, {"step_id": 2, "name": "b"}]'
+    assert [step.step_id for step in feed_in_chunks(text, 4)] == [1, 2]
+
+
+def planner_response(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def test_validate_plan_callback_replaces_invalid_plans():
+    context = SimpleNamespace(state={})
+    assert validate_plan_callback(context, planner_response(json.dumps(PLAN))) is None
+    assert context.state["plan_error"] is None
+
+    replaced = validate_plan_callback(context, planner_response('[{"step_id": 1, "name": "a", "dependencies": [1]}]'))
+    assert replaced.content.parts[0].text == EMPTY_PLAN_JSON
+    assert "cycle" in context.state["plan_error"]
@@ -0,0 +1,152 @@
+"""Tests for priority scheduling of pipeline runs (pytest backend/test_scheduler.py)."""
+
+import asyncio
+
+import pytest
+
+from backend.scheduler import Overloaded, Scheduler, guess_class, resolve_class
+
+
+class Turns:
+    """Turns that take a slot, record the grant and hold it until finished."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.granted = []
+        self._done = {}
+        self._tasks = []
+
+    async def start(self, name, cls, conversation=None):
+        self._done[name] = asyncio.Event()
+
+        async def turn():
+            async with self.scheduler.slot(cls, conversation):
+                self.granted.append(name)
+                await self._done[name].wait()
+
+        self._tasks.append(asyncio.ensure_future(turn()))
+        # Let the turn reach the queue
+        await asyncio.sleep(0)
+
+    async def finish(self, name):
+        self._done[name].set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    async def finish_all_in_grant_order(self):
+        finished = 0
+        while finished < len(self._tasks):
+            await self.finish(self.granted[finished])
+            finished += 1
+        await asyncio.gather(*self._tasks)
+
+
+def test_classes_are_served_by_priority():
+    async def scenario():
+        turns = Turns(Scheduler(max_concurrency=1))
+        await turns.start("running", "task")
+        await turns.start("background", "background")
+        await turns.start("task", "task")
+        await turns.start("chat", "chat")
+        assert turns.scheduler.stats()["queue_depth"] == {"chat": 1, "task": 1, "background": 1}
+        await turns.finish_all_in_grant_order()
+        assert turns.granted == ["running", "chat", "task", "background"]
+
+    asyncio.run(scenario())
+
+
+def test_aged_lower_class_turn_goes_first():
+    async def scenario():
+        turns = Turns(Scheduler(max_concurrency=1, aging_seconds=0.05))
+        await turns.start("running", "chat")
+        await turns.start("background", "background")
+        await asyncio.sleep(0.06)
+        await turns.start("chat", "chat")
+        await turns.finish_all_in_grant_order()
+        assert turns.granted == ["running", "background", "chat"]
+
+    asyncio.run(scenario())
+
+
+def test_conversations_take_turns_within_a_class():
+    async def scenario():
+        turns = Turns(Scheduler(max_concurrency=1))
+        await turns.start("running", "chat", "x")
+        await turns.start("a1", "chat", "a")
+        await turns.start("a2", "chat", "a")
+        await turns.start("a3", "chat", "a")
+        await turns.start("b1", "chat", "b")
+        await turns.start("c1", "chat", "c")
+        await turns.finish_all_in_grant_order()
+        assert turns.granted == ["running", "a1", "b1", "c1", "a2", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_busy_conversation_does_not_take_a_second_slot():
+    async def scenario():
+        turns = Turns(Scheduler(max_concurrency=2))
+        await turns.start("a1", "chat", "a")
+        await turns.start("a2", "chat", "a")
+        await turns.start("b1", "chat", "b")
+        # The free slot goes to b; a's next turn waits for its first
+        assert turns.granted == ["a1", "b1"]
+        await turns.finish("a1")
+        assert turns.granted == ["a1", "b1", "a2"]
+        await turns.finish_all_in_grant_order()
+
+    asyncio.run(scenario())
+
+
+def test_full_class_queue_is_rejected():
+    async def scenario():
+        scheduler = Scheduler(max_concurrency=1, queue_limit=1)
+        turns = Turns(scheduler)
+        await turns.start("running", "chat")
+        await turns.start("queued", "chat")
+        with pytest.raises(Overloaded):
+            async with scheduler.slot("chat"):
+                pass
+        # Other classes have their own queues
+        await turns.start("task", "task")
+        assert scheduler.stats()["queue_depth"] == {"chat": 1, "task": 1, "background": 0}
+        await turns.finish_all_in_grant_order()
+        assert scheduler.running == 0
+        assert scheduler.stats()["queue_depth"] == {"chat": 0, "task": 0, "background": 0}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = Scheduler(max_concurrency=1)
+        turns = Turns(scheduler)
+        await turns.start("running", "chat")
+
+        async def waiting():
+            async with scheduler.slot("chat"):
+                pass
+
+        task = asyncio.ensure_future(waiting())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert scheduler.stats()["queue_depth"]["chat"] == 0
+        await turns.finish_all_in_grant_order()
+        assert scheduler.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_guess_class():
+    assert guess_class("1+2は？") == "task"
+    assert guess_class("３×４を求めて") == "task"
+    assert guess_class("sqrt(16)") == "task"
+    assert guess_class("計算して") == "task"
+    assert guess_class("こんにちは") == "chat"
+    assert guess_class("2024年の話をしよう") == "chat"
+    assert guess_class("") == "chat"
+    assert resolve_class("background", "1+2") == "background"
+    assert resolve_class("urgent", "1+2") == "task"
+    assert resolve_class(None, "やあ") == "chat"
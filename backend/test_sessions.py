@@ -0,0 +1,49 @@
+"""Tests for conversation session eviction (pytest backend/test_sessions.py)."""
+
+import asyncio
+
+from google.adk.events import Event, EventActions
+
+from backend.session_store import SqliteSessionService
+from backend.sessions import APP_NAME, USER_ID, BoundedInMemorySessionService, ConversationSessionManager
+
+
+def test_pinned_session_survives_lru_and_ttl():
+    async def scenario():
+        manager = ConversationSessionManager(BoundedInMemorySessionService(), max_sessions=1, ttl_seconds=60)
+        busy = await manager.acquire("busy")
+        # A second conversation over the limit must not evict the running turn
+        other = await manager.acquire("other")
+        assert manager.stats()["active"] == 2
+        manager._entries["busy"].last_used -= 3600
+        await manager._evict_expired()
+        stored = await manager.session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=busy)
+        assert stored is not None
+
+        await manager.release("busy", busy)
+        # Released and over the limit: the least recently used unpinned one goes
+        assert list(manager._entries) == ["other"]
+        await manager.release("other", other)
+
+    asyncio.run(scenario())
+
+
+def test_recovered_session_drops_previous_turn_state(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "sessions.sqlite3"))
+        manager = ConversationSessionManager(service, max_sessions=1)
+        session_id = await manager.acquire("a")
+        session = await service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        await service.append_event(session, Event(
+            author="TaskExecutor",
+            actions=EventActions(state_delta={"final_result": "2", "task_type": "calculation", "name": "Ann"}),
+        ))
+        await manager.release("a", session_id)
+        # Evicting to disk and recovering keeps conversation state only
+        await manager.release("b", await manager.acquire("b"))
+        assert await manager.acquire("a") == session_id
+        recovered = await service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        assert dict(recovered.state) == {"name": "Ann"}
+        service.close()
+
+    asyncio.run(scenario())
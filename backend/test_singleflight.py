@@ -0,0 +1,135 @@
+"""Tests for in-flight request coalescing (pytest backend/test_singleflight.py)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.metrics import metrics
+from backend.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_async_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = AsyncSingleFlight("test")
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        assert calls == 1
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        # Each caller gets its own copy
+        results[0][0]["request_id"] = "a"
+        assert all(result == {"answer": 42} for result, _ in results[1:])
+        assert not flight.in_flight("k")
+
+        # Finished keys are not cached
+        await flight.do("k", fn)
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_async_exception_reaches_every_waiter():
+    async def scenario():
+        flight = AsyncSingleFlight("test")
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError] * 3
+        assert not flight.in_flight("k")
+
+    asyncio.run(scenario())
+
+
+def test_async_execution_survives_its_starter_being_cancelled():
+    async def scenario():
+        flight = AsyncSingleFlight("test")
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == ("done", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+
+def run_threads(flight, fn, count):
+    """Call ``fn`` through ``flight`` from ``count`` threads that all overlap."""
+    started = threading.Event()
+    release = threading.Event()
+    shared = metrics.counter(f"singleflight_shared.{flight.name}")
+    expected = shared.value + count - 1
+    outcomes = []
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def worker():
+        try:
+            outcomes.append(flight.do("k", leader))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    # Hold the leader until every follower is waiting on its call
+    deadline = time.monotonic() + 5
+    while shared.value < expected and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    return outcomes
+
+
+def test_threads_share_one_call():
+    flight = SingleFlight("test_threads_share")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return ["result"]
+
+    outcomes = run_threads(flight, fn, 4)
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+    # Independent copies
+    assert len({id(result) for result, _ in outcomes}) == 4
+    assert all(result == ["result"] for result, _ in outcomes)
+
+
+def test_threads_exception_reaches_every_waiter():
+    flight = SingleFlight("test_threads_error")
+
+    def fn():
+        raise KeyError("missing")
+
+    outcomes = run_threads(flight, fn, 3)
+    assert [type(o) for o in outcomes] == [KeyError] * 3
+    assert flight._calls == {}
@@ -1,86 +1,226 @@
+import os
 import sys
+import itertools
 import json
 import subprocess
 import threading
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from backend import deadline
+from backend.singleflight import SingleFlight
+from backend.tracing import tracer
+
+
+# Upper bound for one JSON-RPC round trip, further capped by the request deadline
+MCP_TIMEOUT = float(os.getenv("MAIDEL_MCP_TIMEOUT", "30"))
+
+# Identical concurrent calculations share one round trip across all clients
+_calculate_flight = SingleFlight("mcp_calculate")
 
 
 class SimpleMCPClient:
-    """Minimal JSON-RPC client for the calculator MCP server over stdio."""
+    """Minimal JSON-RPC client for one MCP server over stdio.
 
-    def __init__(self, command: Optional[str] = None) -> None:
-        self.command = command or f"{sys.executable} -m mcp_tools.calculator"
+    ``command`` is an argv list, or a shell command line. Without one the
+    calculator server declared in backend.tools.registry is used.
+    """
+
+    def __init__(
+        self,
+        command: Optional[Union[str, Sequence[str]]] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> None:
+        if command is None:
+            from backend.tools.registry import load_specs
+
+            spec = load_specs()["calculator"]
+            command, env = spec.command, dict(spec.process_env(), **(env or {}))
+        self.command = command if isinstance(command, str) else list(command)
+        self.label = command if isinstance(command, str) else " ".join(command)
+        self.env = env
         self.process: Optional[subprocess.Popen] = None
         self.lock = threading.Lock()
+        self._ids = itertools.count(10)
+        self.last_used = time.monotonic()
+        self.on_spawn: Optional[Callable[[], None]] = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
 
     def start(self) -> None:
         if self.process is not None and self.process.poll() is None:
             return
-        self.process = subprocess.Popen(
-            self.command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
-            text=True,
-            encoding="utf-8",
-            bufsize=1,
-        )
-        # initialize
-        _ = self.request({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
-
-    def stop(self) -> None:
-        if self.process is not None:
+        # The cassette module pulls in ADK; it is only needed once a server is used
+        from backend.cassette import REPLAY, active_cassette
+
+        cassette = active_cassette()
+        if cassette is not None and cassette.mode == REPLAY:
+            # Replayed traffic never needs a live server
+            return
+        with tracer.span("mcp spawn", command=self.label):
+            if self.on_spawn is not None:
+                self.on_spawn()
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                shell=isinstance(self.command, str),
+                env=dict(os.environ, **self.env) if self.env else None,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+            # initialize
+            _ = self.request({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+
+    def stop(self, grace: float = 2.0) -> None:
+        """Close stdin so the server can flush and exit; terminate it after ``grace`` seconds."""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=grace)
+        except Exception:
             try:
-                self.process.terminate()
+                process.terminate()
             except Exception:
                 pass
-            self.process = None
 
     def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with tracer.span(f"mcp rpc {payload.get('method')}") as span:
+            # Propagate trace context to the server via params._meta
+            params = dict(payload.get("params") or {})
+            params["_meta"] = dict(params.get("_meta") or {}, traceparent=span.traceparent)
+            payload = dict(payload, params=params)
+            from backend.cassette import REPLAY, active_cassette, request_key
+
+            cassette = active_cassette()
+            if cassette is None:
+                return self._request(payload)
+            method = str(payload.get("method"))
+            key = request_key("mcp", method, payload)
+            if cassette.mode == REPLAY:
+                entry = cassette.take("mcp", method, key)
+                if entry is None:
+                    return {"error": "cassette_miss"}
+                for wait in cassette.delays(entry):
+                    time.sleep(wait)
+                return entry["responses"][0]
+            started = time.perf_counter()
+            response = self._request(payload)
+            cassette.record("mcp", method, key, payload, [response], [(time.perf_counter() - started) * 1000])
+            return response
+
+    def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         if not self.process or not self.process.stdin or not self.process.stdout:
             raise RuntimeError("MCP server not started")
+        timeout = MCP_TIMEOUT
+        left = deadline.remaining()
+        if left is not None:
+            if left <= 0:
+                return {"error": "deadline_exceeded"}
+            timeout = min(timeout, left) if timeout else left
         data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
         headers = f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("ascii")
         with self.lock:
-            self.process.stdin.buffer.write(headers)
-            self.process.stdin.buffer.write(data)
-            self.process.stdin.buffer.flush()
-            # Read headers
-            content_length = None
-            while True:
-                line = self.process.stdout.buffer.readline()
-                if not line:
+            process = self.process
+            if not timeout:
+                return self._exchange(process, headers, data)
+            # The exchange runs on a helper thread so a stuck server cannot
+            # block past the deadline; on timeout the server is killed and
+            # the next call spawns a fresh one.
+            result: Dict[str, Any] = {}
+
+            def exchange() -> None:
+                try:
+                    result.update(self._exchange(process, headers, data))
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+
+            worker = threading.Thread(target=exchange, daemon=True)
+            worker.start()
+            worker.join(timeout)
+            if worker.is_alive():
+                print(f"[MCP] No response within {timeout:.1f}s; stopping {self.label}", file=sys.stderr)
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+                if self.process is process:
+                    self.process = None
+                return {"error": "timeout"}
+            return result
+
+    def _exchange(self, process: subprocess.Popen, headers: bytes, data: bytes) -> Dict[str, Any]:
+        try:
+            process.stdin.buffer.write(headers)
+            process.stdin.buffer.write(data)
+            process.stdin.buffer.flush()
+        except BrokenPipeError:
+            return {"error": "server_exited"}
+        # Read headers
+        content_length = None
+        while True:
+            line = process.stdout.buffer.readline()
+            if not line:
+                # stdout closes just before the process is reaped; "timeout"
+                # is reserved for the deadline path in _request
+                try:
+                    process.wait(timeout=0.5)
+                except subprocess.TimeoutExpired:
                     return {"error": "eof"}
-                if line in (b"\r\n", b"\n"):
-                    break
+                return {"error": "server_exited"}
+            if line in (b"\r\n", b"\n"):
+                break
+            try:
+                header = line.decode("utf-8").strip()
+            except Exception:
+                header = ""
+            if header.lower().startswith("content-length:"):
                 try:
-                    header = line.decode("utf-8").strip()
+                    content_length = int(header.split(":", 1)[1].strip())
                 except Exception:
-                    header = ""
-                if header.lower().startswith("content-length:"):
-                    try:
-                        content_length = int(header.split(":", 1)[1].strip())
-                    except Exception:
-                        content_length = None
-            if content_length is None:
-                return {"error": "missing_content_length"}
-            body = self.process.stdout.buffer.read(content_length)
+                    content_length = None
+        if content_length is None:
+            return {"error": "missing_content_length"}
+        body = process.stdout.buffer.read(content_length)
         try:
             return json.loads(body.decode("utf-8"))
         except Exception as e:
             return {"error": f"invalid_response: {e}", "raw": body.decode('utf-8', 'ignore')}
 
+    def list_tools(self) -> Optional[List[Dict[str, Any]]]:
+        """The server's tool descriptions, or None if it did not answer."""
+        if not self.process:
+            self.start()
+        resp = self.request({"jsonrpc": "2.0", "id": next(self._ids), "method": "tools/list", "params": {}})
+        tools = (resp.get("result") or {}).get("tools")
+        return tools if isinstance(tools, list) else None
+
     def calculate(self, expression: str) -> Dict[str, Any]:
+        result, _ = _calculate_flight.do((self.label, expression.strip()), lambda: self._calculate(expression))
+        return result
+
+    def _calculate(self, expression: str) -> Dict[str, Any]:
+        return self.call_tool("calculate", {"expression": expression})
+
+    def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """tools/call, unwrapped to the JSON object the tool returned."""
         if not self.process:
             self.start()
         req = {
             "jsonrpc": "2.0",
-            "id": 10,
+            "id": next(self._ids),
             "method": "tools/call",
-            "params": {"name": "calculate", "arguments": {"expression": expression}},
+            "params": {"name": name, "arguments": arguments},
         }
         resp = self.request(req)
+        if "result" not in resp and isinstance(resp.get("error"), str):
+            return {"success": False, "error": f"mcp_{resp['error']}"}
         # Unwrap content
         try:
             result = resp.get("result", resp)
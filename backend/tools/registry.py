@@ -0,0 +1,272 @@
+"""
+MCP server registry - 宣言的なツールサーバー定義
+
+Each MCP tool server is declared once, with its command, extra env, the
+tools it provides, how many processes may serve calls at the same time and
+how long an unused process stays up. Settings are read, in increasing
+precedence, from:
+
+1. DEFAULT_SERVERS below
+2. config/mcp_servers.yaml (or .json), or the file named by
+   MAIDEL_MCP_CONFIG
+
+Nothing is spawned at startup. The first call to one of a server's tools
+starts a process; it stays warm while calls keep coming and is stopped once
+it has been idle for ``idle_timeout`` seconds. Up to ``max_concurrency``
+processes serve one server in parallel; further calls wait for a free one.
+A declared server that is never used costs neither startup time nor memory.
+
+``"{python}"`` in a command is replaced by the running interpreter.
+"""
+
+import copy
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend.agents.factory import PROJECT_ROOT, _read_file
+from backend.metrics import metrics
+from backend.tools.mcp_client import SimpleMCPClient
+
+
+DEFAULT_CONFIG_PATH = os.path.join(PROJECT_ROOT, "config", "mcp_servers.yaml")
+
+DEFAULT_SERVERS: Dict[str, Dict[str, Any]] = {
+    "calculator": {
+        "command": ["{python}", "-m", "mcp_tools.calculator"],
+        "tools": ["calculate", "get_supported_functions"],
+        "max_concurrency": 2,
+        "idle_timeout": 300,
+    },
+    "memory": {
+        "command": ["{python}", "-m", "mcp_tools.memory"],
+        "tools": ["remember", "recall", "forget", "memory_stats"],
+        # One writer per database
+        "max_concurrency": 1,
+        "idle_timeout": 120,
+    },
+}
+
+# How often the reaper looks for idle processes, at most
+REAP_INTERVAL = 5.0
+
+
+@dataclass
+class MCPServerSpec:
+    name: str
+    command: List[str]
+    env: Dict[str, str] = field(default_factory=dict)
+    tools: List[str] = field(default_factory=list)
+    max_concurrency: int = 1
+    idle_timeout: float = 300.0
+
+    def process_env(self) -> Dict[str, str]:
+        """Env for the server process: UTF-8 stdio and the project on PYTHONPATH."""
+        env = {"PYTHONIOENCODING": "utf-8", "PYTHONPATH": PROJECT_ROOT}
+        env.update(self.env)
+        return env
+
+
+def _spec(name: str, settings: Dict[str, Any]) -> MCPServerSpec:
+    command = settings.get("command") or []
+    if isinstance(command, str):
+        command = command.split()
+    return MCPServerSpec(
+        name=name,
+        command=[sys.executable if part == "{python}" else str(part) for part in command],
+        env={k: str(v) for k, v in (settings.get("env") or {}).items()},
+        tools=list(settings.get("tools") or []),
+        max_concurrency=max(1, int(settings.get("max_concurrency") or 1)),
+        idle_timeout=float(settings.get("idle_timeout") or 0),
+    )
+
+
+def load_specs(path: Optional[str] = None) -> Dict[str, MCPServerSpec]:
+    """Server specs by name (defaults < file); a file entry may also add servers."""
+    servers = copy.deepcopy(DEFAULT_SERVERS)
+    path = path or os.getenv("MAIDEL_MCP_CONFIG") or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        for name, settings in ((_read_file(path) or {}).get("servers") or {}).items():
+            if isinstance(settings, dict):
+                servers.setdefault(name, {}).update(settings)
+    elif os.getenv("MAIDEL_MCP_CONFIG"):
+        print(f"[Maidel] MCP config not found: {path}", file=sys.stderr)
+    return {name: _spec(name, settings) for name, settings in servers.items() if settings.get("command")}
+
+
+class _ServerPool:
+    """Processes of one server; idle ones are reused newest first."""
+
+    def __init__(self, spec: MCPServerSpec) -> None:
+        self.spec = spec
+        self._slots = threading.BoundedSemaphore(spec.max_concurrency)
+        self._lock = threading.Lock()
+        self._idle: List[SimpleMCPClient] = []
+        self._busy = 0
+        self._tools: Optional[List[Dict[str, Any]]] = None
+        self.calls = 0
+
+    def _new_client(self) -> SimpleMCPClient:
+        client = SimpleMCPClient(self.spec.command, env=self.spec.process_env())
+        client.on_spawn = lambda: metrics.counter(f"mcp_spawns.{self.spec.name}").inc()
+        return client
+
+    @contextmanager
+    def lease(self) -> Iterator[SimpleMCPClient]:
+        self._slots.acquire()
+        with self._lock:
+            client = self._idle.pop() if self._idle else self._new_client()
+            self._busy += 1
+            self.calls += 1
+        try:
+            yield client
+        finally:
+            client.last_used = time.monotonic()
+            with self._lock:
+                self._busy -= 1
+                # A client whose server was killed (timeout) is dropped
+                if client.running:
+                    self._idle.append(client)
+            self._slots.release()
+
+    def reap(self, now: float) -> int:
+        """Stop processes idle for longer than idle_timeout; returns how many."""
+        if self.spec.idle_timeout <= 0:
+            return 0
+        with self._lock:
+            stale = [c for c in self._idle if now - c.last_used >= self.spec.idle_timeout]
+            self._idle = [c for c in self._idle if c not in stale]
+        for client in stale:
+            client.stop()
+        if stale:
+            metrics.counter(f"mcp_idle_stops.{self.spec.name}").inc(len(stale))
+        return len(stale)
+
+    def list_tools(self) -> List[Dict[str, Any]]:
+        """The server's tools/list result, fetched once per registry."""
+        if self._tools is None:
+            with self.lease() as client:
+                tools = client.list_tools()
+            if tools is not None:
+                self._tools = tools
+        return list(self._tools or [])
+
+    def running(self) -> int:
+        with self._lock:
+            return self._busy + sum(1 for c in self._idle if c.running)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client in idle:
+            client.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tools": list(self.spec.tools),
+            "running": self.running(),
+            "busy": self._busy,
+            "calls": self.calls,
+            "spawns": int(metrics.counter(f"mcp_spawns.{self.spec.name}").value),
+            "idle_stops": int(metrics.counter(f"mcp_idle_stops.{self.spec.name}").value),
+            "max_concurrency": self.spec.max_concurrency,
+            "idle_timeout": self.spec.idle_timeout,
+        }
+
+
+class MCPRegistry:
+    """Lazily started MCP servers, looked up by server or tool name."""
+
+    def __init__(self, specs: Dict[str, MCPServerSpec]) -> None:
+        self.specs = specs
+        self._pools: Dict[str, _ServerPool] = {}
+        self._by_tool = {tool: spec.name for spec in specs.values() for tool in spec.tools}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+    def server_for(self, tool: str) -> Optional[str]:
+        return self._by_tool.get(tool)
+
+    def _pool(self, server: str) -> _ServerPool:
+        with self._lock:
+            pool = self._pools.get(server)
+            if pool is None:
+                if server not in self.specs:
+                    raise KeyError(f"unknown MCP server: {server}")
+                pool = self._pools[server] = _ServerPool(self.specs[server])
+            if self._reaper is None and pool.spec.idle_timeout > 0:
+                self._reaper = threading.Thread(target=self._reap_loop, name="mcp-reaper", daemon=True)
+                self._reaper.start()
+            return pool
+
+    @contextmanager
+    def client(self, server: str) -> Iterator[SimpleMCPClient]:
+        """A client of ``server`` for exclusive use; the process starts on first request."""
+        with self._pool(server).lease() as client:
+            yield client
+
+    def call_tool(self, tool: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Call ``tool`` on whichever server declares it."""
+        server = self.server_for(tool)
+        if server is None:
+            return {"success": False, "error": f"unknown_tool: {tool}"}
+        with self.client(server) as client:
+            return client.call_tool(tool, arguments)
+
+    def list_tools(self, server: str) -> List[Dict[str, Any]]:
+        return self._pool(server).list_tools()
+
+    def _reap_loop(self) -> None:
+        interval = min([REAP_INTERVAL] + [s.idle_timeout / 4 for s in self.specs.values() if s.idle_timeout > 0])
+        while not self._closed.wait(max(0.05, interval)):
+            now = time.monotonic()
+            with self._lock:
+                pools = list(self._pools.values())
+            for pool in pools:
+                pool.reap(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pools = dict(self._pools)
+        return {
+            name: pools[name].stats() if name in pools else {"tools": list(spec.tools), "running": 0, "calls": 0}
+            for name, spec in self.specs.items()
+        }
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+
+_lock = threading.Lock()
+_registry: Optional[MCPRegistry] = None
+
+
+def get_registry() -> MCPRegistry:
+    """The process-wide registry, loaded on first use."""
+    global _registry
+    with _lock:
+        if _registry is None:
+            _registry = MCPRegistry(load_specs())
+        return _registry
+
+
+def loaded() -> Optional[MCPRegistry]:
+    """The registry if anything has used it, without creating it."""
+    return _registry
+
+
+def shutdown() -> None:
+    global _registry
+    with _lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        registry.close()
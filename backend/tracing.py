@@ -0,0 +1,251 @@
+"""
+Per-stage latency tracing.
+
+Spans follow the OpenTelemetry data model (trace/span ids, parent id, start
+and end in Unix nanoseconds, attributes, status) and are exported one JSON
+object per line to MAIDEL_TRACE_FILE when set. Context is propagated to MCP
+servers as a W3C ``traceparent`` string.
+
+Instrumentation points:
+- process_message (root span)
+- each sub-agent (before/after_agent_callback)
+- each LLM request (before/after_model_callback)
+- tool functions (``traced`` decorator)
+- each MCP JSON-RPC call (SimpleMCPClient)
+"""
+
+import contextvars
+import functools
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.metrics import metrics
+
+
+TRACE_FILE = os.getenv("MAIDEL_TRACE_FILE", "")
+SERVICE_NAME = "maidel-backend"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Return (trace_id, parent_span_id) from a W3C traceparent header."""
+    if not value:
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("maidel_span", default=None)
+
+
+class Tracer:
+    """Creates spans, exports them as JSONL and keeps per-trace summaries."""
+
+    def __init__(self, path: str = TRACE_FILE) -> None:
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        # Finished spans per active root trace (for response timing summaries)
+        self._collected: Dict[str, List[Span]] = {}
+        # Spans opened in one ADK callback and closed in another
+        self._open: Dict[Tuple[str, ...], Tuple[Span, contextvars.Token]] = {}
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    def start(self, name: str, parent: Optional[Span] = None, traceparent: Optional[str] = None, **attributes: Any) -> Span:
+        parent = parent or _current.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            remote = parse_traceparent(traceparent)
+            trace_id, parent_id = remote if remote else (secrets.token_hex(16), None)
+        return Span(name, trace_id, parent_id, attributes)
+
+    def end(self, span: Span, error: Optional[str] = None) -> None:
+        span.end_ns = time.time_ns()
+        span.error = error
+        metrics.histogram("span_ms." + span.name.replace(" ", ".")).observe(span.duration_ms)
+        with self._lock:
+            collected = self._collected.get(span.trace_id)
+            if collected is not None:
+                collected.append(span)
+            if self.path:
+                try:
+                    if self._file is None:
+                        self._file = open(self.path, "a", encoding="utf-8")
+                    self._file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                    self._file.flush()
+                except Exception as e:
+                    print(f"[Maidel] Trace export failed: {e}", file=sys.stderr)
+                    self.path = ""
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = self.start(name, **attributes)
+        token = _current.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            self.end(span, error)
+
+    @contextmanager
+    def root(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Root span whose descendants are collected for ``summary``."""
+        # A root never inherits an ambient span
+        span = Span(name, secrets.token_hex(16), None, attributes)
+        with self._lock:
+            self._collected[span.trace_id] = []
+        token = _current.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            # Spans left open by an agent that raised before its after-callback
+            for key, (open_span, _) in list(self._open.items()):
+                if open_span.trace_id == span.trace_id:
+                    self._open.pop(key, None)
+                    self.end(open_span, "unfinished")
+            self.end(span, error)
+
+    def summary(self, trace_id: str) -> Dict[str, float]:
+        """Total milliseconds per span name for a finished root trace."""
+        with self._lock:
+            spans = self._collected.pop(trace_id, [])
+        totals: Dict[str, float] = {}
+        for span in spans:
+            totals[span.name] = round(totals.get(span.name, 0.0) + span.duration_ms, 3)
+        return totals
+
+    # --- ADK callbacks -------------------------------------------------------
+
+    def _open_span(self, key: Tuple[str, ...], name: str, parent: Optional[Span], **attributes: Any) -> None:
+        span = self.start(name, parent=parent, **attributes)
+        token = _current.set(span)
+        self._open[key] = (span, token)
+
+    def _close_span(self, key: Tuple[str, ...], error: Optional[str] = None) -> None:
+        entry = self._open.pop(key, None)
+        if entry is None:
+            return
+        span, token = entry
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from a different context than it was opened in
+            pass
+        self.end(span, error)
+
+    def before_agent_callback(self, callback_context: Any) -> None:
+        key = ("agent", callback_context.invocation_id, callback_context.agent_name)
+        self._open_span(key, f"agent {callback_context.agent_name}", None)
+        return None
+
+    def after_agent_callback(self, callback_context: Any) -> None:
+        self._close_span(("agent", callback_context.invocation_id, callback_context.agent_name))
+        return None
+
+    def before_model_callback(self, callback_context: Any, llm_request: Any) -> None:
+        agent_key = ("agent", callback_context.invocation_id, callback_context.agent_name)
+        parent = self._open.get(agent_key, (None, None))[0]
+        self._open_span(
+            ("llm", callback_context.invocation_id, callback_context.agent_name),
+            f"llm {callback_context.agent_name}",
+            parent,
+            model=getattr(llm_request, "model", None),
+            contents=len(getattr(llm_request, "contents", None) or []),
+        )
+        return None
+
+    def after_model_callback(self, callback_context: Any, llm_response: Any) -> None:
+        if getattr(llm_response, "partial", False):
+            return None
+        key = ("llm", callback_context.invocation_id, callback_context.agent_name)
+        entry = self._open.get(key)
+        usage = getattr(llm_response, "usage_metadata", None)
+        if entry is not None and usage is not None:
+            entry[0].attributes["input_tokens"] = getattr(usage, "prompt_token_count", None)
+            entry[0].attributes["output_tokens"] = getattr(usage, "candidates_token_count", None)
+        self._close_span(key, getattr(llm_response, "error_message", None))
+        return None
+
+    def attach(self, agent: Any) -> None:
+        """Register the span callbacks on an LlmAgent."""
+        from backend.agents.hooks import add_callback
+
+        add_callback(agent, "before_agent_callback", self.before_agent_callback)
+        add_callback(agent, "after_agent_callback", self.after_agent_callback)
+        add_callback(agent, "before_model_callback", self.before_model_callback)
+        # Ahead of callbacks that may replace the response (and end the chain)
+        add_callback(agent, "after_model_callback", self.after_model_callback, first=True)
+
+
+tracer = Tracer()
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator wrapping a (sync) function call in a span.
+
+    functools.wraps keeps the signature visible to ADK's FunctionTool.
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
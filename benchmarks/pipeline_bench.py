@@ -0,0 +1,263 @@
+"""
+End-to-end pipeline benchmark with the local stub model.
+
+Runs MaidelSystem over a corpus of chat and task messages with StubLlm in
+place of Gemini and reports p50/p95/p99 latency, throughput, RSS and a
+per-stage breakdown (from the tracing spans).
+
+Usage:
+    python -m benchmarks.pipeline_bench --iterations 5 --concurrency 4
+    python -m benchmarks.pipeline_bench --save-baseline bench_baseline.json
+    python -m benchmarks.pipeline_bench --baseline bench_baseline.json --threshold 0.1
+    python -m benchmarks.pipeline_bench --classifier-ms 50 --tail-ms 1000 --tail-prob 0.05 --no-hedge
+    python -m benchmarks.pipeline_bench --classifier-ms 50 --planner-ms 80 --tail-ms 1000 --tail-prob 0.05 --no-plan-streaming
+    python -m benchmarks.pipeline_bench --planner-ms 400 --executor-ms 150 --no-plan-streaming
+    python -m benchmarks.pipeline_bench --classifier-ms 50 --executor-ms 150 --chat-cache
+
+The planner is only hedged with --no-plan-streaming (streamed calls are never
+hedged); the report lists the stages that were.
+
+With --baseline the exit code is 1 when p50/p95 or any stage regressed by
+more than the threshold.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus.jsonl")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size in MiB (None where unsupported)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return None
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def run_benchmark(
+    corpus: List[Dict[str, Any]],
+    iterations: int,
+    concurrency: int,
+    latency_ms: Dict[str, float],
+    jitter_ms: float,
+    warmup: int = 1,
+    tail_ms: float = 0.0,
+    tail_probability: float = 0.0,
+    error_rate: float = 0.0,
+) -> Dict[str, Any]:
+    from benchmarks.stub_llm import install_stub_models
+
+    install_stub_models(latency_ms, jitter_ms, tail_ms=tail_ms, tail_probability=tail_probability, error_rate=error_rate)
+    from backend import hedging
+    from backend.main import MaidelSystem
+    from backend.metrics import metrics
+
+    maidel = MaidelSystem()
+    hedged = hedging.hedged_agents(maidel.maidel_system.sub_agents)
+    for item in corpus[:warmup]:
+        await maidel.process_message(item["message"])
+
+    rss_before = rss_mb()
+    latencies: Dict[str, List[float]] = {"all": [], "chat": [], "task": []}
+    stages: Dict[str, List[float]] = {}
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, item: Dict[str, Any]) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            response = await maidel.process_message(
+                item["message"], include=["timings"], conversation_id=f"bench-{i % concurrency}"
+            )
+            elapsed = (time.perf_counter() - started) * 1000
+        if not response.get("success"):
+            failures += 1
+        latencies["all"].append(elapsed)
+        latencies.setdefault(item.get("kind", "other"), []).append(elapsed)
+        for name, ms in (response.get("timings") or {}).items():
+            stages.setdefault(name, []).append(ms)
+
+    jobs = [item for _ in range(iterations) for item in corpus]
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i, item) for i, item in enumerate(jobs)))
+    wall = time.perf_counter() - started
+    maidel.close()
+
+    def summarize(values: List[float]) -> Dict[str, float]:
+        return {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+        }
+
+    return {
+        "config": {
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms,
+            "tail_ms": tail_ms,
+            "tail_probability": tail_probability,
+            "error_rate": error_rate,
+            "corpus_size": len(corpus),
+            "hedged": hedged,
+        },
+        "latency_ms": {kind: summarize(values) for kind, values in latencies.items() if values},
+        "throughput_rps": round(len(jobs) / wall, 3) if wall else 0.0,
+        "failures": failures,
+        "rss_mb": {"before": rss_before, "after": rss_mb()},
+        "stages_ms": {name: summarize(values) for name, values in sorted(stages.items())},
+        "llm": {
+            name: value
+            for name, value in sorted(metrics.snapshot().items())
+            if name.startswith(("llm_hedge", "llm_retries", "plan_steps_streamed", "chat_cache"))
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Return human-readable regressions beyond ``threshold`` (fractional)."""
+    regressions = []
+
+    def check(label: str, now: float, before: float) -> None:
+        # Ignore sub-millisecond noise
+        if before > 0 and now - before > max(before * threshold, 1.0):
+            regressions.append(f"{label}: {before:.1f} -> {now:.1f} ms (+{(now / before - 1) * 100:.0f}%)")
+
+    for pct in ("p50", "p95"):
+        check(f"latency.all.{pct}", current["latency_ms"]["all"][pct], baseline["latency_ms"]["all"][pct])
+    for name, stats in current.get("stages_ms", {}).items():
+        before = baseline.get("stages_ms", {}).get(name)
+        if before:
+            check(f"stage[{name}].p50", stats["p50"], before["p50"])
+    before_tp = baseline.get("throughput_rps", 0)
+    if before_tp and current["throughput_rps"] < before_tp * (1 - threshold):
+        regressions.append(f"throughput: {before_tp:.2f} -> {current['throughput_rps']:.2f} rps")
+    return regressions
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print("=" * 60)
+    print("Maidel 2.2 pipeline benchmark (stub model)")
+    print("-" * 60)
+    for kind, stats in result["latency_ms"].items():
+        print(f"{kind:>6}: n={stats['count']:<4} p50={stats['p50']:8.2f}  p95={stats['p95']:8.2f}  p99={stats['p99']:8.2f} ms")
+    print(f"throughput: {result['throughput_rps']:.2f} msg/s   failures: {result['failures']}")
+    print(f"hedged: {', '.join(result['config'].get('hedged') or []) or 'none'}")
+    if result.get("llm"):
+        print("llm: " + "  ".join(f"{name}={value:g}" for name, value in result["llm"].items()))
+    rss = result["rss_mb"]
+    if rss["after"] is not None:
+        print(f"rss: {rss['before']:.1f} -> {rss['after']:.1f} MiB")
+    print("-" * 60)
+    for name, stats in result["stages_ms"].items():
+        print(f"{name:<32} p50={stats['p50']:8.2f}  p95={stats['p95']:8.2f} ms")
+    print("=" * 60)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--classifier-ms", type=float, default=0.0, help="stub latency for ConversationClassifier")
+    parser.add_argument("--planner-ms", type=float, default=0.0, help="stub latency for TaskPlanner")
+    parser.add_argument("--executor-ms", type=float, default=0.0, help="stub latency per TaskExecutor call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--tail-ms", type=float, default=0.0, help="extra stub latency for slow-tail calls")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="probability of a slow-tail call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a transient stub error")
+    parser.add_argument("--no-hedge", action="store_true", help="disable LLM hedging (MAIDEL_HEDGE=false)")
+    parser.add_argument(
+        "--no-plan-streaming", action="store_true", help="wait for the whole plan (MAIDEL_PLAN_STREAMING=false)"
+    )
+    parser.add_argument(
+        "--chat-cache", action="store_true", help="answer repeated small talk from the cache (MAIDEL_CHAT_CACHE=true)"
+    )
+    parser.add_argument("--json", action="store_true", help="print the raw result as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed fractional regression")
+    args = parser.parse_args()
+    if args.no_hedge:
+        os.environ["MAIDEL_HEDGE"] = "false"
+    if args.chat_cache:
+        os.environ["MAIDEL_CHAT_CACHE"] = "true"
+    if args.no_plan_streaming:
+        os.environ["MAIDEL_PLAN_STREAMING"] = "false"
+
+    latency = {
+        "ConversationClassifier": args.classifier_ms,
+        "TaskPlanner": args.planner_ms,
+        "TaskExecutor": args.executor_ms,
+    }
+    result = asyncio.run(
+        run_benchmark(
+            load_corpus(args.corpus),
+            args.iterations,
+            args.concurrency,
+            latency,
+            args.jitter_ms,
+            tail_ms=args.tail_ms,
+            tail_probability=args.tail_prob,
+            error_rate=args.error_rate,
+        )
+    )
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("no regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
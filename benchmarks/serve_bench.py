@@ -0,0 +1,88 @@
+"""
+Localhost load driver for ``--serve`` mode.
+
+Opens several WebSocket clients against a running server, each keeping one
+conversation and several requests in flight, and reports latency, throughput
+and how conversations were spread over the workers.
+
+Usage:
+    MAIDEL_STUB_LATENCY_MS=50 python -m backend.main --serve --workers 4 \\
+        --worker-module benchmarks.stub_llm &
+    python -m benchmarks.serve_bench --clients 8 --iterations 3
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.pipeline_bench import DEFAULT_CORPUS, load_corpus, percentile
+
+
+async def run_client(url: str, client: int, corpus: List[Dict[str, Any]], iterations: int, stream: bool) -> List[Dict[str, Any]]:
+    from websockets.asyncio.client import connect
+
+    results: List[Dict[str, Any]] = []
+    async with connect(url, max_size=None) as ws:
+        started: Dict[str, float] = {}
+        events: Counter = Counter()
+        for i, item in enumerate(item for _ in range(iterations) for item in corpus):
+            request_id = f"c{client}-{i}"
+            started[request_id] = time.perf_counter()
+            await ws.send(json.dumps({
+                "request_id": request_id,
+                "message": item["message"],
+                "conversation_id": f"bench-client-{client}",
+                "stream": stream,
+            }, ensure_ascii=False))
+        while started:
+            payload = json.loads(await ws.recv())
+            request_id = payload.get("request_id")
+            if payload.get("type") == "event":
+                events[request_id] += 1
+                continue
+            elapsed = (time.perf_counter() - started.pop(request_id)) * 1000
+            results.append({
+                "elapsed_ms": elapsed,
+                "success": bool(payload.get("success")),
+                "worker": payload.get("worker"),
+                "events": events.pop(request_id, 0),
+            })
+    return results
+
+
+async def run(url: str, clients: int, iterations: int, corpus: List[Dict[str, Any]], stream: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    per_client = await asyncio.gather(*(run_client(url, c, corpus, iterations, stream) for c in range(clients)))
+    wall = time.perf_counter() - started
+    results = [r for rs in per_client for r in rs]
+    latencies = [r["elapsed_ms"] for r in results]
+    return {
+        "requests": len(results),
+        "failures": sum(not r["success"] for r in results),
+        "throughput_rps": round(len(results) / wall, 3) if wall else 0.0,
+        "latency_ms": {p: round(percentile(latencies, v), 3) for p, v in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "requests_per_worker": dict(sorted(Counter(r["worker"] for r in results).items())),
+        "events": sum(r["events"] for r in results),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://127.0.0.1:8765/")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--stream", action="store_true", help="request streaming events")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.clients, args.iterations, load_corpus(args.corpus), args.stream))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
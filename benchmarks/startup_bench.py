@@ -0,0 +1,162 @@
+"""
+Cold-start benchmark for the stdio backend.
+
+Spawns ``python -m backend.main --stdio`` repeatedly and measures the wall
+time until its ``ready`` handshake line, together with the per-phase
+breakdown the backend reports (imports, agents, system). The wall time
+includes interpreter startup, which the backend cannot see itself.
+``--import-only`` times a bare ``import backend.main``, which should stay
+free of ADK.
+
+Usage:
+    python -m benchmarks.startup_bench --runs 5
+    python -m benchmarks.startup_bench --save-baseline startup_baseline.json
+    python -m benchmarks.startup_bench --baseline startup_baseline.json --threshold 0.2
+
+With --baseline the exit code is 1 when the ready time or any phase
+regressed by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.pipeline_bench import percentile
+
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _env() -> Dict[str, str]:
+    path = os.environ.get("PYTHONPATH")
+    return dict(os.environ, PYTHONPATH=PROJECT_ROOT + (os.pathsep + path if path else ""))
+
+
+def time_ready(module: str) -> Dict[str, Any]:
+    """Spawn one backend and return its ready time and phase breakdown."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", module, "--stdio"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=PROJECT_ROOT,
+        env=_env(),
+        text=True,
+        encoding="utf-8",
+    )
+    try:
+        for line in process.stdout:
+            payload = json.loads(line)
+            if payload.get("type") == "ready":
+                return {"ready_ms": (time.perf_counter() - started) * 1000, "phases": payload["startup_ms"]}
+        raise RuntimeError(f"{module} exited without a ready line")
+    finally:
+        process.stdin.close()
+        process.wait(timeout=30)
+
+
+def time_import(module: str) -> float:
+    """Wall time of ``python -c 'import <module>'`` in ms, interpreter included."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=PROJECT_ROOT, env=_env())
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "min": round(min(values), 2),
+        "p50": round(percentile(values, 50), 2),
+        "max": round(max(values), 2),
+    }
+
+
+def run_benchmark(module: str, runs: int, import_only: bool) -> Dict[str, Any]:
+    imports = [time_import(module) for _ in range(runs)]
+    result: Dict[str, Any] = {"config": {"module": module, "runs": runs}, "import_ms": summarize(imports)}
+    if import_only:
+        return result
+    samples = [time_ready(module) for _ in range(runs)]
+    phases: Dict[str, List[float]] = {}
+    for sample in samples:
+        for name, value in sample["phases"].items():
+            phases.setdefault(name, []).append(value)
+    result["ready_ms"] = summarize([s["ready_ms"] for s in samples])
+    result["phases_ms"] = {name: summarize(values) for name, values in phases.items()}
+    return result
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Return human-readable regressions of the p50s beyond ``threshold``."""
+    regressions = []
+
+    def check(label: str, now: Dict[str, float], before: Dict[str, float]) -> None:
+        # Ignore scheduling noise of a few ms
+        if before and now["p50"] - before["p50"] > max(before["p50"] * threshold, 5.0):
+            regressions.append(
+                f"{label}: {before['p50']:.1f} -> {now['p50']:.1f} ms (+{(now['p50'] / before['p50'] - 1) * 100:.0f}%)"
+            )
+
+    check("import", current["import_ms"], baseline.get("import_ms"))
+    if "ready_ms" in current:
+        check("ready", current["ready_ms"], baseline.get("ready_ms"))
+        for name, stats in current["phases_ms"].items():
+            check(f"phase[{name}]", stats, baseline.get("phases_ms", {}).get(name))
+    return regressions
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print("=" * 60)
+    print(f"Maidel 2.2 startup benchmark ({result['config']['module']}, {result['config']['runs']} runs)")
+    print("-" * 60)
+    rows = [("import", result["import_ms"])]
+    if "ready_ms" in result:
+        rows.append(("ready", result["ready_ms"]))
+        rows += [(f"  {name}", stats) for name, stats in result["phases_ms"].items()]
+    for label, stats in rows:
+        print(f"{label:<16} min={stats['min']:8.1f}  p50={stats['p50']:8.1f}  max={stats['max']:8.1f} ms")
+    print("=" * 60)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main", help="backend module run with --stdio")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-only", action="store_true", help="only time 'import <module>'")
+    parser.add_argument("--json", action="store_true", help="print the raw result as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed fractional regression")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.module, args.runs, args.import_only)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("no regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Local stub model for the three LlmAgents.
+
+StubLlm is an ADK BaseLlm that never touches the network. Each instance
+answers for one pipeline stage with canned output and a configurable latency
+(mean + jitter, seeded), so pipeline overhead can be measured without Gemini.
+A slow tail (tail_ms with tail_probability) and transient errors
+(error_rate) can be injected to exercise hedging and retries. Streaming
+calls spread the latency over STREAM_CHUNKS partial responses.
+"""
+
+import asyncio
+import json
+import random
+import re
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+
+_TASK_PATTERN = re.compile(r"[0-9０-９].*[+\-*/×÷^]|計算|求め|答え|いくつ|sqrt|sin|cos")
+_NUMBER_EXPR = re.compile(r"[0-9+\-*/().\s]*[0-9][0-9+\-*/().\s]*")
+_INNER_GROUP = re.compile(r"\(([^()]*)\)")
+_STEP_RESULTS = re.compile(r"ステップ結果[^:：\n]*[:：] *(\{.*\})")
+STREAM_CHUNKS = 4
+
+
+def is_task(message: str) -> bool:
+    return bool(_TASK_PATTERN.search(message))
+
+
+def extract_expression(message: str) -> str:
+    normalized = message.replace("×", "*").replace("÷", "/")
+    candidates = [m.strip() for m in _NUMBER_EXPR.findall(normalized) if m.strip()]
+    return max(candidates, key=len) if candidates else "0"
+
+
+def user_message(llm_request: LlmRequest) -> str:
+    """Latest real user text in the request (skips relayed agent context)."""
+    for content in reversed(llm_request.contents or []):
+        if content.role != "user" or not content.parts or not content.parts[0].text:
+            continue
+        text = content.parts[0].text
+        if text.startswith("For context:") or text.startswith("[これまでの会話の要約]"):
+            continue
+        return text
+    return ""
+
+
+def _text_response(text: str, prompt_tokens: int) -> LlmResponse:
+    return LlmResponse(
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=max(1, len(text) // 2),
+            total_token_count=prompt_tokens + max(1, len(text) // 2),
+        ),
+    )
+
+
+def classifier_output(llm_request: LlmRequest) -> LlmResponse:
+    return _text_response("task" if is_task(user_message(llm_request)) else "chat", 200)
+
+
+def plan_steps(expression: str) -> List[Dict[str, Any]]:
+    """One calculator step per parenthesized group, innermost first."""
+    steps: List[Dict[str, Any]] = []
+
+    def add(expr: str, name: str) -> str:
+        step_id = len(steps) + 1
+        deps = sorted({int(d) for d in re.findall(r"\{(\d+)\}", expr)})
+        steps.append({"step_id": step_id, "name": name, "tool": "calculator", "expression": expr.strip(), "dependencies": deps})
+        return "{%d}" % step_id
+
+    while _INNER_GROUP.search(expression):
+        expression = _INNER_GROUP.sub(lambda m: add(m.group(1), "部分計算"), expression)
+    add(expression, "直接計算" if not steps else "合計")
+    return steps
+
+
+def planner_output(llm_request: LlmRequest) -> LlmResponse:
+    message = user_message(llm_request)
+    if not is_task(message):
+        return _text_response(json.dumps({"steps": []}), 600)
+    steps = plan_steps(extract_expression(message))
+    return _text_response(json.dumps({"steps": steps}, ensure_ascii=False), 600)
+
+
+def precomputed_result(llm_request: LlmRequest) -> Optional[str]:
+    """Answer from the step results the pipeline put in the instruction."""
+    match = _STEP_RESULTS.search(str(llm_request.config.system_instruction or ""))
+    if not match:
+        return None
+    results = json.loads(match.group(1))
+    if not results:
+        return None
+    last = results[max(results, key=int)]
+    return f"{last.get('expression')} = {last.get('result')}" if last.get("success") else None
+
+
+def executor_output(llm_request: LlmRequest) -> LlmResponse:
+    last = (llm_request.contents or [None])[-1]
+    if last is not None and last.parts and last.parts[0].function_response:
+        result = last.parts[0].function_response.response or {}
+        expression = result.get("expression", "")
+        return _text_response(f"{expression} = {result.get('result')}", 400)
+    answer = precomputed_result(llm_request)
+    if answer is not None:
+        return _text_response(answer, 400)
+    message = user_message(llm_request)
+    if not is_task(message):
+        return _text_response("こんにちは！まいでるです。何かお手伝いできることはありますか？", 400)
+    call = types.FunctionCall(name="simple_calculate", args={"expression": extract_expression(message)})
+    response = _text_response("", 400)
+    response.content = types.Content(role="model", parts=[types.Part(function_call=call)])
+    return response
+
+
+STAGE_OUTPUTS = {
+    "ConversationClassifier": classifier_output,
+    "TaskPlanner": planner_output,
+    "TaskExecutor": executor_output,
+}
+
+
+class StubLlm(BaseLlm):
+    """Canned, latency-simulating model for one pipeline stage."""
+
+    stage: str
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    tail_ms: float = 0.0
+    tail_probability: float = 0.0
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @classmethod
+    def supported_models(cls) -> list:
+        return [r"stub-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        delay = self.latency_ms + (self._rng.uniform(-1, 1) * self.jitter_ms if self.jitter_ms else 0.0)
+        if self.tail_probability and self._rng.random() < self.tail_probability:
+            delay += self.tail_ms
+        if self.error_rate and self._rng.random() < self.error_rate:
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+            raise ConnectionError(f"stub transient error ({self.stage})")
+        response = STAGE_OUTPUTS[self.stage](llm_request)
+        text = response.content.parts[0].text if response.content and response.content.parts else None
+        if not stream or not text:
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+            yield response
+            return
+        size = -(-len(text) // STREAM_CHUNKS)
+        for start in range(0, len(text), size):
+            if delay > 0:
+                await asyncio.sleep(delay / 1000 / STREAM_CHUNKS)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text[start:start + size])]), partial=True)
+        yield response
+
+
+def install_stub_models(
+    latency_ms: Optional[Dict[str, float]] = None,
+    jitter_ms: float = 0.0,
+    seed: int = 0,
+    tail_ms: float = 0.0,
+    tail_probability: float = 0.0,
+    error_rate: float = 0.0,
+) -> None:
+    """Point the three module-level agents at StubLlm instances."""
+    from backend.agents.conversation import conversation_agent
+    from backend.agents.planner import planner_agent
+    from backend.agents.executor import executor_agent
+
+    latency_ms = latency_ms or {}
+    for agent in (conversation_agent, planner_agent, executor_agent):
+        agent.model = StubLlm(
+            model=f"stub-{agent.name}",
+            stage=agent.name,
+            latency_ms=latency_ms.get(agent.name, 0.0),
+            jitter_ms=jitter_ms,
+            tail_ms=tail_ms,
+            tail_probability=tail_probability,
+            error_rate=error_rate,
+            seed=seed,
+        )
+
+
+if __name__ == "__main__":
+    # Stub-backed backend, e.g. as --serve workers for localhost testing:
+    #   python -m backend.main --serve --worker-module benchmarks.stub_llm
+    import os
+
+    from backend.main import main
+
+    latency = float(os.getenv("MAIDEL_STUB_LATENCY_MS", "0"))
+    install_stub_models({name: latency for name in STAGE_OUTPUTS})
+    asyncio.run(main())
@@ -9,15 +9,222 @@ const { spawn } = require('child_process');
 const path = require('path');
 const isDev = require('electron-is-dev');
 
+// 起動から ready ハンドシェイクまでの上限（超えたら強制終了して作り直す）
+const READY_TIMEOUT_MS = 60000;
+// 予備プロセスを常に 1 つ温めておく（MAIDEL_WARM_STANDBY=false で無効）
+const WARM_STANDBY = process.env.MAIDEL_WARM_STANDBY !== 'false';
+// 応答待ちの上限（バックエンドの期限 MAIDEL_REQUEST_TIMEOUT より長め）
+const RESPONSE_TIMEOUT_MS = 180000;
+// 未送信キューの上限（超えたら送信を断る）
+const MAX_QUEUED = 100;
+// 処理中にバックエンドが落ちたリクエストの再送は 1 回まで
+// （落とし続けるリクエストで予備プロセスを次々に潰さない）
+const MAX_REQUEST_ATTEMPTS = 2;
+// 入れ替えで止めるプロセスがセッションを書き出して終わるまでの猶予
+const STOP_GRACE_MS = 3000;
+// 会話履歴は SQLite に置き、予備プロセスへの切り替え後も同じ会話を続ける
+// （MAIDEL_SESSION_BACKEND を指定すればそちらを優先）
+const SESSION_BACKEND = process.env.MAIDEL_SESSION_BACKEND || 'sqlite';
+
+// ログレベル（MAIDEL_LOG_LEVEL=debug|info|warn|error、既定は開発時 debug）
+const LOG_LEVELS = { debug: 10, info: 20, warn: 30, error: 40 };
+const LOG_LEVEL = LOG_LEVELS[process.env.MAIDEL_LOG_LEVEL] || (isDev ? LOG_LEVELS.debug : LOG_LEVELS.info);
+const log = {
+    debug: (...args) => LOG_LEVEL <= LOG_LEVELS.debug && console.log(...args),
+    info: (...args) => LOG_LEVEL <= LOG_LEVELS.info && console.log(...args),
+    warn: (...args) => LOG_LEVEL <= LOG_LEVELS.warn && console.warn(...args),
+    error: (...args) => console.error(...args)
+};
+
+/**
+ * Splits a text stream into lines in linear time: partial chunks are kept
+ * in a list and joined once, when their line ends.
+ */
+class LineSplitter {
+    constructor() {
+        this.parts = [];
+    }
+
+    push(chunk) {
+        const lines = [];
+        let start = 0;
+        let nlIndex;
+        while ((nlIndex = chunk.indexOf('\n', start)) >= 0) {
+            this.parts.push(chunk.slice(start, nlIndex));
+            lines.push(this.parts.join(''));
+            this.parts = [];
+            start = nlIndex + 1;
+        }
+        if (start < chunk.length) {
+            this.parts.push(chunk.slice(start));
+        }
+        return lines;
+    }
+}
+
+/**
+ * One `backend.main --stdio` process.
+ *
+ * `readyPromise` resolves true once the process has written its
+ * {"type": "ready"} handshake, or false if it exits (or times out) first.
+ * `exitPromise` resolves when the process has exited.
+ */
+class ADKBackend {
+    constructor(id, { onResponse, onExit, onDrain }) {
+        this.id = id;
+        this.ready = false;
+        // Whether the handshake ever arrived (ready is cleared on exit)
+        this.wasReady = false;
+        this.exited = false;
+        // stdin buffer is full; writes wait for 'drain'
+        this.congested = false;
+        // request_id -> line written and not yet answered (insertion order)
+        this.inflight = new Map();
+        this.readyPromise = new Promise((resolve) => {
+            this._resolveReady = resolve;
+        });
+        this.exitPromise = new Promise((resolve) => {
+            this._resolveExit = resolve;
+        });
+
+        this.process = spawn('py', ['-m', 'backend.main', '--stdio'], {
+            cwd: path.join(__dirname, '../../'),
+            stdio: ['pipe', 'pipe', 'pipe'],
+            env: { ...process.env, PYTHONIOENCODING: 'utf-8', MAIDEL_SESSION_BACKEND: SESSION_BACKEND }
+        });
+        log.info(`ADK process #${id} started with PID:`, this.process.pid);
+
+        this._readyTimer = setTimeout(() => {
+            log.error(`ADK process #${id} not ready after ${READY_TIMEOUT_MS} ms; killing`);
+            this.kill('SIGKILL');
+        }, READY_TIMEOUT_MS);
+
+        // ADKプロセスからの出力を処理（UTF-8 の分割はストリーム側で復元）
+        const splitter = new LineSplitter();
+        this.process.stdout.setEncoding('utf8');
+        this.process.stdout.on('data', (chunk) => {
+            for (const raw of splitter.push(chunk)) {
+                const line = raw.trim();
+                if (!line) continue;
+                let response;
+                try {
+                    response = JSON.parse(line);
+                } catch (e) {
+                    log.warn('Non-JSON stdout from ADK:', line.slice(0, 200));
+                    continue;
+                }
+                if (response.type === 'ready') {
+                    this._markReady(response);
+                    continue;
+                }
+                // Lines for requests handed to another backend are stale
+                const owned = this.inflight.has(response.request_id);
+                if (response.type !== 'event') {
+                    this.inflight.delete(response.request_id);
+                }
+                onResponse(this, response, owned);
+            }
+        });
+
+        this.process.stdin.on('drain', () => {
+            this.congested = false;
+            onDrain(this);
+        });
+        // EPIPE after a crash is reported through 'close'
+        this.process.stdin.on('error', (error) => log.warn(`ADK #${id} stdin error:`, error.message));
+
+        // ADKプロセスのエラー出力
+        this.process.stderr.setEncoding('utf8');
+        this.process.stderr.on('data', (data) => {
+            log.debug(`ADK #${id} stderr:`, data);
+        });
+
+        // 終了（起動失敗を含む）
+        const exit = (code) => {
+            if (this.exited) return;
+            this.exited = true;
+            this.ready = false;
+            clearTimeout(this._readyTimer);
+            this._resolveReady(false);
+            this._resolveExit();
+            onExit(this, code);
+        };
+        this.process.on('close', exit);
+        this.process.on('error', (error) => {
+            log.error(`ADK process #${id} error:`, error);
+            exit(null);
+        });
+    }
+
+    get pid() {
+        return this.process ? this.process.pid : null;
+    }
+
+    _markReady(handshake) {
+        log.info(`ADK process #${this.id} ready:`, handshake.startup_ms);
+        this.ready = true;
+        this.wasReady = true;
+        clearTimeout(this._readyTimer);
+        this._resolveReady(true);
+    }
+
+    // Returns false once stdin is congested; the caller waits for onDrain
+    write(requestId, line) {
+        this.inflight.set(requestId, line);
+        this.congested = !this.process.stdin.write(line);
+        return !this.congested;
+    }
+
+    kill(signal = 'SIGTERM') {
+        if (!this.exited) {
+            this.process.kill(signal);
+        }
+    }
+
+    // Cancel what is in flight and close stdin: the backend finishes, writes
+    // its sessions and exits. Killed if it has not exited after graceMs.
+    stop(graceMs = STOP_GRACE_MS) {
+        if (!this.exited) {
+            try {
+                for (const id of this.inflight.keys()) {
+                    this.process.stdin.write(JSON.stringify({ type: 'cancel', request_id: id }) + '\n');
+                }
+                this.process.stdin.end();
+            } catch (error) {
+                log.warn(`ADK #${this.id} stdin close failed:`, error.message);
+            }
+            const timer = setTimeout(() => {
+                log.warn(`ADK process #${this.id} did not exit; killing`);
+                this.kill('SIGKILL');
+            }, graceMs);
+            this.exitPromise.then(() => clearTimeout(timer));
+        }
+        this.inflight.clear();
+        return this.exitPromise;
+    }
+}
+
 class MaidelElectronApp {
     constructor() {
         this.mainWindow = null;
-        this.adkProcess = null;
+        // Backend serving requests, and a warm spare that has finished its
+        // ready handshake and takes over on crash or restart
+        this.active = null;
+        this.standby = null;
+        this._backendSeq = 0;
+        // Requests ({ id, line }) waiting for a ready, uncongested backend
+        this.outbox = [];
+        // request_id -> { resolve, timer, sentAt } for send-to-adk promises
+        this.pending = new Map();
+        this._requestSeq = 0;
+        // Set while a replaced backend writes its sessions; the outbox waits
+        // so the next backend reads the conversation after it is saved
+        this._handoff = null;
+        // Consecutive backends that died before becoming ready (for backoff)
+        this._startFailures = 0;
         this.isQuitting = false;
-        // Buffer for stdout JSONL parsing
-        this.stdoutBuffer = '';
-        // ADK process start guard
-        this._starting = false;
+        // Conversation id so the backend reuses one session across turns
+        this.conversationId = `electron-${Date.now()}`;
     }
 
     createWindow() {
@@ -72,129 +279,233 @@ class MaidelElectronApp {
         });
     }
 
-    startADKProcess() {
+    spawnBackend() {
         try {
-            if (this._starting || (this.adkProcess && !this.adkProcess.killed)) {
-                return;
-            }
-            this._starting = true;
-            console.log('Starting ADK Python process...');
-
-            // ADKプロセス起動
-            this.adkProcess = spawn('py', ['-m', 'backend.main', '--stdio'], {
-                cwd: path.join(__dirname, '../../'),
-                stdio: ['pipe', 'pipe', 'pipe'],
-                env: { ...process.env, PYTHONIOENCODING: 'utf-8' }
+            return new ADKBackend(++this._backendSeq, {
+                onResponse: (backend, response, owned) => this.handleResponse(backend, response, owned),
+                onExit: (backend, code) => this.handleBackendExit(backend, code),
+                onDrain: (backend) => backend === this.active && this.flushOutbox()
             });
+        } catch (error) {
+            log.error('Failed to start ADK process:', error);
 
-            console.log('ADK process started with PID:', this.adkProcess.pid);
-            this._starting = false;
-
-            // ADKプロセスからの出力を処理
-            this.adkProcess.stdout.on('data', (data) => {
-                const chunk = data.toString('utf-8');
-                this.stdoutBuffer += chunk;
-                let nlIndex;
-                while ((nlIndex = this.stdoutBuffer.indexOf('\n')) >= 0) {
-                    const line = this.stdoutBuffer.slice(0, nlIndex).trim();
-                    this.stdoutBuffer = this.stdoutBuffer.slice(nlIndex + 1);
-                    if (!line) continue;
-                    try {
-                        const response = JSON.parse(line);
-                        console.log('ADK Response:', response);
-                        if (this.mainWindow) {
-                            this.mainWindow.webContents.send('adk-response', response);
-                        }
-                    } catch (e) {
-                        console.warn('Non-JSON stdout from ADK:', line);
-                    }
-                }
-            });
+            // エラーをレンダラーに通知
+            if (this.mainWindow) {
+                this.mainWindow.webContents.send('adk-error', {
+                    error: 'Failed to start ADK process',
+                    details: error.message
+                });
+            }
+            return null;
+        }
+    }
 
-            // ADKプロセスのエラー出力
-            this.adkProcess.stderr.on('data', (data) => {
-                console.log('ADK Error:', data.toString());
-            });
+    // Ensure there is an active backend (and, once it is ready, a standby)
+    startADKProcess() {
+        if (this.active || this.isQuitting) {
+            return;
+        }
+        log.info('Starting ADK Python process...');
+        this.activate(this.spawnBackend());
+    }
 
-            // ADKプロセス終了時
-            this.adkProcess.on('close', (code) => {
-                console.log(`ADK process exited with code ${code}`);
-                this.adkProcess = null;
-            });
+    activate(backend) {
+        this.active = backend;
+        if (!backend) return;
+        backend.readyPromise.then((ok) => {
+            if (!ok || this.active !== backend) return;
+            this._startFailures = 0;
+            this.flushOutbox();
+            // Spare is started only after the active one is up, so the two
+            // cold starts do not compete for CPU
+            this.ensureStandby();
+        });
+    }
 
-            // ADKプロセスエラー時
-            this.adkProcess.on('error', (error) => {
-                console.error('ADK process error:', error);
-                this.adkProcess = null;
-                this._starting = false;
-            });
+    ensureStandby() {
+        if (!WARM_STANDBY || this.standby || this.isQuitting) {
+            return;
+        }
+        log.info('Starting warm standby ADK process...');
+        this.standby = this.spawnBackend();
+    }
 
-        } catch (error) {
-            console.error('Failed to start ADK process:', error);
-            this._starting = false;
+    // Swap in the standby (ready or still starting) or start a fresh backend
+    promoteStandby() {
+        const next = this.standby;
+        this.standby = null;
+        if (next && !next.exited) {
+            log.info(`Switching to standby ADK process #${next.id} (${next.ready ? 'ready' : 'starting'})`);
+            this.activate(next);
+            if (next.ready) {
+                this.flushOutbox();
+                this.ensureStandby();
+            }
+        } else {
+            this.active = null;
+            this.startADKProcess();
+        }
+    }
 
-            // エラーをレンダラーに通知
+    handleResponse(backend, response, owned) {
+        if (!owned && this.pending.has(response.request_id)) {
+            // Sent again to another backend; its answer is the one that counts
+            return;
+        }
+        if (response.type === 'event') {
+            log.debug('ADK event:', response.request_id, response.author);
+            // Progress for a live request only; the renderer batches it per frame
+            if (this.pending.has(response.request_id) && this.mainWindow) {
+                this.mainWindow.webContents.send('adk-event', response);
+            }
+            return;
+        }
+        const entry = this.pending.get(response.request_id);
+        if (!entry) {
+            // Not from send-to-adk (or already timed out): broadcast it
+            log.debug('ADK Response (unsolicited):', response);
             if (this.mainWindow) {
+                this.mainWindow.webContents.send('adk-response', response);
+            }
+            return;
+        }
+        this.pending.delete(response.request_id);
+        clearTimeout(entry.timer);
+        log.info(`ADK ${response.request_id}: success=${response.success} in ${Date.now() - entry.sentAt} ms`);
+        log.debug('ADK Response:', response);
+        entry.resolve({ success: true, response });
+    }
+
+    handleBackendExit(backend, code) {
+        log.info(`ADK process #${backend.id} exited with code ${code}`);
+        if (this.isQuitting) return;
+        if (backend === this.standby) {
+            // Replaced once the active backend is ready again
+            this.standby = null;
+            return;
+        }
+        if (backend !== this.active) return;
+
+        // Unanswered requests go to the next backend first
+        const requeued = this.requeueInflight(backend);
+        if (this.mainWindow) {
+            if (requeued) {
+                // Still pending: the renderer keeps waiting for the answer
+                this.mainWindow.webContents.send('adk-restarting', {
+                    details: `exit code ${code}`,
+                    requeued
+                });
+            } else {
                 this.mainWindow.webContents.send('adk-error', {
-                    error: 'Failed to start ADK process',
-                    details: error.message
+                    error: 'ADK process exited',
+                    details: `exit code ${code}`
                 });
             }
         }
+        if (!backend.wasReady) {
+            // Died during startup: back off instead of respawning in a loop
+            this._startFailures += 1;
+            const delay = Math.min(5000, 250 * 2 ** this._startFailures);
+            this.active = null;
+            setTimeout(() => this.startADKProcess(), delay);
+            return;
+        }
+        this.promoteStandby();
     }
 
-    sendToADK(message) {
-        if (this.adkProcess && this.adkProcess.stdin) {
+    // Returns how many requests were queued again. Only a crash counts
+    // against MAX_REQUEST_ATTEMPTS; a manual restart does not.
+    requeueInflight(backend, { crashed = true } = {}) {
+        const retry = [];
+        for (const [id, line] of backend.inflight) {
+            const entry = this.pending.get(id);
+            if (!entry) continue;
+            if (!crashed) {
+                retry.push({ id, line });
+                continue;
+            }
+            entry.attempts += 1;
+            if (entry.attempts < MAX_REQUEST_ATTEMPTS) {
+                retry.push({ id, line });
+                continue;
+            }
+            this.pending.delete(id);
+            clearTimeout(entry.timer);
+            log.warn(`ADK ${id}: backend exited ${entry.attempts} times while handling it; giving up`);
+            entry.resolve({ success: false, error: 'ADK process exited while handling this message' });
+        }
+        if (crashed) {
+            backend.inflight.clear();
+        }
+        this.outbox.unshift(...retry);
+        return retry.length;
+    }
+
+    // Write queued requests until the backend is not ready or stdin is full
+    flushOutbox() {
+        const backend = this.active;
+        if (this._handoff) return;
+        while (this.outbox.length && backend && backend.ready && !backend.congested) {
+            const { id, line } = this.outbox.shift();
             try {
-                const jsonMessage = JSON.stringify({ message }) + '\n';
-                this.adkProcess.stdin.write(jsonMessage);
-                console.log('Sent to ADK:', message);
-                return true;
+                backend.write(id, line);
             } catch (error) {
-                console.error('Failed to send to ADK:', error);
-                return false;
+                log.warn('Failed to write to ADK; keeping request queued:', error.message);
+                this.outbox.unshift({ id, line });
+                return;
             }
-        } else {
-            console.warn('ADK process not available; attempting restart');
-            try {
+        }
+    }
+
+    // Resolves with the backend's response to this message (matched by request_id)
+    sendToADK(message) {
+        if (this.outbox.length >= MAX_QUEUED) {
+            return Promise.resolve({ success: false, error: 'ADK queue is full' });
+        }
+        const id = `e${++this._requestSeq}`;
+        const line = JSON.stringify({ request_id: id, message, conversation_id: this.conversationId, stream: true }) + '\n';
+        return new Promise((resolve) => {
+            const timer = setTimeout(() => this.expireRequest(id), RESPONSE_TIMEOUT_MS);
+            this.pending.set(id, { resolve, timer, sentAt: Date.now(), attempts: 0 });
+            this.outbox.push({ id, line });
+            log.debug('Queued for ADK:', id, message);
+            if (this.active) {
+                this.flushOutbox();
+            } else {
                 this.startADKProcess();
-                setTimeout(() => {
-                    try {
-                        if (this.adkProcess && this.adkProcess.stdin) {
-                            const jsonMessage = JSON.stringify({ message }) + '\n';
-                            this.adkProcess.stdin.write(jsonMessage);
-                            console.log('Sent to ADK after restart:', message);
-                        } else {
-                            console.error('ADK still not available after restart');
-                        }
-                    } catch (e) {
-                        console.error('Retry send failed:', e);
-                    }
-                }, 800);
-            } catch (e) {
-                console.error('Restart attempt failed:', e);
             }
-            return false;
+        });
+    }
+
+    expireRequest(id) {
+        const entry = this.pending.get(id);
+        if (!entry) return;
+        this.pending.delete(id);
+        this.outbox = this.outbox.filter((r) => r.id !== id);
+        const backend = this.active;
+        if (backend && backend.inflight.has(id)) {
+            backend.inflight.delete(id);
+            try {
+                backend.process.stdin.write(JSON.stringify({ type: 'cancel', request_id: id }) + '\n');
+            } catch (error) {
+                log.warn('Failed to cancel ADK request:', error.message);
+            }
         }
+        log.warn(`ADK ${id}: no response after ${RESPONSE_TIMEOUT_MS} ms`);
+        entry.resolve({ success: false, error: 'ADK response timed out' });
     }
 
     gracefulShutdown() {
-        console.log('Starting graceful shutdown...');
+        log.info('Starting graceful shutdown...');
         this.isQuitting = true;
 
-        // ADKプロセス終了
-        if (this.adkProcess) {
-            console.log('Terminating ADK process...');
-            this.adkProcess.kill('SIGTERM');
-
-            // 強制終了のタイマー
-            setTimeout(() => {
-                if (this.adkProcess) {
-                    console.log('Force killing ADK process...');
-                    this.adkProcess.kill('SIGKILL');
-                }
-                app.quit();
-            }, 3000);
+        // ADKプロセス終了（stdin を閉じてセッションを書き出させ、猶予後は強制終了）
+        const backends = [this.active, this.standby].filter((b) => b && !b.exited);
+        this.active = null;
+        this.standby = null;
+        if (backends.length) {
+            log.info('Terminating ADK process...');
+            Promise.all(backends.map((b) => b.stop())).then(() => app.quit());
         } else {
             app.quit();
         }
@@ -203,42 +514,39 @@ class MaidelElectronApp {
     setupIPC() {
         // レンダラープロセスからのメッセージ処理
         ipcMain.handle('send-to-adk', async (event, message) => {
-            console.log('IPC received message:', message);
-
-            if (this.sendToADK(message)) {
-                return { success: true };
-            }
-            // Wait briefly and retry once after auto-restart
-            await new Promise((r) => setTimeout(r, 900));
-            if (this.sendToADK(message)) {
-                return { success: true };
-            }
-            return {
-                success: false,
-                error: 'Failed to send message to ADK'
-            };
+            log.debug('IPC received message:', message);
+            // Held in the outbox while backends are switching or stdin is full
+            return this.sendToADK(message);
         });
 
         // ADKプロセス状態取得
         ipcMain.handle('get-adk-status', async (event) => {
             return {
-                isRunning: this.adkProcess !== null,
-                pid: this.adkProcess ? this.adkProcess.pid : null
+                isRunning: this.active !== null,
+                isReady: !!(this.active && this.active.ready),
+                pid: this.active ? this.active.pid : null,
+                standby: this.standby ? { pid: this.standby.pid, ready: this.standby.ready } : null,
+                queued: this.outbox.length,
+                pending: this.pending.size
             };
         });
 
-        // ADKプロセス再起動
+        // ADKプロセス再起動（温めてある予備に即切り替え）
         ipcMain.handle('restart-adk', async (event) => {
-            if (this.adkProcess) {
-                this.adkProcess.kill();
-                this.adkProcess = null;
+            const old = this.active;
+            this.active = null;
+            if (old) {
+                // Not a crash: the requests keep their retry budget
+                this.requeueInflight(old, { crashed: false });
+                const handoff = this._handoff = old.stop().then(() => {
+                    if (this._handoff === handoff) {
+                        this._handoff = null;
+                        this.flushOutbox();
+                    }
+                });
             }
-
-            setTimeout(() => {
-                this.startADKProcess();
-            }, 1000);
-
-            return { success: true };
+            this.promoteStandby();
+            return { success: this.active ? await this.active.readyPromise : false };
         });
     }
 }
@@ -30,6 +30,13 @@ contextBridge.exposeInMainWorld('electronAPI', {
         });
     },
 
+    // ADKパイプラインの途中経過受信
+    onADKEvent: (callback) => {
+        ipcRenderer.on('adk-event', (event, payload) => {
+            callback(payload);
+        });
+    },
+
     // ADKエラー受信
     onADKError: (callback) => {
         ipcRenderer.on('adk-error', (event, error) => {
@@ -37,6 +44,13 @@ contextBridge.exposeInMainWorld('electronAPI', {
         });
     },
 
+    // ADKプロセスの再起動通知（処理中のメッセージは新しいプロセスで再実行される）
+    onADKRestarting: (callback) => {
+        ipcRenderer.on('adk-restarting', (event, notice) => {
+            callback(notice);
+        });
+    },
+
     // リスナーを削除
     removeAllListeners: (channel) => {
         ipcRenderer.removeAllListeners(channel);
@@ -1,20 +1,22 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 import CharacterDisplay from './components/CharacterDisplay.tsx';
 import ChatInterface from './components/ChatInterface.tsx';
 import PlanVisualizer from './components/PlanVisualizer.tsx';
 import StatusBar from './components/StatusBar.tsx';
-import { ChatMessage, ExecutionPlan, ADKResponse } from './types';
+import { ChatMessage, ExecutionPlan, ADKResponse, ADKEvent } from './types';
 
 // Electron API の型定義
 declare global {
   interface Window {
     electronAPI: {
-      sendToADK: (message: string) => Promise<{ success: boolean; error?: string }>;
-      getADKStatus: () => Promise<{ isRunning: boolean; pid?: number }>;
+      sendToADK: (message: string) => Promise<{ success: boolean; error?: string; response?: ADKResponse }>;
+      getADKStatus: () => Promise<{ isRunning: boolean; isReady?: boolean; pid?: number; queued?: number; pending?: number }>;
       restartADK: () => Promise<{ success: boolean }>;
       onADKResponse: (callback: (response: ADKResponse) => void) => void;
+      onADKEvent: (callback: (event: ADKEvent) => void) => void;
       onADKError: (callback: (error: any) => void) => void;
+      onADKRestarting: (callback: (notice: { details?: string; requeued: number }) => void) => void;
       removeAllListeners: (channel: string) => void;
     };
   }
@@ -28,59 +30,119 @@ const App: React.FC = () => {
   const [adkStatus, setAdkStatus] = useState<'connecting' | 'connected' | 'disconnected' | 'error'>('disconnected');
   const [connectionError, setConnectionError] = useState<string | null>(null);
   const [lastUpdate, setLastUpdate] = useState<Date | undefined>(undefined);
+  // 生成中の応答。トークンの追記はこれだけを更新し、messages には完了時に 1 回だけ追加する
+  const [draft, setDraft] = useState<ChatMessage | null>(null);
+  // 次のフレームでまとめて反映するトークン（replace は非 partial イベントの全文）
+  const streamRef = useRef<{ chunks: string[]; replace: string | null; frame: number | null }>({
+    chunks: [],
+    replace: null,
+    frame: null
+  });
+
+  const resetStream = () => {
+    const stream = streamRef.current;
+    if (stream.frame !== null) {
+      cancelAnimationFrame(stream.frame);
+    }
+    streamRef.current = { chunks: [], replace: null, frame: null };
+    setDraft(null);
+  };
+
+  // バッファしたトークンを 1 フレームに 1 回だけ draft に反映する
+  const flushStream = () => {
+    const stream = streamRef.current;
+    stream.frame = null;
+    const { chunks, replace } = stream;
+    stream.chunks = [];
+    stream.replace = null;
+    const appended = chunks.join('');
+    setDraft(prev => ({
+      ...(prev ?? {
+        id: `draft-${Date.now()}`,
+        content: '',
+        sender: 'maidel' as const,
+        timestamp: new Date()
+      }),
+      content: (replace ?? prev?.content ?? '') + appended,
+      streaming: true
+    }));
+  };
+
+  // パイプラインの途中経過（stream: true のイベント行）
+  const handleADKEvent = (event: ADKEvent) => {
+    // 応答本文のイベントだけを逐次表示する（どのエージェントが書くかはバックエンドが示す）
+    if (!event.answer || !event.text) return;
+    const stream = streamRef.current;
+    if (event.partial) {
+      stream.chunks.push(event.text);
+    } else {
+      // 集約済みの全文で置き換える
+      stream.replace = event.text;
+      stream.chunks = [];
+    }
+    if (stream.frame === null) {
+      stream.frame = requestAnimationFrame(flushStream);
+    }
+  };
+
+  // ADK応答の表示
+  const handleADKResponse = (response: ADKResponse) => {
+    console.log('ADK Response received:', response);
+    resetStream();
+
+    if (response.success) {
+      // 成功レスポンス処理
+      const newMessage: ChatMessage = {
+        id: Date.now().toString(),
+        content: response.result || '処理が完了しました',
+        sender: 'maidel',
+        timestamp: new Date(),
+        taskType: response.task_type,
+        executionPlan: response.execution_plan
+      };
+
+      setMessages(prev => [...prev, newMessage]);
+      setAdkStatus('connected');
+      setLastUpdate(new Date());
+
+      // 実行計画の更新
+      if (response.execution_plan && Array.isArray(response.execution_plan)) {
+        const plan: ExecutionPlan = {
+          steps: response.execution_plan.map((step, index) => ({
+            id: step.step_id?.toString() || index.toString(),
+            name: step.name || `ステップ ${index + 1}`,
+            description: step.description || '',
+            status: 'completed',
+            result: step.result
+          })),
+          currentStepIndex: response.execution_plan.length - 1,
+          status: 'completed'
+        };
+        setCurrentPlan(plan);
+      }
+    } else {
+      // エラーレスポンス処理
+      const errorMessage: ChatMessage = {
+        id: Date.now().toString(),
+        content: `エラーが発生しました: ${response.error || '不明なエラー'}`,
+        sender: 'system',
+        timestamp: new Date(),
+        isError: true
+      };
+      setMessages(prev => [...prev, errorMessage]);
+      setAdkStatus('error');
+    }
+
+    setIsProcessing(false);
+  };
 
   // 初期化
   useEffect(() => {
     // ADK応答の監視
     if (window.electronAPI) {
-      window.electronAPI.onADKResponse((response: ADKResponse) => {
-        console.log('ADK Response received:', response);
-
-        if (response.success) {
-          // 成功レスポンス処理
-          const newMessage: ChatMessage = {
-            id: Date.now().toString(),
-            content: response.result || '処理が完了しました',
-            sender: 'maidel',
-            timestamp: new Date(),
-            taskType: response.task_type,
-            executionPlan: response.execution_plan
-          };
-
-          setMessages(prev => [...prev, newMessage]);
-          setAdkStatus('connected');
-          setLastUpdate(new Date());
-
-          // 実行計画の更新
-          if (response.execution_plan && Array.isArray(response.execution_plan)) {
-            const plan: ExecutionPlan = {
-              steps: response.execution_plan.map((step, index) => ({
-                id: step.step_id?.toString() || index.toString(),
-                name: step.name || `ステップ ${index + 1}`,
-                description: step.description || '',
-                status: 'completed',
-                result: step.result
-              })),
-              currentStepIndex: response.execution_plan.length - 1,
-              status: 'completed'
-            };
-            setCurrentPlan(plan);
-          }
-        } else {
-          // エラーレスポンス処理
-          const errorMessage: ChatMessage = {
-            id: Date.now().toString(),
-            content: `エラーが発生しました: ${response.error || '不明なエラー'}`,
-            sender: 'system',
-            timestamp: new Date(),
-            isError: true
-          };
-          setMessages(prev => [...prev, errorMessage]);
-          setAdkStatus('error');
-        }
-
-        setIsProcessing(false);
-      });
+      // send-to-adk の戻り値に乗らない応答（タイムアウト後に届いたもの等）
+      window.electronAPI.onADKResponse(handleADKResponse);
+      window.electronAPI.onADKEvent(handleADKEvent);
 
       // ADKエラーの監視
       window.electronAPI.onADKError((error) => {
@@ -88,6 +150,14 @@ const App: React.FC = () => {
         setConnectionError(error.error || 'ADK接続エラー');
         setAdkStatus('error');
         setIsProcessing(false);
+        resetStream();
+      });
+
+      // ADK再起動中: 処理中のメッセージは再送されるので待ち続ける（途中経過は最初から届き直す）
+      window.electronAPI.onADKRestarting((notice) => {
+        console.warn('ADK restarting:', notice);
+        setAdkStatus('connecting');
+        resetStream();
       });
 
       // ADK状態チェック
@@ -110,7 +180,9 @@ const App: React.FC = () => {
     return () => {
       if (window.electronAPI) {
         window.electronAPI.removeAllListeners('adk-response');
+        window.electronAPI.removeAllListeners('adk-event');
         window.electronAPI.removeAllListeners('adk-error');
+        window.electronAPI.removeAllListeners('adk-restarting');
       }
     };
   }, []);
@@ -154,10 +226,14 @@ const App: React.FC = () => {
 
     try {
       if (window.electronAPI) {
+        // 同じ request_id の応答が届いた時点で解決される
         const result = await window.electronAPI.sendToADK(content);
         if (!result.success) {
           throw new Error(result.error || 'メッセージ送信に失敗しました');
         }
+        if (result.response) {
+          handleADKResponse(result.response);
+        }
       } else {
         throw new Error('Electron API が利用できません');
       }
@@ -220,6 +296,7 @@ const App: React.FC = () => {
           <div className="app-chat">
             <ChatInterface
               messages={messages}
+              draft={draft}
               onSendMessage={handleSendMessage}
               isProcessing={isProcessing}
             />
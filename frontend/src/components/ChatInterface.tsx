@@ -1,26 +1,228 @@
-import React, { useState, useRef, useEffect } from 'react';
+import React, { useState, useRef, useEffect, useLayoutEffect, useMemo, useCallback, memo } from 'react';
 import './ChatInterface.css';
 import { ChatMessage } from '../types';
 
 interface ChatInterfaceProps {
   messages: ChatMessage[];
+  // 生成中の応答（トークン追記はこの 1 件だけを更新する）
+  draft?: ChatMessage | null;
   onSendMessage: (message: string) => void;
   isProcessing: boolean;
 }
 
+// 未計測の行の高さの見積もり（px）と、表示範囲の前後に余分に描画する行数
+const ESTIMATED_ROW_HEIGHT = 96;
+const OVERSCAN_ROWS = 6;
+// 最下部からこの距離以内なら新着メッセージに追従する
+const STICK_TO_BOTTOM_PX = 48;
+
+const formatTimestamp = (timestamp: Date) => {
+  return timestamp.toLocaleTimeString('ja-JP', {
+    hour: '2-digit',
+    minute: '2-digit'
+  });
+};
+
+const getSenderIcon = (sender: ChatMessage['sender']) => {
+  switch (sender) {
+    case 'user':
+      return '👤';
+    case 'maidel':
+      return '🤖';
+    case 'system':
+      return '⚙️';
+    default:
+      return '💬';
+  }
+};
+
+const getSenderName = (sender: ChatMessage['sender']) => {
+  switch (sender) {
+    case 'user':
+      return 'あなた';
+    case 'maidel':
+      return 'まいでる';
+    case 'system':
+      return 'システム';
+    default:
+      return '不明';
+  }
+};
+
+interface MessageRowProps {
+  message: ChatMessage;
+  animate: boolean;
+}
+
+// 1 メッセージ分の行。message オブジェクトが変わらない限り再描画しない
+const MessageRowBase: React.FC<MessageRowProps> = ({ message, animate }) => (
+  <div
+    className={`message ${message.sender} ${message.isError ? 'error' : ''} ${message.streaming ? 'streaming' : ''} ${animate ? 'fade-in' : ''}`}
+  >
+    <div className="message-header">
+      <span className="message-sender">
+        <span className="sender-icon">{getSenderIcon(message.sender)}</span>
+        <span className="sender-name">{getSenderName(message.sender)}</span>
+      </span>
+      <span className="message-timestamp">
+        {formatTimestamp(message.timestamp)}
+      </span>
+    </div>
+    <div className="message-content">
+      {message.content}
+    </div>
+    {/* タスク種別表示 */}
+    {message.taskType && (
+      <div className="message-metadata">
+        <span className="task-type">
+          {message.taskType === 'task' ? '🧮 タスク' : '💭 雑談'}
+        </span>
+      </div>
+    )}
+  </div>
+);
+const MessageRow = memo(MessageRowBase);
+
+interface MeasuredRowProps {
+  index: number;
+  observer: ResizeObserver;
+  children: React.ReactNode;
+}
+
+// 表示中の間だけ高さを監視する行コンテナ
+const MeasuredRow: React.FC<MeasuredRowProps> = ({ index, observer, children }) => {
+  const ref = useRef<HTMLDivElement>(null);
+  useLayoutEffect(() => {
+    const el = ref.current;
+    if (!el) return;
+    observer.observe(el);
+    return () => observer.unobserve(el);
+  }, [observer]);
+  return (
+    <div ref={ref} data-index={index} className="message-row">
+      {children}
+    </div>
+  );
+};
+
+// 先頭から各行の上端までの累積高さ（offsets[i]）と全体の高さ（offsets[n]）
+const computeOffsets = (heights: number[], count: number) => {
+  const offsets = new Array<number>(count + 1);
+  offsets[0] = 0;
+  for (let i = 0; i < count; i++) {
+    offsets[i + 1] = offsets[i] + (heights[i] ?? ESTIMATED_ROW_HEIGHT);
+  }
+  return offsets;
+};
+
+// offsets[i] <= y となる最大の i
+const findRow = (offsets: number[], y: number) => {
+  let low = 0;
+  let high = offsets.length - 2;
+  while (low < high) {
+    const mid = (low + high + 1) >> 1;
+    if (offsets[mid] <= y) {
+      low = mid;
+    } else {
+      high = mid - 1;
+    }
+  }
+  return Math.max(0, low);
+};
+
 const ChatInterface: React.FC<ChatInterfaceProps> = ({
   messages,
+  draft,
   onSendMessage,
   isProcessing
 }) => {
   const [inputValue, setInputValue] = useState('');
-  const messagesEndRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLInputElement>(null);
 
-  // 新しいメッセージが追加されたときに自動スクロール
+  // ウィンドウ描画: 表示範囲（と前後 OVERSCAN_ROWS 行）だけを DOM に置く
+  const scrollRef = useRef<HTMLDivElement>(null);
+  const [viewport, setViewport] = useState({ scrollTop: 0, height: 0 });
+  // 計測済みの行の高さ（メッセージは追記のみなのでインデックスで持つ）
+  const heightsRef = useRef<number[]>([]);
+  const [heightsVersion, setHeightsVersion] = useState(0);
+  const stickToBottomRef = useRef(true);
+  const frameRef = useRef<number | null>(null);
+  // 初回表示より後に届いたメッセージだけをフェードインさせる
+  const initialCountRef = useRef(messages.length);
+
+  const offsets = useMemo(
+    () => computeOffsets(heightsRef.current, messages.length),
+    // heightsVersion は計測結果の更新を表す
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+    [messages.length, heightsVersion]
+  );
+  const totalHeight = offsets[messages.length];
+
+  const first = Math.max(0, findRow(offsets, viewport.scrollTop) - OVERSCAN_ROWS);
+  const last = Math.min(
+    messages.length,
+    findRow(offsets, viewport.scrollTop + viewport.height) + 1 + OVERSCAN_ROWS
+  );
+
+  // スクロールとリサイズは 1 フレームに 1 回だけ反映する
+  const scheduleViewportUpdate = useCallback(() => {
+    if (frameRef.current !== null) return;
+    frameRef.current = requestAnimationFrame(() => {
+      frameRef.current = null;
+      const el = scrollRef.current;
+      if (!el) return;
+      stickToBottomRef.current = el.scrollHeight - el.scrollTop - el.clientHeight <= STICK_TO_BOTTOM_PX;
+      setViewport(prev =>
+        prev.scrollTop === el.scrollTop && prev.height === el.clientHeight
+          ? prev
+          : { scrollTop: el.scrollTop, height: el.clientHeight }
+      );
+    });
+  }, []);
+
   useEffect(() => {
-    messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-  }, [messages]);
+    const el = scrollRef.current;
+    if (!el) return;
+    const observer = new ResizeObserver(scheduleViewportUpdate);
+    observer.observe(el);
+    scheduleViewportUpdate();
+    return () => {
+      observer.disconnect();
+      if (frameRef.current !== null) {
+        cancelAnimationFrame(frameRef.current);
+      }
+    };
+  }, [scheduleViewportUpdate]);
+
+  // 描画された行の実際の高さを記録する（変化があったときだけ再計算）
+  const rowObserver = useMemo(
+    () =>
+      new ResizeObserver(entries => {
+        let changed = false;
+        for (const entry of entries) {
+          const target = entry.target as HTMLElement;
+          const index = Number(target.dataset.index);
+          const height = target.offsetHeight;
+          if (target.isConnected && height > 0 && heightsRef.current[index] !== height) {
+            heightsRef.current[index] = height;
+            changed = true;
+          }
+        }
+        if (changed) {
+          setHeightsVersion(v => v + 1);
+        }
+      }),
+    []
+  );
+  useEffect(() => () => rowObserver.disconnect(), [rowObserver]);
+
+  // 最下部を見ているときだけ新着・追記に追従する（スムーズスクロールはしない）
+  useLayoutEffect(() => {
+    const el = scrollRef.current;
+    if (el && stickToBottomRef.current) {
+      el.scrollTop = el.scrollHeight;
+    }
+  }, [messages.length, draft?.content, isProcessing, totalHeight]);
 
   // 入力フィールドにフォーカスを維持
   useEffect(() => {
@@ -44,91 +246,51 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
     }
   };
 
-  const formatTimestamp = (timestamp: Date) => {
-    return timestamp.toLocaleTimeString('ja-JP', {
-      hour: '2-digit',
-      minute: '2-digit'
-    });
-  };
-
-  const getSenderIcon = (sender: ChatMessage['sender']) => {
-    switch (sender) {
-      case 'user':
-        return '👤';
-      case 'maidel':
-        return '🤖';
-      case 'system':
-        return '⚙️';
-      default:
-        return '💬';
-    }
-  };
-
-  const getSenderName = (sender: ChatMessage['sender']) => {
-    switch (sender) {
-      case 'user':
-        return 'あなた';
-      case 'maidel':
-        return 'まいでる';
-      case 'system':
-        return 'システム';
-      default:
-        return '不明';
-    }
-  };
+  const rows: React.ReactNode[] = [];
+  for (let index = first; index < last; index++) {
+    const message = messages[index];
+    rows.push(
+      <MeasuredRow key={message.id + ':' + index} index={index} observer={rowObserver}>
+        <MessageRow message={message} animate={index >= initialCountRef.current && index === messages.length - 1} />
+      </MeasuredRow>
+    );
+  }
 
   return (
     <div className="chat-interface">
       {/* メッセージリスト */}
-      <div className="chat-messages maidel-scrollbar">
-        {messages.map((message) => (
-          <div
-            key={message.id}
-            className={`message ${message.sender} ${message.isError ? 'error' : ''} fade-in`}
-          >
-            <div className="message-header">
-              <span className="message-sender">
-                <span className="sender-icon">{getSenderIcon(message.sender)}</span>
-                <span className="sender-name">{getSenderName(message.sender)}</span>
-              </span>
-              <span className="message-timestamp">
-                {formatTimestamp(message.timestamp)}
-              </span>
-            </div>
-            <div className="message-content">
-              {message.content}
-            </div>
-            {/* タスク種別表示 */}
-            {message.taskType && (
-              <div className="message-metadata">
-                <span className="task-type">
-                  {message.taskType === 'task' ? '🧮 タスク' : '💭 雑談'}
-                </span>
-              </div>
-            )}
+      <div className="chat-messages maidel-scrollbar" ref={scrollRef} onScroll={scheduleViewportUpdate}>
+        <div style={{ height: offsets[first] }} aria-hidden="true" />
+        {rows}
+        <div style={{ height: totalHeight - offsets[last] }} aria-hidden="true" />
+
+        {/* 生成中の応答 */}
+        {draft && (
+          <div className="message-row">
+            <MessageRow message={draft} animate={false} />
           </div>
-        ))}
+        )}
 
         {/* 処理中インジケーター */}
-        {isProcessing && (
-          <div className="message maidel processing fade-in">
-            <div className="message-header">
-              <span className="message-sender">
-                <span className="sender-icon">🤖</span>
-                <span className="sender-name">まいでる</span>
-              </span>
-            </div>
-            <div className="message-content">
-              <div className="typing-indicator">
-                <span></span>
-                <span></span>
-                <span></span>
+        {isProcessing && !draft && (
+          <div className="message-row">
+            <div className="message maidel processing fade-in">
+              <div className="message-header">
+                <span className="message-sender">
+                  <span className="sender-icon">🤖</span>
+                  <span className="sender-name">まいでる</span>
+                </span>
+              </div>
+              <div className="message-content">
+                <div className="typing-indicator">
+                  <span></span>
+                  <span></span>
+                  <span></span>
+                </div>
               </div>
             </div>
           </div>
         )}
-
-        <div ref={messagesEndRef} />
       </div>
 
       {/* 入力エリア */}
@@ -168,4 +330,4 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
   );
 };
 
-export default ChatInterface;
\ No newline at end of file
+export default ChatInterface;
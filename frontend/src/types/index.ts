@@ -11,6 +11,8 @@ export interface ChatMessage {
   taskType?: string;
   executionPlan?: any[];
   isError?: boolean;
+  // 応答を生成中（トークン追記中）
+  streaming?: boolean;
 }
 
 // 実行ステップ
@@ -36,6 +38,7 @@ export interface ExecutionPlan {
 // ADKレスポンス
 export interface ADKResponse {
   success: boolean;
+  request_id?: string;
   message?: string;
   task_type?: string;
   execution_plan?: any[];
@@ -46,6 +49,19 @@ export interface ADKResponse {
   agent_result?: string;
 }
 
+// ADKパイプラインの途中経過（stream: true のリクエストで届く）
+export interface ADKEvent {
+  type: 'event';
+  request_id?: string;
+  author?: string;
+  text?: string;
+  partial?: boolean;
+  // 応答本文（チャットの返答・計算結果）を書いているイベント
+  answer?: boolean;
+  tool_calls?: string[];
+  state_keys?: string[];
+}
+
 // ADK状態
 export interface ADKStatus {
   isRunning: boolean;
@@ -0,0 +1,6 @@
+"""
+MCP tool servers for Maidel 2.2
+
+Each subpackage is one stdio server (python -m mcp_tools.<name>); common
+holds the framing and tracing they share.
+"""
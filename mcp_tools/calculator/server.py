@@ -4,57 +4,13 @@ Calculator MCP Server (JSON-RPC over stdio with Content-Length framing)
 
 import sys
 import json
+import time
 import asyncio
 from typing import Dict, Any
+from ..common import export_span, read_message, write_message
 from .calculator import SafeCalculator
 
 
-def _read_message() -> Dict[str, Any]:
-    content_length = None
-    saw_any_header = False
-    # Read headers (or detect JSON line fallback)
-    while True:
-        line = sys.stdin.buffer.readline()
-        if not line:
-            return {}
-        # Detect JSON line mode (no headers)
-        stripped = line.strip()
-        if stripped.startswith(b"{") or stripped.startswith(b"["):
-            try:
-                return json.loads(stripped.decode("utf-8"))
-            except Exception:
-                return {}
-        # Header mode
-        saw_any_header = True
-        if line in (b"\r\n", b"\n"):
-            break
-        try:
-            header = line.decode("utf-8").strip()
-        except Exception:
-            header = ""
-        if header.lower().startswith("content-length:"):
-            try:
-                content_length = int(header.split(":", 1)[1].strip())
-            except Exception:
-                content_length = None
-    if content_length is None:
-        return {}
-    body = sys.stdin.buffer.read(content_length)
-    try:
-        return json.loads(body.decode("utf-8"))
-    except Exception:
-        return {}
-
-
-def _write_message(payload: Dict[str, Any]) -> None:
-    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    # Some MCP clients require only Content-Length header
-    headers = f"Content-Length: {len(data)}\r\n\r\n".encode("ascii")
-    sys.stdout.buffer.write(headers)
-    sys.stdout.buffer.write(data)
-    sys.stdout.buffer.flush()
-
-
 class CalculatorMCPServer:
     def __init__(self) -> None:
         self.calculator = SafeCalculator()
@@ -127,9 +83,11 @@ class CalculatorMCPServer:
 
     async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         try:
+            started = time.time_ns()
             method = request.get("method")
             params = request.get("params", {})
             req_id = request.get("id")
+            traceparent = (params.get("_meta") or {}).get("traceparent")
             # minimal debug
             print(f"[MCP] recv method={method}", file=sys.stderr)
 
@@ -156,6 +114,7 @@ class CalculatorMCPServer:
 
             resp = {"jsonrpc": "2.0", "id": req_id, "result": result}
             print(f"[MCP] send ok for {method}", file=sys.stderr)
+            export_span(f"mcp server {method}", traceparent, started, {"tool": params.get("name")}, "mcp-calculator")
             return resp
         except Exception as e:
             err = {
@@ -172,12 +131,12 @@ class CalculatorMCPServer:
         loop = asyncio.get_event_loop()
         try:
             while True:
-                req = await loop.run_in_executor(None, _read_message)
+                req = await loop.run_in_executor(None, read_message)
                 if not req:
                     break
                 print("[MCP] request received", file=sys.stderr)
                 resp = await self.handle_request(req)
-                await loop.run_in_executor(None, _write_message, resp)
+                await loop.run_in_executor(None, write_message, resp)
         except KeyboardInterrupt:
             print("Server shutting down...", file=sys.stderr)
         except Exception as e:
@@ -0,0 +1,96 @@
+"""
+Shared stdio plumbing for the MCP servers
+
+JSON-RPC messages with Content-Length framing (a bare JSON line is also
+accepted on input), and span export to the backend's trace file.
+"""
+
+import os
+import sys
+import json
+import time
+import secrets
+from typing import Dict, Any, Optional
+
+
+# Spans are appended to the backend's trace file (inherited via env)
+TRACE_FILE = os.getenv("MAIDEL_TRACE_FILE", "")
+
+
+def export_span(
+    name: str,
+    traceparent: Optional[str],
+    start_ns: int,
+    attributes: Dict[str, Any],
+    service: str,
+) -> Optional[str]:
+    """Write one OpenTelemetry-style span continuing the caller's trace."""
+    if not TRACE_FILE or not traceparent:
+        return None
+    parts = traceparent.split("-")
+    if len(parts) != 4:
+        return None
+    span_id = secrets.token_hex(8)
+    span = {
+        "traceId": parts[1],
+        "spanId": span_id,
+        "parentSpanId": parts[2],
+        "name": name,
+        "startTimeUnixNano": start_ns,
+        "endTimeUnixNano": time.time_ns(),
+        "attributes": attributes,
+        "status": {"code": "OK"},
+        "resource": {"service.name": service},
+    }
+    try:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(span, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[MCP] trace export failed: {e}", file=sys.stderr)
+    return span_id
+
+
+def read_message() -> Dict[str, Any]:
+    """Next request from stdin (Content-Length framed or one JSON line); {} at EOF."""
+    content_length = None
+    # Read headers (or detect JSON line fallback)
+    while True:
+        line = sys.stdin.buffer.readline()
+        if not line:
+            return {}
+        # Detect JSON line mode (no headers)
+        stripped = line.strip()
+        if stripped.startswith(b"{") or stripped.startswith(b"["):
+            try:
+                return json.loads(stripped.decode("utf-8"))
+            except Exception:
+                return {}
+        # Header mode
+        if line in (b"\r\n", b"\n"):
+            break
+        try:
+            header = line.decode("utf-8").strip()
+        except Exception:
+            header = ""
+        if header.lower().startswith("content-length:"):
+            try:
+                content_length = int(header.split(":", 1)[1].strip())
+            except Exception:
+                content_length = None
+    if content_length is None:
+        return {}
+    body = sys.stdin.buffer.read(content_length)
+    try:
+        return json.loads(body.decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def write_message(payload: Dict[str, Any]) -> None:
+    """Write one Content-Length framed response to stdout."""
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    # Some MCP clients require only Content-Length header
+    headers = f"Content-Length: {len(data)}\r\n\r\n".encode("ascii")
+    sys.stdout.buffer.write(headers)
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
@@ -0,0 +1,11 @@
+"""
+Memory MCP Tool for Maidel 2.2
+
+MCPプロトコルに準拠した記憶ツール
+事実や過去の結果を SQLite に保存し、全文検索（FTS5 trigram）で取り出す
+"""
+
+from .server import MemoryMCPServer
+
+__version__ = "1.0.0"
+__all__ = ["MemoryMCPServer"]
@@ -0,0 +1,11 @@
+"""
+Memory MCP Server エントリーポイント
+
+python -m mcp_tools.memory でサーバーを起動
+"""
+
+import asyncio
+from .server import main
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
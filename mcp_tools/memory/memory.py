@@ -0,0 +1,366 @@
+"""
+記憶ストア
+
+事実や過去の計算結果を SQLite に保存し、FTS5 の trigram インデックスで検索する。
+日本語は単語の区切りがないため、文字 3-gram で部分一致させ bm25 で順位付けする。
+検索はまずクエリ中の（記憶に現れる）3-gram をすべて含むものを探し、足りなければ
+珍しい 3-gram の OR で補う。bm25 は一致した全件で計算されるため、候補が
+RANK_CANDIDATES を超える検索は新しいものから RANK_CANDIDATES 件に絞ってから
+順位付けし、10 万件でも十数ミリ秒以内に収める。
+書き込みはバッファしてまとめて 1 トランザクションで反映する。
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".maidel", "memory.sqlite3")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("MAIDEL_MEMORY_FLUSH_INTERVAL", "0.2"))
+# この件数たまったら待たずに書き込む
+FLUSH_BATCH_SIZE = 256
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+MAX_CONTENT_LENGTH = 4000
+KINDS = ("fact", "result", "note")
+
+# 検索に使う 3-gram の上限（出現文書の少ないものから使う）
+MAX_QUERY_GRAMS = 12
+# bm25 で順位付けする候補数の上限。これを超える検索は新しいものから絞る
+RANK_CANDIDATES = 500
+# 3-gram ごとの出現文書数のキャッシュの上限
+DOC_COUNT_CACHE_SIZE = 50000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    digest TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    content,
+    content='memories',
+    content_rowid='id',
+    tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_vocab USING fts5vocab(memories_fts, 'row');
+"""
+
+_SEPARATORS = re.compile(r"[\s、。，．,.!?！？「」『』（）()\[\]【】・:：;；\"']+")
+
+
+def _digest(kind: str, content: str) -> str:
+    return hashlib.sha1(f"{kind}\0{content}".encode("utf-8")).hexdigest()
+
+
+def query_grams(query: str) -> Tuple[List[str], List[str]]:
+    """クエリを 3-gram と、インデックスに使えない 3 文字未満の語に分ける"""
+    grams: List[str] = []
+    short: List[str] = []
+    for term in _SEPARATORS.split(query.casefold()):
+        if len(term) >= 3:
+            grams.extend(term[i:i + 3] for i in range(len(term) - 2))
+        elif term:
+            short.append(term)
+    return list(dict.fromkeys(grams)), short
+
+
+def content_grams(content: str) -> Set[str]:
+    """FTS5 trigram トークナイザがインデックスする 3-gram（大文字小文字は区別しない）"""
+    text = content.casefold()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _quote(gram: str) -> str:
+    return '"' + gram.replace('"', '""') + '"'
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + re.sub(r"([%_\\])", r"\\\1", term) + "%"
+
+
+class MemoryStore:
+    """SQLite + FTS5 (trigram) の記憶ストア"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, flush_interval: float = FLUSH_INTERVAL_SECONDS) -> None:
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+        # digest -> (id, kind, content, created_at) の書き込み待ち
+        self._pending: Dict[str, Tuple[int, str, str, float]] = {}
+        self._pending_cond = threading.Condition()
+        self._next_id = (self._conn.execute("SELECT MAX(id) FROM memories").fetchone()[0] or 0) + 1
+        self._count = self._conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+        # 3-gram -> 出現文書数（書き込みのたびに差分で更新する）
+        self._doc_counts: Dict[str, int] = {}
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="memory-writer", daemon=True)
+        self._writer.start()
+
+    # --- 書き込み -------------------------------------------------------------
+
+    def remember(self, content: str, kind: str = "fact") -> Dict[str, Any]:
+        """記憶を追加する（同じ内容はまとめて 1 件）。書き込みはバッファされる"""
+        content = (content or "").strip()
+        if not content:
+            return {"success": False, "error": "content が空です", "error_type": "empty_content"}
+        if len(content) > MAX_CONTENT_LENGTH:
+            return {"success": False, "error": f"content は {MAX_CONTENT_LENGTH} 文字以内にしてください", "error_type": "too_long"}
+        if kind not in KINDS:
+            return {"success": False, "error": f"kind は {', '.join(KINDS)} のいずれかです", "error_type": "invalid_kind"}
+
+        digest = _digest(kind, content)
+        with self._pending_cond:
+            queued = self._pending.get(digest)
+            if queued is not None:
+                return {"success": True, "id": queued[0], "duplicate": True}
+            with self._db_lock:
+                row = self._conn.execute("SELECT id FROM memories WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                return {"success": True, "id": row[0], "duplicate": True}
+            memory_id = self._next_id
+            self._next_id += 1
+            self._pending[digest] = (memory_id, kind, content, time.time())
+            if len(self._pending) in (1, FLUSH_BATCH_SIZE):
+                self._pending_cond.notify()
+        return {"success": True, "id": memory_id, "duplicate": False}
+
+    def forget(self, memory_id: int) -> Dict[str, Any]:
+        """記憶を削除する"""
+        self.flush()
+        with self._db_lock:
+            row = self._conn.execute("SELECT content FROM memories WHERE id = ?", (memory_id,)).fetchone()
+            if row is None:
+                return {"success": False, "error": f"id {memory_id} の記憶はありません", "error_type": "not_found"}
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                cur.execute(
+                    "INSERT INTO memories_fts(memories_fts, rowid, content) VALUES('delete', ?, ?)",
+                    (memory_id, row[0]),
+                )
+                cur.execute("DELETE FROM memories WHERE id = ?", (memory_id,))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            self._count -= 1
+            self._update_doc_counts([row[0]], -1)
+        return {"success": True, "id": memory_id}
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._closed:
+                    self._pending_cond.wait()
+                # 続けて届く書き込みを 1 バッチにまとめる（満杯になったらすぐ書く）
+                self._pending_cond.wait_for(
+                    lambda: self._closed or len(self._pending) >= FLUSH_BATCH_SIZE, timeout=self.flush_interval
+                )
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Memory] flush failed: {e}", file=sys.stderr)
+            if closed:
+                return
+
+    def flush(self) -> int:
+        """書き込み待ちの記憶を 1 トランザクションで反映し、件数を返す"""
+        with self._pending_cond:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(memory_id, kind, content, digest, created_at) for digest, (memory_id, kind, content, created_at) in pending.items()]
+        try:
+            with self._db_lock:
+                cur = self._conn.cursor()
+                cur.execute("BEGIN")
+                try:
+                    cur.executemany("INSERT INTO memories VALUES (?, ?, ?, ?, ?)", rows)
+                    cur.executemany(
+                        "INSERT INTO memories_fts(rowid, content) VALUES (?, ?)",
+                        [(row[0], row[2]) for row in rows],
+                    )
+                    cur.execute("COMMIT")
+                except Exception:
+                    cur.execute("ROLLBACK")
+                    raise
+                self._count += len(rows)
+                self._update_doc_counts((row[2] for row in rows), 1)
+        except Exception:
+            with self._pending_cond:
+                # 失敗した分は次の flush で再試行する
+                self._pending = {**pending, **self._pending}
+            raise
+        return len(rows)
+
+    # --- 検索 -----------------------------------------------------------------
+
+    def _update_doc_counts(self, contents: Iterable[str], delta: int) -> None:
+        if not self._doc_counts:
+            return
+        for content in contents:
+            for gram in content_grams(content) & self._doc_counts.keys():
+                self._doc_counts[gram] += delta
+
+    def _lookup_doc_counts(self, grams: List[str]) -> Dict[str, int]:
+        """3-gram ごとの出現文書数（fts5vocab は数えるのに転置リストを読むのでキャッシュする）"""
+        missing = [g for g in grams if g not in self._doc_counts]
+        if missing:
+            if len(self._doc_counts) + len(missing) > DOC_COUNT_CACHE_SIZE:
+                self._doc_counts.clear()
+            placeholders = ",".join("?" * len(missing))
+            found = dict(
+                self._conn.execute(
+                    f"SELECT term, doc FROM memories_vocab WHERE term IN ({placeholders})", missing
+                ).fetchall()
+            )
+            for gram in missing:
+                self._doc_counts[gram] = found.get(gram, 0)
+        return {g: self._doc_counts[g] for g in grams}
+
+    def _search(
+        self,
+        match: str,
+        limit: int,
+        kind: Optional[str],
+        bounded: bool,
+        exclude: List[int],
+        short: List[str],
+    ) -> List[Tuple[Any, ...]]:
+        where = "memories_fts MATCH ?"
+        args: List[Any] = [match]
+        for term in short:
+            where += " AND m.content LIKE ? ESCAPE '\\'"
+            args.append(_like_pattern(term))
+        if kind:
+            where += " AND m.kind = ?"
+            args.append(kind)
+        if exclude:
+            where += f" AND m.id NOT IN ({','.join('?' * len(exclude))})"
+            args.extend(exclude)
+        select = (
+            "SELECT m.id, m.kind, m.content, m.created_at, bm25(memories_fts) AS score "
+            "FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid "
+        )
+        if bounded:
+            return self._conn.execute(f"{select}WHERE {where} ORDER BY score LIMIT ?", [*args, limit]).fetchall()
+        # bm25 は一致した全件で計算されるので、候補が多いときは新しいものから
+        # RANK_CANDIDATES 件に絞ってから順位付けする（rowid の範囲は FTS5 が絞り込みに使う）
+        cutoff = (
+            "SELECT min(rowid) FROM (SELECT memories_fts.rowid AS rowid "
+            "FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid "
+            f"WHERE {where} ORDER BY memories_fts.rowid DESC LIMIT ?)"
+        )
+        return self._conn.execute(
+            f"{select}WHERE {where} AND memories_fts.rowid >= ({cutoff}) ORDER BY score LIMIT ?",
+            [*args, *args, RANK_CANDIDATES, limit],
+        ).fetchall()
+
+    def _recall_grams(
+        self, grams: List[str], short: List[str], limit: int, kind: Optional[str]
+    ) -> List[Tuple[Any, ...]]:
+        counts = self._lookup_doc_counts(grams)
+        # 一度も現れない 3-gram は一致に寄与しないので除き、珍しいものから使う
+        present = sorted((g for g in grams if counts[g]), key=counts.__getitem__)[:MAX_QUERY_GRAMS]
+        if not present:
+            return []
+        # 1. すべての 3-gram と短い語を含む記憶（一致は最も珍しい 3-gram の出現数以下）
+        rows = self._search(
+            " AND ".join(map(_quote, present)), limit, kind, counts[present[0]] <= RANK_CANDIDATES, [], short
+        )
+        if len(rows) >= limit or len(present) == 1:
+            return rows
+        # 2. 足りなければ、候補数の上限まで珍しい 3-gram を OR でつないで補う
+        chosen: List[str] = []
+        candidates = 0
+        for gram in present:
+            if chosen and candidates + counts[gram] > RANK_CANDIDATES:
+                break
+            chosen.append(gram)
+            candidates += counts[gram]
+        return rows + self._search(
+            " OR ".join(map(_quote, chosen)),
+            limit - len(rows),
+            kind,
+            candidates <= RANK_CANDIDATES,
+            [row[0] for row in rows],
+            [],
+        )
+
+    def recall(self, query: str, limit: int = DEFAULT_LIMIT, kind: Optional[str] = None) -> Dict[str, Any]:
+        """クエリに近い記憶を関連度順に返す"""
+        started = time.perf_counter()
+        query = (query or "").strip()
+        if not query:
+            return {"success": False, "error": "query が空です", "error_type": "empty_query"}
+        if kind is not None and kind not in KINDS:
+            return {"success": False, "error": f"kind は {', '.join(KINDS)} のいずれかです", "error_type": "invalid_kind"}
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+        # 自分の書き込みは直後の検索から見えるようにする
+        self.flush()
+
+        grams, short = query_grams(query)
+        kind_clause = " AND m.kind = ?" if kind else ""
+        kind_args: List[Any] = [kind] if kind else []
+        with self._db_lock:
+            if grams:
+                rows = self._recall_grams(grams, short, limit, kind)
+            else:
+                # 3 文字未満の語はインデックスを使えないので新しい順の部分一致で探す
+                like = " AND ".join("m.content LIKE ? ESCAPE '\\'" for _ in short)
+                patterns = [_like_pattern(term) for term in short]
+                rows = self._conn.execute(
+                    "SELECT m.id, m.kind, m.content, m.created_at, 0.0 AS score FROM memories m "
+                    f"WHERE {like}{kind_clause} ORDER BY m.id DESC LIMIT ?",
+                    [*patterns, *kind_args, limit],
+                ).fetchall()
+
+        results = [
+            {
+                "id": memory_id,
+                "kind": row_kind,
+                "content": content,
+                "created_at": created_at,
+                # bm25 は小さいほど関連が強いので符号を反転して返す
+                "score": round(-score, 4),
+            }
+            for memory_id, row_kind, content, created_at, score in rows
+        ]
+        return {
+            "success": True,
+            "query": query,
+            "results": results,
+            "count": len(results),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_cond:
+            pending = len(self._pending)
+        return {"success": True, "count": self._count, "pending": pending, "db_path": self.db_path}
+
+    def close(self) -> None:
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify()
+        self._writer.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
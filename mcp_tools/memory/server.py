@@ -0,0 +1,184 @@
+"""
+Memory MCP Server (JSON-RPC over stdio with Content-Length framing)
+
+The database path is MAIDEL_MEMORY_DB (default ~/.maidel/memory.sqlite3).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+from typing import Dict, Any
+from ..common import export_span, read_message, write_message
+from .memory import DEFAULT_DB_PATH, DEFAULT_LIMIT, KINDS, MAX_LIMIT, MemoryStore
+
+
+class MemoryMCPServer:
+    def __init__(self, db_path: str = "") -> None:
+        self.store = MemoryStore(db_path or os.getenv("MAIDEL_MEMORY_DB") or DEFAULT_DB_PATH)
+        self.server_info = {
+            "name": "memory",
+            "version": "1.0.0",
+            "description": "事実や過去の結果を保存・検索する MCP サーバー",
+            "author": "Maidel 2.2 Project",
+        }
+
+    def list_tools(self) -> Dict[str, Any]:
+        return {
+            "tools": [
+                {
+                    "name": "remember",
+                    "description": "事実や結果を記憶します（同じ内容は 1 件にまとめます）",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "content": {
+                                "type": "string",
+                                "description": "記憶する内容 (例: 'ユーザーの好きな果物はりんご')",
+                            },
+                            "kind": {
+                                "type": "string",
+                                "enum": list(KINDS),
+                                "description": "種類 (既定: fact)",
+                            },
+                        },
+                        "required": ["content"],
+                    },
+                },
+                {
+                    "name": "recall",
+                    "description": "クエリに関連する記憶を関連度順に返します",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "string", "description": "検索する内容"},
+                            "limit": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": MAX_LIMIT,
+                                "description": f"最大件数 (既定: {DEFAULT_LIMIT})",
+                            },
+                            "kind": {"type": "string", "enum": list(KINDS)},
+                        },
+                        "required": ["query"],
+                    },
+                },
+                {
+                    "name": "forget",
+                    "description": "id を指定して記憶を削除します",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {"id": {"type": "integer"}},
+                        "required": ["id"],
+                    },
+                },
+                {
+                    "name": "memory_stats",
+                    "description": "記憶の件数などを返します",
+                    "inputSchema": {"type": "object", "properties": {}},
+                },
+            ]
+        }
+
+    def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            if name == "remember":
+                result = self.store.remember(arguments.get("content", ""), arguments.get("kind") or "fact")
+            elif name == "recall":
+                result = self.store.recall(
+                    arguments.get("query", ""),
+                    limit=arguments.get("limit") or DEFAULT_LIMIT,
+                    kind=arguments.get("kind"),
+                )
+            elif name == "forget":
+                result = self.store.forget(int(arguments.get("id", 0)))
+            elif name == "memory_stats":
+                result = self.store.stats()
+            else:
+                err = {
+                    "success": False,
+                    "error": f"unknown tool: {name}",
+                    "error_type": "unknown_tool",
+                }
+                return {"content": [{"type": "text", "text": json.dumps(err)}], "isError": True}
+            return {
+                "content": [
+                    {"type": "text", "text": json.dumps(result, ensure_ascii=False)}
+                ],
+                "isError": not result.get("success", False),
+            }
+        except Exception as e:
+            err = {"success": False, "error": f"tool_execution_error: {e}"}
+            return {"content": [{"type": "text", "text": json.dumps(err)}], "isError": True}
+
+    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            started = time.time_ns()
+            method = request.get("method")
+            params = request.get("params", {})
+            req_id = request.get("id")
+            traceparent = (params.get("_meta") or {}).get("traceparent")
+            print(f"[MCP] recv method={method}", file=sys.stderr)
+
+            if method == "initialize":
+                result = {
+                    "protocolVersion": "2024-11-05",
+                    "capabilities": {
+                        "tools": {"listChanged": True},
+                        "resources": {},
+                        "prompts": {},
+                    },
+                    "serverInfo": self.server_info,
+                }
+            elif method == "tools/list":
+                result = self.list_tools()
+            elif method == "tools/call":
+                result = self.call_tool(params.get("name"), params.get("arguments", {}))
+            else:
+                return {
+                    "jsonrpc": "2.0",
+                    "id": req_id,
+                    "error": {"code": -32601, "message": f"Method not found: {method}"},
+                }
+
+            resp = {"jsonrpc": "2.0", "id": req_id, "result": result}
+            export_span(f"mcp server {method}", traceparent, started, {"tool": params.get("name")}, "mcp-memory")
+            return resp
+        except Exception as e:
+            err = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32603, "message": f"Internal error: {e}"},
+            }
+            print(f"[MCP] send error for {request.get('method')}: {e}", file=sys.stderr)
+            return err
+
+    async def run_stdio_server(self) -> None:
+        print("Memory MCP Server starting...", file=sys.stderr)
+        print(f"Server info: {self.server_info} db={self.store.db_path}", file=sys.stderr)
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                req = await loop.run_in_executor(None, read_message)
+                if not req:
+                    break
+                resp = await self.handle_request(req)
+                await loop.run_in_executor(None, write_message, resp)
+        except KeyboardInterrupt:
+            print("Server shutting down...", file=sys.stderr)
+        except Exception as e:
+            print(f"Fatal server error: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            # Pending writes are flushed before exit
+            self.store.close()
+
+
+async def main():
+    server = MemoryMCPServer()
+    await server.run_stdio_server()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
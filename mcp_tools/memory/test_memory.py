@@ -0,0 +1,157 @@
+"""
+Memory MCP Server テストスクリプト
+
+MemoryStore の保存・検索と、MCPサーバーとの通信をテストする
+python -m mcp_tools.memory.test_memory [--size 100000]
+pytest mcp_tools/memory (件数は MAIDEL_MEMORY_TEST_SIZE、既定 10000)
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+from .memory import MemoryStore
+
+
+PYTEST_SIZE = int(os.getenv("MAIDEL_MEMORY_TEST_SIZE", "10000"))
+
+FRUITS = ["りんご", "みかん", "ぶどう", "バナナ", "いちご", "メロン", "もも", "なし"]
+PLACES = ["東京", "大阪", "札幌", "福岡", "名古屋", "京都", "仙台", "那覇"]
+
+
+def synthetic_memory(i: int, rng: random.Random) -> str:
+    fruit, place = rng.choice(FRUITS), rng.choice(PLACES)
+    return f"{place}の{fruit}は1個{rng.randint(50, 500)}円でした（記録{i}）"
+
+
+def check_store(size: int) -> bool:
+    """保存・重複・検索・削除と、size 件での検索時間"""
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MemoryStore(os.path.join(tmp, "memory.sqlite3"))
+        first = store.remember("ユーザーの好きな果物はりんごです")
+        again = store.remember("ユーザーの好きな果物はりんごです")
+        store.remember("2 + 3 = 5", kind="result")
+        if not again.get("duplicate") or again["id"] != first["id"]:
+            print(f"❌ Duplicate not detected: {again}")
+            ok = False
+
+        hits = store.recall("好きな果物", limit=3)["results"]
+        if not hits or hits[0]["id"] != first["id"]:
+            print(f"❌ Recall missed the stored fact: {hits}")
+            ok = False
+        else:
+            print(f"✅ Recall: {hits[0]['content']} (score {hits[0]['score']})")
+        if store.recall("2 + 3", kind="fact")["results"]:
+            print("❌ kind filter returned a result memory")
+            ok = False
+        if not store.recall("果物")["results"]:
+            print("❌ Short query (< 3 chars) found nothing")
+            ok = False
+        store.forget(first["id"])
+        if any(h["id"] == first["id"] for h in store.recall("好きな果物")["results"]):
+            print("❌ Forgotten memory is still returned")
+            ok = False
+
+        rng = random.Random(0)
+        started = time.perf_counter()
+        for i in range(size):
+            store.remember(synthetic_memory(i, rng))
+        store.flush()
+        print(f"✅ Stored {size} memories in {time.perf_counter() - started:.1f}s")
+
+        timings = []
+        for query in ["札幌のメロン", "福岡 いちご 120円", "記録4242", "那覇のバナナは1個"]:
+            store.recall(query)
+            started = time.perf_counter()
+            for _ in range(20):
+                result = store.recall(query, limit=5)
+            timings.append((time.perf_counter() - started) / 20 * 1000)
+            top = result["results"][0]["content"] if result["results"] else None
+            print(f"   {query}: {timings[-1]:.2f} ms -> {top}")
+            # 候補が多い検索でも新しい順ではなく bm25 で順位付けされる
+            contents = [hit["content"] for hit in result["results"]]
+            if query == "記録4242" and size > 4242 and not any(c.endswith("（記録4242）") for c in contents):
+                print(f"❌ Exact match is missing from the top results: {contents}")
+                ok = False
+        store.close()
+        print(f"✅ Recall over {size} memories: mean {sum(timings) / len(timings):.2f} ms")
+    return ok
+
+
+def _rpc(process: subprocess.Popen, request: Dict[str, Any]) -> Dict[str, Any]:
+    data = json.dumps(request, ensure_ascii=False).encode("utf-8")
+    process.stdin.write(f"Content-Length: {len(data)}\r\n\r\n".encode("ascii") + data)
+    process.stdin.flush()
+    length = None
+    while True:
+        line = process.stdout.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    return json.loads(process.stdout.read(length)) if length else {}
+
+
+def _tool_result(response: Dict[str, Any]) -> Dict[str, Any]:
+    return json.loads(response["result"]["content"][0]["text"])
+
+
+def check_server() -> bool:
+    """MCPサーバー経由の remember / recall"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, MAIDEL_MEMORY_DB=os.path.join(tmp, "memory.sqlite3"))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "mcp_tools.memory"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+        )
+        try:
+            init = _rpc(process, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+            tools = _rpc(process, {"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": {}})
+            names = [tool["name"] for tool in tools["result"]["tools"]]
+            print(f"✅ {init['result']['serverInfo']['name']}: {names}")
+            _rpc(process, {
+                "jsonrpc": "2.0", "id": 3, "method": "tools/call",
+                "params": {"name": "remember", "arguments": {"content": "まいでるの誕生日は4月1日"}},
+            })
+            recalled = _tool_result(_rpc(process, {
+                "jsonrpc": "2.0", "id": 4, "method": "tools/call",
+                "params": {"name": "recall", "arguments": {"query": "誕生日はいつ", "limit": 1}},
+            }))
+            if recalled["count"] != 1:
+                print(f"❌ Recall through the server failed: {recalled}")
+                return False
+            print(f"✅ Recall through the server: {recalled['results'][0]['content']}")
+            return True
+        finally:
+            process.stdin.close()
+            process.wait(timeout=10)
+
+
+def test_store() -> None:
+    assert check_store(PYTEST_SIZE)
+
+
+def test_server() -> None:
+    assert check_server()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100000, help="memories stored for the latency check")
+    args = parser.parse_args()
+    print("Starting Memory MCP Server Tests")
+    print("=" * 50)
+    passed = check_store(args.size) & check_server()
+    print("=" * 50)
+    print("✅ All tests passed!" if passed else "⚠️  Some tests had issues. Check the output above.")
+    sys.exit(0 if passed else 1)
@@ -53,6 +53,9 @@ def test_stdio_communication():
                     # JSON解析
                     try:
                         response = json.loads(response_line)
+                        if response.get('type') == 'ready':
+                            print(f"起動完了: {response.get('startup_ms')}")
+                            continue
                         print("=== レスポンス解析 ===")
                         print(f"成功: {response.get('success')}")
                         print(f"タスク種別: {response.get('task_type')}")